@@ -0,0 +1,68 @@
+"""
+Cold start benchmark: launches the backend with uvicorn and reports how long
+it takes until /healthz answers (process listening) and until /readyz turns
+200 (model loaded and warmed up), followed by the server's own phase timings.
+
+Usage: python cold_start_benchmark.py [--port 8011] [--runs 3] [--timeout 120]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def wait_for(url, deadline, want_status=200):
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            if response.status_code == want_status:
+                return response
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def cold_start(port, timeout):
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + timeout
+        if wait_for(f"{base_url}/healthz", deadline) is None:
+            raise RuntimeError("server never answered /healthz")
+        live_s = time.monotonic() - started
+        ready = wait_for(f"{base_url}/readyz", deadline)
+        ready_s = time.monotonic() - started if ready is not None else None
+        phases = ready.json()["phases"] if ready is not None else requests.get(f"{base_url}/readyz").json()["phases"]
+        return live_s, ready_s, phases
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    for run in range(1, args.runs + 1):
+        live_s, ready_s, phases = cold_start(args.port, args.timeout)
+        ready = f"{ready_s:.2f}s" if ready_s is not None else "never"
+        print(f"Run {run}: live after {live_s:.2f}s, ready after {ready}")
+        for name, phase in phases.items():
+            print(f"    {name:<20}{phase.get('status', '?'):<8}{phase.get('ms', '-')}ms")
+
+
+if __name__ == "__main__":
+    main()
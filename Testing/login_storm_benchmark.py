@@ -0,0 +1,98 @@
+"""
+Login storm benchmark: fires concurrent /token requests while probing a
+cheap endpoint, and compares the probe's latency with and without the storm.
+With hashing off the event loop the two should stay close.
+
+Usage: python login_storm_benchmark.py [--base-url URL] [--logins 200] [--concurrency 32]
+"""
+import argparse
+import statistics
+import threading
+import time
+import concurrent.futures
+
+import requests
+
+EMAIL = "storm-bench@example.com"
+PASSWORD = "storm-bench-password"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def probe(base_url, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            requests.get(f"{base_url}/recipe/0", timeout=30)
+        except requests.RequestException:
+            pass
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.02)
+
+
+def login(base_url):
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/token", data={"username": EMAIL, "password": PASSWORD}, timeout=60)
+    return response.status_code, (time.perf_counter() - start) * 1000
+
+
+def measure_probe(base_url, seconds):
+    stop, latencies = threading.Event(), []
+    thread = threading.Thread(target=probe, args=(base_url, stop, latencies))
+    thread.start()
+    time.sleep(seconds)
+    stop.set()
+    thread.join()
+    return latencies
+
+
+def report(label, latencies):
+    print(f"{label:<22} n={len(latencies):<5} p50={percentile(latencies, 0.5):7.1f}ms "
+          f"p95={percentile(latencies, 0.95):7.1f}ms p99={percentile(latencies, 0.99):7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8010")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    # Make sure the benchmark user exists; 400 means it already does
+    requests.post(f"{args.base_url}/register", json={"email": EMAIL, "password": PASSWORD}, timeout=30)
+
+    baseline = measure_probe(args.base_url, args.baseline_seconds)
+
+    stop, storm_probe = threading.Event(), []
+    probe_thread = threading.Thread(target=probe, args=(args.base_url, stop, storm_probe))
+    probe_thread.start()
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda _: login(args.base_url), range(args.logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    probe_thread.join()
+
+    statuses = {}
+    for code, _ in results:
+        statuses[code] = statuses.get(code, 0) + 1
+    login_latencies = [ms for _, ms in results]
+
+    print(f"{args.logins} logins at concurrency {args.concurrency} in {elapsed:.1f}s "
+          f"({args.logins / elapsed:.1f}/s), statuses {statuses}")
+    report("login", login_latencies)
+    report("probe (baseline)", baseline)
+    report("probe (during storm)", storm_probe)
+    if baseline and storm_probe:
+        ratio = statistics.median(storm_probe) / max(statistics.median(baseline), 1e-9)
+        print(f"Probe p50 during storm is {ratio:.2f}x baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Sharded scoring benchmark on synthetic corpora.
+
+Builds random L2-normalised TF-IDF-like matrices (default 100k and 1M
+recipes), then for each shard count measures single-query latency and
+aggregate QPS under concurrent load, next to the in-process baseline.
+
+Usage: python sharded_scoring_benchmark.py [--rows 100000,1000000] [--shards 1,2,4,8]
+                                           [--terms 20000] [--nnz-per-row 12]
+"""
+import argparse
+import os
+import sys
+import time
+import concurrent.futures
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+# Adjust path to include backend
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, '..', 'backend'))
+
+from ranking import INGREDIENT_WEIGHT, TIME_WEIGHT
+from sharded_scorer import ShardedScorer
+
+
+def synthetic_corpus(rows, terms, nnz_per_row, seed=11):
+    rng = np.random.default_rng(seed)
+    # Zipf-ish term popularity, like real ingredient vocabularies
+    popularity = 1.0 / np.arange(1, terms + 1) ** 0.8
+    popularity /= popularity.sum()
+    indices = rng.choice(terms, size=rows * nnz_per_row, p=popularity).astype(np.int32)
+    data = rng.random(rows * nnz_per_row, dtype=np.float32)
+    indptr = np.arange(0, rows * nnz_per_row + 1, nnz_per_row, dtype=np.int64)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(rows, terms))
+    matrix.sum_duplicates()
+    matrix = normalize(matrix, norm="l2")
+    prep = rng.integers(5, 120, rows).astype(np.float32)
+    cook = rng.integers(5, 180, rows).astype(np.float32)
+    return matrix, prep, cook
+
+
+def make_queries(terms, count, seed=5):
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(count):
+        cols = np.unique(rng.integers(0, min(terms, 2000), rng.integers(2, 8)))
+        queries.append(sparse.csr_matrix((np.ones(len(cols), dtype=np.float32), cols, [0, len(cols)]), shape=(1, terms)))
+    return queries
+
+
+def in_process_top_k(matrix, prep, cook, query, top_k=50):
+    cosine = matrix.dot(normalize(query).T).toarray().ravel()
+    max_prep, max_cook = max(prep.max(), 1), max(cook.max(), 1)
+    combined = cosine * INGREDIENT_WEIGHT + (1 - np.abs(prep - 30) / max_prep) * TIME_WEIGHT \
+        + (1 - np.abs(cook - 30) / max_cook) * TIME_WEIGHT
+    top = np.argpartition(combined, -top_k)[-top_k:]
+    return top[np.argsort(combined[top])[::-1]]
+
+
+def measure(score, queries, concurrency):
+    latencies = []
+    for query in queries[:50]:
+        start = time.perf_counter()
+        score(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(score, queries))
+    qps = len(queries) / (time.perf_counter() - start)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), qps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="100000,1000000")
+    parser.add_argument("--shards", default="1,2,4,8")
+    parser.add_argument("--terms", type=int, default=20000)
+    parser.add_argument("--nnz-per-row", type=int, default=12)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    queries = make_queries(args.terms, args.queries)
+    print(f"{os.cpu_count()} CPUs, {args.queries} queries, concurrency {args.concurrency}")
+    for rows in [int(r) for r in args.rows.split(",")]:
+        matrix, prep, cook = synthetic_corpus(rows, args.terms, args.nnz_per_row)
+        print(f"\n=== {rows} rows, {matrix.nnz} non-zeros ===")
+        print(f"{'scorer':<14}{'p50 ms':>10}{'p95 ms':>10}{'QPS':>10}")
+
+        p50, p95, qps = measure(lambda q: in_process_top_k(matrix, prep, cook, q), queries, args.concurrency)
+        print(f"{'in-process':<14}{p50:>10.2f}{p95:>10.2f}{qps:>10.1f}")
+
+        for shards in [int(s) for s in args.shards.split(",")]:
+            scorer = ShardedScorer(matrix, prep, cook, shards=shards)
+            try:
+                scorer.start()
+                p50, p95, qps = measure(lambda q: scorer.top_k(q, 30, 30, 50), queries, args.concurrency)
+                print(f"{f'{shards} shards':<14}{p50:>10.2f}{p95:>10.2f}{qps:>10.1f}")
+            finally:
+                scorer.shutdown()
+
+
+if __name__ == "__main__":
+    main()
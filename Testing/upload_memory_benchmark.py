@@ -0,0 +1,121 @@
+"""
+Upload memory benchmark: measures how much memory preparing one upload
+costs, for the old path (read the whole upload, decode at full size,
+base64 it) and for uploads.prepare_image.
+
+Each case runs in a fresh process. It reports the growth of the process's
+peak RSS (ru_maxrss, which includes Pillow's pixel buffers) and the
+tracemalloc peak (Python-level buffers only: upload bytes, JPEG, base64).
+
+Usage: python upload_memory_benchmark.py [--width 4000] [--height 3000]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+SPOOL_MAX_SIZE = 1024 * 1024  # Starlette's multipart spool threshold
+
+
+def make_images(width, height, directory):
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    # Gradient plus noise for the JPEG, so its size is realistic for a phone photo
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    smooth = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noisy = np.clip(smooth + rng.normal(0, 12, smooth.shape), 0, 255).astype(np.uint8)
+    paths = {"jpeg": os.path.join(directory, "upload.jpeg"), "png": os.path.join(directory, "upload.png")}
+    Image.fromarray(noisy).save(paths["jpeg"], format="JPEG", quality=92)
+    # Noise would push a PNG past MAX_UPLOAD_BYTES; screenshots compress well
+    Image.fromarray(smooth.astype(np.uint8)).save(paths["png"], format="PNG")
+    return paths
+
+
+def peak_rss_kb():
+    # VmHWM is this process's own high-water mark; ru_maxrss would carry over
+    # the parent's peak across fork/exec
+    with open("/proc/self/status") as f:
+        return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1))
+
+
+def spooled_upload(path):
+    from starlette.datastructures import UploadFile
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with open(path, "rb") as f:
+        while chunk := f.read(64 * 1024):
+            spool.write(chunk)
+    spool.seek(0)
+    return UploadFile(file=spool, filename=os.path.basename(path))
+
+
+async def naive(upload):
+    from PIL import Image
+
+    contents = await upload.read()
+    image = Image.open(io.BytesIO(contents)).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode("ascii")
+
+
+async def prepared(upload, prepare_image):
+    image = await prepare_image(upload)
+    return image.data_url
+
+
+def run_case(mode, path):
+    sys.path.insert(0, BACKEND_DIR)
+    # Imported before the baseline so its cost is not part of the measurement
+    from uploads import prepare_image
+
+    upload = spooled_upload(path)
+    rss_before = peak_rss_kb()
+    data_url = asyncio.run(naive(upload) if mode == "naive" else prepared(upload, prepare_image))
+    rss_growth = peak_rss_kb() - rss_before
+
+    # Second pass for tracemalloc, whose own bookkeeping would inflate the RSS figure
+    upload = spooled_upload(path)
+    tracemalloc.start()
+    asyncio.run(naive(upload) if mode == "naive" else prepared(upload, prepare_image))
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{rss_growth} {traced_peak // 1024} {len(data_url) // 1024}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(*args.case)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_images(args.width, args.height, directory)
+        print(f"{args.width}x{args.height} image; peak RSS growth and tracemalloc peak per upload")
+        for name, path in paths.items():
+            for mode in ("naive", "prepared"):
+                out = subprocess.run([sys.executable, __file__, "--case", mode, path],
+                                     capture_output=True, text=True, check=True).stdout.split()
+                rss_kb, traced_kb, payload_kb = (int(v) for v in out[-3:])
+                print(f"  {name:<5}{mode:<10}upload {os.path.getsize(path) // 1024:>6}KB  "
+                      f"peak RSS +{rss_kb // 1024:>4}MB  tracemalloc peak {traced_kb // 1024:>4}MB  "
+                      f"payload {payload_kb}KB")
+
+
+if __name__ == "__main__":
+    main()
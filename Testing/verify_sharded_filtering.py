@@ -0,0 +1,143 @@
+"""
+Checks that the sharded scorer and in-process scoring recommend the same
+recipes when the user has allergies. Both paths must drop recipes with an
+allergen term before picking the top candidates; filtering after ranking in
+one path only leaves it with fewer (or different) results.
+
+Multi-word allergies ("soy sauce") must not be split into words before
+ranking: that would also drop every recipe with "tomato sauce".
+
+Builds a synthetic catalog, so no model file or database is needed.
+
+Usage: python verify_sharded_filtering.py [--recipes 3000] [--shards 2]
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, '..', 'backend'))
+
+PANTRY = ["tomato", "onion", "garlic", "ginger", "paneer", "rice", "potato", "peas", "spinach", "lentil",
+          "chickpea", "cumin", "coriander", "chilli", "coconut", "lemon", "yogurt", "cauliflower", "carrot", "okra",
+          "tomato sauce"]
+ALLERGENS = ["peanut", "cashew", "almond", "milk", "egg", "shrimp", "sesame", "soy sauce", "tree nuts"]
+PHRASE_ALLERGIES = ["soy sauce", "tree nuts"]
+
+CASES = [
+    ("tomato, onion, garlic", ["peanut"]),
+    ("paneer, peas, spinach", ["milk", "cashew"]),
+    ("rice, lentil, cumin", ["egg", "sesame", "almond"]),
+    ("coconut, shrimp, chilli", ["shrimp"]),
+    ("potato, cauliflower, peanut", ["peanut", "cashew", "almond", "milk"]),
+    ("tomato sauce, onion, rice", PHRASE_ALLERGIES),
+    ("tomato sauce, paneer", ["peanut"] + PHRASE_ALLERGIES),
+]
+
+
+def write_model(path, recipes, seed=3):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(recipes):
+        items = list(rng.choice(PANTRY, size=rng.integers(3, 8), replace=False))
+        # About a third of recipes carry an allergen, so filtering changes the candidates
+        if rng.random() < 0.35:
+            items += list(rng.choice(ALLERGENS, size=rng.integers(1, 3), replace=False))
+        rows.append({
+            "Srno": i + 1, "RecipeName": f"Recipe {i + 1}", "TranslatedRecipeName": f"Recipe {i + 1}",
+            "Ingredients": ", ".join(items),
+            # Continuous times keep combined scores free of ties
+            "PrepTimeInMins": float(rng.uniform(5, 60)), "CookTimeInMins": float(rng.uniform(5, 90)),
+            "Servings": 2, "Cuisine": "Indian", "Course": "Main Course", "Diet": "Vegetarian",
+            "Instructions": "Cook.", "URL": "",
+        })
+    df = pd.DataFrame(rows)
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(df["Ingredients"])
+    with open(path, "wb") as f:
+        pickle.dump({"dataframe": df, "tfidf_vectorizer": vectorizer, "tfidf_matrix": matrix}, f)
+
+
+def recommend(main, ingredients, allergies):
+    """The /recommend scoring and filter stages for one user."""
+    ingredients_list = main.clean_ingredients(ingredients)
+    exclude_terms = main.tfidf_index.term_ids(allergies)
+    recs = main.get_recommendations_logic(ingredients_list, 20, 30, top_n=50, exclude_terms=exclude_terms)
+    recs = main.apply_profile_filters(recs, {"allergies": allergies, "dietary_preferences": []})
+    return list(recs["Srno"].head(9)), len(recs)
+
+
+def check_phrase_allergies(main):
+    """Phrases get no pre-filter terms, and recipes sharing only a word with them are still recommended."""
+    terms = main.tfidf_index.term_ids(PHRASE_ALLERGIES)
+    if terms:
+        vocabulary = {i: t for t, i in main.tfidf_index.vectorizer.vocabulary_.items()}
+        print(f"Verification Failure: {PHRASE_ALLERGIES} pre-filter terms {[vocabulary[i] for i in terms]}.")
+        return False
+    recs = main.get_recommendations_logic(main.clean_ingredients("tomato sauce, onion, rice"), 20, 30, top_n=50,
+                                          exclude_terms=terms)
+    recs = main.apply_profile_filters(recs, {"allergies": PHRASE_ALLERGIES, "dietary_preferences": []})
+    ingredients = recs["Ingredients"].head(9).str.lower()
+    if ingredients.str.contains("soy sauce|tree nuts").any():
+        print("Verification Failure: a recipe with a phrase allergen was recommended.")
+        return False
+    if not ingredients.str.contains("tomato sauce").any():
+        print("Verification Failure: no 'tomato sauce' recipe recommended when avoiding 'soy sauce'.")
+        return False
+    print(f"Verification Success: {PHRASE_ALLERGIES} filtered as phrases; 'tomato sauce' recipes still recommended.")
+    return True
+
+
+def main_check(args):
+    import main
+    main.load_model()
+    main.start_sharded_scorer()
+    scorer = main.sharded_scorer
+    if scorer is None:
+        print("Verification Failure: sharded scorer did not start.")
+        return False
+
+    passed = check_phrase_allergies(main)
+    try:
+        for ingredients, allergies in CASES:
+            main.sharded_scorer = None
+            in_process, in_process_kept = recommend(main, ingredients, allergies)
+            main.sharded_scorer = scorer
+            sharded, sharded_kept = recommend(main, ingredients, allergies)
+            label = f"'{ingredients}' avoiding {allergies}"
+            if in_process == sharded and in_process_kept == sharded_kept:
+                print(f"Verification Success: {label}: same {len(sharded)} recipes, {sharded_kept} candidates after filters.")
+            else:
+                passed = False
+                print(f"Verification Failure: {label}: in-process {in_process} ({in_process_kept} kept), "
+                      f"sharded {sharded} ({sharded_kept} kept).")
+    finally:
+        main.sharded_scorer = scorer
+        scorer.shutdown()
+    return passed
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=3000)
+    parser.add_argument("--shards", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, "model.pkl")
+        write_model(model_path, args.recipes)
+        # Read by main and sharded_scorer at import
+        os.environ.update(MODEL_PATH=model_path, RECIPE_STORE="memory", DATA_BACKEND="memory",
+                          SCORER_SHARDS=str(args.shards), TRACE_EXPORTER="none")
+        passed = main_check(args)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    run()
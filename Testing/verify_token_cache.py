@@ -0,0 +1,66 @@
+"""
+Checks that verified tokens are cached no longer than they are valid, in
+timezones on both sides of UTC. A naive datetime.utcnow().timestamp() is
+read as local time, which once cached tokens for hours east of UTC and
+never cached them west of it.
+
+Usage: python verify_token_cache.py
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, '..', 'backend'))
+
+TIMEZONES = ["UTC", "Asia/Kolkata", "America/Los_Angeles", "Pacific/Kiritimati"]
+
+
+def cached_ttl(cache, token):
+    entry = cache._data.get(token)
+    return None if entry is None else entry[1] - time.monotonic()
+
+
+def check_timezone(tz):
+    os.environ["TZ"] = tz
+    time.tzset()
+
+    import auth
+    from user_cache import token_claims_cache, TOKEN_CACHE_TTL_SECONDS
+    token_claims_cache.clear()
+    failures = []
+
+    short = auth.create_access_token({"sub": "short@example.com"}, timedelta(seconds=2))
+    if auth.decode_token_email(short) != "short@example.com":
+        failures.append("short-lived token not accepted")
+    ttl = cached_ttl(token_claims_cache, short)
+    if ttl is None or ttl > 2.1:
+        failures.append(f"short-lived token cached for {ttl}s, expected at most 2s")
+
+    long = auth.create_access_token({"sub": "long@example.com"}, timedelta(hours=10))
+    auth.decode_token_email(long)
+    ttl = cached_ttl(token_claims_cache, long)
+    if ttl is None or not 0 < ttl <= TOKEN_CACHE_TTL_SECONDS + 0.1:
+        failures.append(f"long-lived token cached for {ttl}s, expected up to {TOKEN_CACHE_TTL_SECONDS}s")
+
+    time.sleep(3)
+    if auth.decode_token_email(short) is not None:
+        failures.append("expired token still accepted")
+    return failures
+
+
+def main():
+    failed = False
+    for tz in TIMEZONES:
+        failures = check_timezone(tz)
+        if failures:
+            failed = True
+            print(f"Verification Failure ({tz}): " + "; ".join(failures))
+        else:
+            print(f"Verification Success ({tz}): token cache TTL bounded by exp.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,8 @@ try:
     # Import main module. This triggers module-level code execution including model loading.
     import main
     print("Successfully imported backend.main")
+    # The server loads the detector in its startup task, not at import; run that phase here
+    main.start_local_detector()
     
     # Check yolo_model
     if main.yolo_model is not None:
@@ -34,9 +36,11 @@ try:
                 
         # --- Test analyze_perishability ---
         print("\nTesting analyze_perishability...")
+        import ollama
+        import perishability
         
         # Mock ollama to avoid actual API call and model loading lag/failure in test environment
-        original_ollama_chat = main.ollama.chat
+        original_ollama_chat = ollama.chat
         
         # Create a mock response
         mock_response = {
@@ -44,13 +48,13 @@ try:
                 'content': '```json\n[\n  {"name": "Apple", "days_to_expiry": 7, "priority": "Medium"},\n  {"name": "Milk", "days_to_expiry": 3, "priority": "High"}\n]\n```'
             }
         }
-        main.ollama.chat = MagicMock(return_value=mock_response)
+        ollama.chat = MagicMock(return_value=mock_response)
         
         test_ingredients = ["Apple", "Milk"]
         test_extra = "I also have some old bread"
         
         try:
-            result = main.analyze_perishability(test_ingredients, test_extra)
+            result = perishability.analyze_perishability(test_ingredients, test_extra)
             print("analyze_perishability returned:")
             print(json.dumps(result, indent=2))
             
@@ -63,7 +67,7 @@ try:
             print(f"Error testing analyze_perishability: {e}")
         finally:
             # Restore
-            main.ollama.chat = original_ollama_chat
+            ollama.chat = original_ollama_chat
 
     else:
         print("Verification Failure: main.yolo_model is None")
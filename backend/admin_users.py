@@ -0,0 +1,189 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import re
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ADMIN_MAX_PAGE_SIZE = 200
+# How often the materialized per-user stats are rebuilt
+ADMIN_STATS_REFRESH_SECONDS = float(os.getenv("ADMIN_STATS_REFRESH_SECONDS", "300"))
+# Upper bound on one refresh; a worker that dies mid-refresh holds the lease this long
+ADMIN_STATS_LEASE_SECONDS = float(os.getenv("ADMIN_STATS_LEASE_SECONDS", "600"))
+EXPORT_BATCH_SIZE = 500
+
+STATS_COLLECTION = "admin_user_stats"
+SUMMARY_COLLECTION = "admin_stats_summary"
+LEASE_COLLECTION = "admin_leases"
+REFRESH_LEASE_ID = "user_stats_refresh"
+# Identifies this worker as a lease holder
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Sort value for users without a join date, so keyset comparisons never meet null
+UNKNOWN_JOIN_DATE = datetime(1970, 1, 1)
+
+# API sort key -> stored field. Ties are broken by _id (the lower-cased email), which is unique.
+SORT_FIELDS = {
+    "email": "_id",
+    "interactions": "total_interactions",
+    "likes": "total_likes",
+    "joined": "joined_sort",
+}
+
+STATS_INDEXES = [
+    [("total_interactions", DESCENDING), ("_id", DESCENDING)],
+    [("total_likes", DESCENDING), ("_id", DESCENDING)],
+    [("joined_sort", DESCENDING), ("_id", DESCENDING)],
+    [("refreshed_at", ASCENDING)],
+]
+
+EXPORT_FIELDS = ["id", "email", "is_admin", "joined_at", "total_interactions", "total_likes"]
+
+
+def refresh_pipeline(refreshed_at: datetime) -> list:
+    """Runs on users; joins counters and merges one row per user into STATS_COLLECTION."""
+    return [
+        {"$project": {
+            # Lower-cased so search is a case-insensitive prefix match on the _id index
+            "_id": {"$toLower": "$email"},
+            "email": 1,
+            "user_id": {"$toString": "$_id"},
+            "is_admin": {"$ifNull": ["$is_admin", False]},
+            # ObjectIds carry their creation time; other ids have no join date
+            "joined_at": {"$convert": {"input": "$_id", "to": "date", "onError": None, "onNull": None}},
+        }},
+        {"$lookup": {"from": "interaction_counters", "localField": "email", "foreignField": "_id", "as": "counters"}},
+        {"$set": {
+            "total_interactions": {"$ifNull": [{"$first": "$counters.total"}, 0]},
+            "total_likes": {"$ifNull": [{"$first": "$counters.actions.like"}, 0]},
+            "joined_sort": {"$ifNull": ["$joined_at", UNKNOWN_JOIN_DATE]},
+            "refreshed_at": refreshed_at,
+        }},
+        {"$unset": "counters"},
+        {"$merge": {"into": STATS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+SUMMARY_PIPELINE = [
+    {"$group": {
+        "_id": "users",
+        "total_users": {"$sum": 1},
+        "total_interactions": {"$sum": "$total_interactions"},
+        "total_likes": {"$sum": "$total_likes"},
+    }},
+]
+
+
+def encode_cursor(row: dict, sort_field: str) -> str:
+    value = row.get(sort_field)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([value, row["_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[object, str]:
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if isinstance(value, dict) and "$date" in value:
+        value = datetime.fromisoformat(value["$date"])
+    return value, last_id
+
+
+def page_query(sort: str = "email", order: str = "asc", search: Optional[str] = None,
+               cursor: Optional[str] = None):
+    """(filter, sort spec, sort field) for one keyset page of STATS_COLLECTION."""
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_FIELDS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    field = SORT_FIELDS[sort]
+    direction = ASCENDING if order == "asc" else DESCENDING
+
+    clauses = []
+    if search:
+        # Anchored prefix match so the _id index can serve it
+        clauses.append({"_id": {"$regex": "^" + re.escape(search.strip().lower())}})
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        op = "$gt" if direction == ASCENDING else "$lt"
+        if field == "_id":
+            clauses.append({"_id": {op: last_id}})
+        else:
+            clauses.append({"$or": [{field: {op: value}}, {field: value, "_id": {op: last_id}}]})
+
+    query = {"$and": clauses} if clauses else {}
+    sort_spec = [(field, direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+    return query, sort_spec, field
+
+
+def to_api_row(row: dict) -> dict:
+    joined_at = row.get("joined_at")
+    return {
+        "id": row.get("user_id", "unknown"),
+        "email": row.get("email", row["_id"]),
+        "is_admin": row.get("is_admin", False),
+        "joined_at": joined_at.date().isoformat() if isinstance(joined_at, datetime) else None,
+        "total_interactions": row.get("total_interactions", 0),
+        "total_likes": row.get("total_likes", 0),
+    }
+
+
+async def export_rows(rows, fmt: str):
+    """Encodes an async iterator of stats rows as CSV or NDJSON, one chunk per row."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield buffer.getvalue()
+    async for row in rows:
+        api_row = to_api_row(row)
+        if fmt == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(api_row)
+            yield buffer.getvalue()
+        else:
+            yield json.dumps(api_row) + "\n"
+
+
+def lease_acquire(now: datetime) -> Tuple[dict, dict]:
+    """
+    (filter, update) that take the refresh lease on LEASE_COLLECTION. Upserted,
+    so while another worker holds an unexpired lease the filter misses and the
+    insert fails with a duplicate key.
+    """
+    query = {"_id": REFRESH_LEASE_ID, "expires_at": {"$lt": now}}
+    update = {"$set": {"owner": LEASE_OWNER, "expires_at": now + timedelta(seconds=ADMIN_STATS_LEASE_SECONDS)}}
+    return query, update
+
+
+def lease_release(now: datetime) -> Tuple[dict, dict]:
+    return {"_id": REFRESH_LEASE_ID, "owner": LEASE_OWNER}, {"$set": {"expires_at": now}}
+
+
+def is_fresh(summary: Optional[dict], now: datetime, interval: float = ADMIN_STATS_REFRESH_SECONDS) -> bool:
+    refreshed_at = (summary or {}).get("refreshed_at")
+    return refreshed_at is not None and now - refreshed_at < timedelta(seconds=interval)
+
+
+async def refresh_user_stats_periodically(repository, interval: float = ADMIN_STATS_REFRESH_SECONDS):
+    """Every worker runs this; the first to find the stats stale takes the lease and rebuilds them."""
+    while True:
+        try:
+            await repository.refresh_user_stats()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Admin stats refresh failed: {e}")
+        await asyncio.sleep(interval)
@@ -1,18 +1,19 @@
+import time
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, Dict, Any
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel, Field
-from database import get_users_collection
+from pydantic import BaseModel
+from repository import get_repository
+from user_cache import token_claims_cache, user_profile_cache, remember_user_id, TOKEN_CACHE_TTL_SECONDS
+from password_hashing import pwd_context
 
 # Configuration
 SECRET_KEY = "CHANGE_THIS_TO_A_SUPER_SECRET_KEY_IN_PRODUCTION" # In prod usage env var
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 3000 # Long expiry for convenience
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # User Model for Auth
@@ -23,8 +24,8 @@ class UserInDB(BaseModel):
     hashed_password: str
     is_admin: bool = False
     profile: Dict[str, Any] = {}
-    interactions: List[Dict[str, Any]] = []
 
+# Blocking; endpoints go through password_hashing.password_hasher instead
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -41,33 +42,69 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def decode_token_email(token: str) -> Optional[str]:
+    """Verifies the JWT once; later requests with the same token are a dict lookup."""
+    cached = token_claims_cache.get(token)
+    if cached is not None:
+        email, exp = cached
+        if exp is None or exp > time.time():
+            return email
+        token_claims_cache.pop(token)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
-    users_collection = get_users_collection()
-    if users_collection is None:
-        raise HTTPException(status_code=503, detail="Database unavailable")
-        
-    user_doc = users_collection.find_one({"email": email})
+        return None
+    email = payload.get("sub")
+    if email is None:
+        return None
+    # exp is seconds since the epoch, so compare with time.time(); naive
+    # datetimes would be read in the host's local timezone
+    exp = payload.get("exp")
+    ttl = min(TOKEN_CACHE_TTL_SECONDS, exp - time.time()) if exp is not None else TOKEN_CACHE_TTL_SECONDS
+    if ttl > 0:
+        token_claims_cache.set(token, (email, exp), ttl_seconds=ttl)
+    return email
+
+async def load_user(email: str) -> Optional[UserInDB]:
+    cached = user_profile_cache.get(email)
+    if cached is not None:
+        return cached
+
+    # Projection leaves out everything but the fields UserInDB needs
+    user_doc = await get_repository().find_user_view(email)
     if user_doc is None:
-        raise credentials_exception
+        return None
     
     # Map to Pydantic model
-    return UserInDB(
+    user = UserInDB(
+        id=str(user_doc["_id"]),
         email=user_doc["email"],
         hashed_password=user_doc["hashed_password"],
         is_admin=user_doc.get("is_admin", False),
-        profile=user_doc.get("profile", {}),
-        interactions=user_doc.get("interactions", [])
+        profile=user_doc.get("profile", {})
     )
+
+    user_profile_cache.set(email, user)
+    remember_user_id(user_doc["_id"], email)
+    return user
+
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    """Lean user view, served from cache when possible."""
+    email = decode_token_email(token)
+    if email is None:
+        raise _credentials_exception()
+    user = await load_user(email)
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+def update_cached_profile(user: UserInDB, new_profile: Dict[str, Any]):
+    """Write-through after a profile update on this worker."""
+    user_profile_cache.set(user.email, user.model_copy(update={"profile": new_profile}))
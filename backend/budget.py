@@ -0,0 +1,64 @@
+import os
+import time
+from typing import List, Optional
+
+# Total time a request may take unless the client asks for less (or more, up to the max)
+DEFAULT_REQUEST_BUDGET_MS = int(os.getenv("DEFAULT_REQUEST_BUDGET_MS", "8000"))
+MAX_REQUEST_BUDGET_MS = int(os.getenv("MAX_REQUEST_BUDGET_MS", "30000"))
+# Held back for serialising and sending the response after the last stage
+RESPONSE_RESERVE_MS = int(os.getenv("RESPONSE_RESERVE_MS", "150"))
+BUDGET_HEADER = "X-Request-Budget-Ms"
+# AI recipe generation is skipped when less than this is left
+OLLAMA_MIN_BUDGET_MS = int(os.getenv("OLLAMA_MIN_BUDGET_MS", "3000"))
+
+
+class RequestBudget:
+    """
+    A request's deadline, passed explicitly to each stage. Optional stages
+    check `allows()` before starting and record what they skipped or cut
+    short with `degrade()`.
+    """
+
+    def __init__(self, total_ms: int = DEFAULT_REQUEST_BUDGET_MS):
+        self.total_ms = total_ms
+        self.started = time.monotonic()
+        self.deadline = self.started + total_ms / 1000.0
+        self.degraded: List[str] = []
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> "RequestBudget":
+        try:
+            total_ms = int(value) if value else DEFAULT_REQUEST_BUDGET_MS
+        except ValueError:
+            total_ms = DEFAULT_REQUEST_BUDGET_MS
+        return cls(max(1, min(total_ms, MAX_REQUEST_BUDGET_MS)))
+
+    @property
+    def work_deadline(self) -> float:
+        """Deadline for stages, leaving time to send the response."""
+        return self.deadline - RESPONSE_RESERVE_MS / 1000.0
+
+    def remaining(self) -> float:
+        """Seconds left for stage work (never negative)."""
+        return max(0.0, self.work_deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, needed_ms: float) -> bool:
+        return self.remaining() * 1000 >= needed_ms
+
+    def degrade(self, part: str):
+        if part not in self.degraded:
+            self.degraded.append(part)
+            print(f"Budget: degraded '{part}' with {self.remaining() * 1000:.0f}ms left of {self.total_ms}ms")
+
+    def headers(self) -> dict:
+        elapsed_ms = (time.monotonic() - self.started) * 1000
+        headers = {
+            BUDGET_HEADER: str(self.total_ms),
+            "X-Request-Elapsed-Ms": str(int(elapsed_ms)),
+        }
+        if self.degraded:
+            headers["X-Degraded"] = ",".join(self.degraded)
+        return headers
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Bounds for server-side CookingMode chat state
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "500"))
+MAX_TOTAL_IMAGE_BYTES = int(os.getenv("CHAT_MAX_TOTAL_IMAGE_BYTES", str(256 * 1024 * 1024)))
+MAX_IMAGES_PER_SESSION = int(os.getenv("CHAT_MAX_IMAGES_PER_SESSION", "4"))
+SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", str(2 * 60 * 60)))
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+MAX_STORED_MESSAGES = 50
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 characters per token), good enough for budgeting
+    return max(1, len(text) // 4)
+
+
+class ChatSession:
+    def __init__(self, context: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.context = context
+        self.history: List[Dict[str, str]] = []
+        # image_id -> data URL ("data:image/jpeg;base64,...") ready for the payload
+        self.images: "OrderedDict[str, str]" = OrderedDict()
+        self.last_used = time.monotonic()
+
+    @property
+    def image_bytes(self) -> int:
+        return sum(len(url) for url in self.images.values())
+
+    def add_message(self, role: str, content: str):
+        self.history.append({"role": role, "content": content})
+        if len(self.history) > MAX_STORED_MESSAGES:
+            del self.history[:-MAX_STORED_MESSAGES]
+
+    def trimmed_history(self, token_budget: int = HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+        """Newest messages that fit within the token budget, oldest first."""
+        kept = []
+        used = 0
+        for message in reversed(self.history):
+            cost = estimate_tokens(message["content"])
+            if used + cost > token_budget:
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+        return kept
+
+
+class ChatSessionStore:
+    """
+    In-process session store with LRU eviction bounded by session count,
+    total stored image size and idle TTL.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, max_image_bytes: int = MAX_TOTAL_IMAGE_BYTES,
+                 ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.max_image_bytes = max_image_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._image_bytes = 0
+        self._lock = threading.Lock()
+
+    def create(self, context: Dict[str, Any]) -> ChatSession:
+        session = ChatSession(context)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict_locked()
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.monotonic() - session.last_used > self.ttl_seconds:
+                self._remove_locked(session_id)
+                return None
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._remove_locked(session_id)
+
+    def add_image(self, session: ChatSession, data_url: str) -> str:
+        image_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            session.images[image_id] = data_url
+            self._image_bytes += len(data_url)
+            while len(session.images) > MAX_IMAGES_PER_SESSION:
+                _, dropped = session.images.popitem(last=False)
+                self._image_bytes -= len(dropped)
+            self._evict_locked(keep=session.id)
+        return image_id
+
+    def _remove_locked(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._image_bytes -= session.image_bytes
+        return True
+
+    def _evict_locked(self, keep: Optional[str] = None):
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl_seconds]:
+            self._remove_locked(session_id)
+
+        # Least recently used sessions go first
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._image_bytes > self.max_image_bytes):
+            oldest_id = next(iter(self._sessions))
+            if oldest_id == keep:
+                if len(self._sessions) == 1:
+                    break
+                self._sessions.move_to_end(oldest_id)
+                continue
+            self._remove_locked(oldest_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "image_bytes": self._image_bytes}
+
+
+chat_sessions = ChatSessionStore()
@@ -4,27 +4,44 @@ import os
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = "ai_cooking_db"
 
+# Synchronous client for scripts and background threads.
+# API endpoints go through the async repository (repository.py).
 mongo_client = None
 mongo_db = None
 
-try:
-    mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
-    # Trigger a connection attempt
-    mongo_client.server_info()
-    print("Connected to MongoDB successfully.")
-    mongo_db = mongo_client[DB_NAME]
-except Exception as e:
-    print(f"FAILED to connect to MongoDB: {e}")
-    mongo_client = None
-    mongo_db = None
+def get_mongo_db():
+    global mongo_client, mongo_db
+    if mongo_db is None:
+        try:
+            # Connects lazily on first operation; importing this module never blocks
+            mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+            mongo_db = mongo_client[DB_NAME]
+        except Exception as e:
+            print(f"FAILED to create MongoDB client: {e}")
+            mongo_client = None
+            mongo_db = None
+    return mongo_db
 
-def get_recipe_collection():
-    if mongo_db is not None:
-        return mongo_db["recipes"]
+def _collection(name):
+    db = get_mongo_db()
+    if db is not None:
+        return db[name]
     return None
 
+def get_recipe_collection():
+    return _collection("recipes")
+
 def get_users_collection():
-    if mongo_db is not None:
-        return mongo_db["users"]
-    return None
+    return _collection("users")
+
+def get_translation_cache_collection():
+    return _collection("translation_cache")
+
+def get_interaction_buckets_collection():
+    return _collection("interaction_buckets")
+
+def get_interaction_counters_collection():
+    return _collection("interaction_counters")
 
+def get_migrations_collection():
+    return _collection("migrations")
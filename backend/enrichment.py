@@ -0,0 +1,150 @@
+"""
+Process-wide executor for per-recipe enrichment (YouTube lookups).
+
+Every request shares one bounded pool instead of creating its own, and
+each request keeps at most ENRICHMENT_FANOUT tasks in flight so one large
+result set can't monopolise it. Work not yet finished when the request is
+cancelled (client gone) or its deadline passes is dropped and the caller
+gets the default for those items. Request handlers running in the
+threadpool call raise_if_cancelled() between stages, so work abandoned by a
+504 or a disconnect stops at the next stage instead of running to the end.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import concurrent.futures
+from typing import Any, Callable, List, Optional, Sequence
+
+from tracing import span
+
+ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", "16"))
+ENRICHMENT_FANOUT = int(os.getenv("ENRICHMENT_FANOUT", "4"))
+# How often a request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+class RequestCancelled(Exception):
+    """The request was cancelled (budget exceeded or client gone) while its work was still running."""
+    pass
+
+
+def raise_if_cancelled(cancel_event: Optional[threading.Event]):
+    if cancel_event is not None and cancel_event.is_set():
+        raise RequestCancelled()
+
+
+class EnrichmentExecutor:
+    def __init__(self, workers: int = ENRICHMENT_WORKERS, fanout: int = ENRICHMENT_FANOUT):
+        self.workers = workers
+        self.fanout = fanout
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrichment")
+        self._lock = threading.Lock()
+        # Stats
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _run(self, fn: Callable, submitted_at: float, *args):
+        wait_ms = (time.perf_counter() - submitted_at) * 1000
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        try:
+            with span("enrichment.task", wait_ms=round(wait_ms, 1)):
+                return fn(*args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def submit(self, fn: Callable, *args) -> concurrent.futures.Future:
+        with self._lock:
+            self.queued += 1
+        # Each task runs in a copy of the caller's context, so its spans join the request's trace
+        context = contextvars.copy_context()
+        return self._pool.submit(context.run, self._run, fn, time.perf_counter(), *args)
+
+    def _cancel(self, future: concurrent.futures.Future):
+        # Only queued work can be withdrawn; running tasks finish and are ignored
+        if future.cancel():
+            with self._lock:
+                self.queued -= 1
+                self.cancelled += 1
+
+    def map(self, fn: Callable, items: Sequence, default: Any = None, fanout: Optional[int] = None,
+            deadline: Optional[float] = None, cancel_event: Optional[threading.Event] = None) -> List[Any]:
+        """
+        Blocking, order-preserving map with at most `fanout` tasks in flight.
+        `deadline` is a time.monotonic() value. Items that fail, or are unfinished
+        at the deadline or on cancellation, come back as `default`.
+        """
+        fanout = max(1, fanout or self.fanout)
+        results = [default] * len(items)
+        pending = {}
+        next_item = 0
+
+        while next_item < len(items) or pending:
+            while next_item < len(items) and len(pending) < fanout:
+                pending[self.submit(fn, items[next_item])] = next_item
+                next_item += 1
+
+            timeout = DISCONNECT_POLL_SECONDS
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+            stop = (cancel_event is not None and cancel_event.is_set()) or timeout <= 0
+            if stop:
+                for future in pending:
+                    self._cancel(future)
+                break
+
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"Enrichment task failed: {e}")
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "workers": self.workers,
+                "fanout": self.fanout,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "avg_wait_ms": round(self.total_wait_ms / started, 1) if started else 0,
+                "max_wait_ms": round(self.max_wait_ms, 1),
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def cancel_on_disconnect(request, cancel_event: threading.Event):
+    """Sets cancel_event once the client goes away; run as a task next to the work."""
+    while not cancel_event.is_set():
+        if await request.is_disconnected():
+            print("Client disconnected. Cancelling enrichment.")
+            cancel_event.set()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+enrichment_executor = EnrichmentExecutor()
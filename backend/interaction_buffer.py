@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from repository import get_repository
+
+FLUSH_BATCH_SIZE = int(os.getenv("INTERACTION_FLUSH_BATCH_SIZE", "200"))
+FLUSH_INTERVAL_MS = int(os.getenv("INTERACTION_FLUSH_INTERVAL_MS", "250"))
+MAX_BUFFERED_EVENTS = int(os.getenv("INTERACTION_MAX_BUFFERED", "10000"))
+# How long a request waits for room before it is refused
+ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("INTERACTION_ENQUEUE_TIMEOUT", "1.0"))
+# Optional local spool; when set, events are on disk before they are acknowledged
+SPOOL_PATH = os.getenv("INTERACTION_SPOOL_PATH", "")
+
+
+class BufferFull(Exception):
+    pass
+
+
+class InteractionBuffer:
+    """
+    Write-behind buffer for /interaction. Events are acknowledged once
+    buffered (and spooled, if enabled) and written with bulk_write every
+    FLUSH_BATCH_SIZE events or FLUSH_INTERVAL_MS, whichever comes first.
+    Failed batches are retried as-is; record_interactions skips events an
+    earlier attempt already applied, so retries and replays don't double count.
+    """
+
+    def __init__(self, spool_path: str = SPOOL_PATH, max_size: int = MAX_BUFFERED_EVENTS,
+                 batch_size: int = FLUSH_BATCH_SIZE, interval_ms: int = FLUSH_INTERVAL_MS):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.spool_path = spool_path
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._spool_lock = threading.Lock()
+        self._spool = None
+        self._seq = 0
+        self._stopping = False
+        self._worker = None
+        self._loop = None
+        # Stats
+        self._started = time.monotonic()
+        self.enqueued = 0
+        self.flushed = 0
+        self.rejected = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    # --- Spool ---
+
+    def _open_spool(self):
+        if not self.spool_path:
+            return
+        pending = self._replay_spool()
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+        if pending:
+            print(f"Replaying {len(pending)} spooled interactions.")
+            with self._cond:
+                self._events.extend(pending)
+
+    def _replay_spool(self):
+        if not os.path.exists(self.spool_path):
+            return []
+        entries, flushed_upto = [], 0
+        with open(self.spool_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn last line from a crash mid-write
+                if "flushed" in record:
+                    flushed_upto = max(flushed_upto, record["flushed"])
+                    continue
+                entries.append(record)
+        pending = []
+        for record in entries:
+            self._seq = max(self._seq, record["seq"])
+            if record["seq"] > flushed_upto:
+                event = dict(record["event"], ts=datetime.fromisoformat(record["event"]["ts"]))
+                # Spooled before events carried ids
+                event.setdefault("event_id", uuid.uuid4().hex)
+                pending.append((record["seq"], record["email"], event))
+        return pending
+
+    def _spool_write(self, line: dict):
+        with self._spool_lock:
+            self._spool.write(json.dumps(line) + "\n")
+            self._spool.flush()
+            os.fsync(self._spool.fileno())
+
+    def _spool_truncate(self):
+        with self._spool_lock:
+            self._spool.seek(0)
+            self._spool.truncate()
+
+    # --- Producer side ---
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """`loop` runs the async repository writes issued by the flusher thread."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._loop = loop
+        self._stopping = False
+        self._open_spool()
+        self._worker = threading.Thread(target=self._run, name="interaction-flusher", daemon=True)
+        self._worker.start()
+
+    def add(self, email: str, event: dict, timeout: float = ENQUEUE_TIMEOUT_SECONDS):
+        """Blocks while the buffer is full; raises BufferFull after `timeout`."""
+        if self._worker is None:
+            raise BufferFull("Interaction buffer not started")
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            while len(self._events) >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise BufferFull()
+                self._cond.wait(remaining)
+            self._seq += 1
+            seq = self._seq
+            if self._spool is not None:
+                self._spool_write({"seq": seq, "email": email, "event": dict(event, ts=event["ts"].isoformat())})
+            self._events.append((seq, email, event))
+            self.enqueued += 1
+            if len(self._events) >= self.batch_size:
+                self._cond.notify_all()
+
+    # --- Flusher ---
+
+    def _take_batch(self):
+        with self._cond:
+            if not self._events:
+                self._cond.wait(self.interval)
+            # Give a partial batch until the interval to fill up
+            deadline = time.monotonic() + self.interval
+            while len(self._events) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            self._cond.notify_all()  # Wake producers waiting for room
+            return batch
+
+    def _flush_batch(self, batch):
+        start = time.perf_counter()
+        while True:
+            try:
+                pairs = [(email, event) for _, email, event in batch]
+                asyncio.run_coroutine_threadsafe(get_repository().record_interactions(pairs), self._loop).result()
+                break
+            except Exception as e:
+                # Keep the batch; events stay spooled and the buffer applies backpressure
+                if self._stopping:
+                    print(f"Interaction flush failed ({len(batch)} events) during shutdown: {e}")
+                    with self._cond:
+                        # Back in the buffer so shutdown reports them
+                        self._events.extendleft(reversed(batch))
+                    return False
+                print(f"Interaction flush failed ({len(batch)} events): {e}. Retrying in 1s.")
+                time.sleep(1)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.flushed += len(batch)
+        self.flush_count += 1
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        if self._spool is not None:
+            self._spool_write({"flushed": batch[-1][0]})
+            with self._cond:
+                if not self._events:
+                    self._spool_truncate()
+        return True
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                if not self._flush_batch(batch):
+                    return
+            elif self._stopping:
+                return
+
+    def shutdown(self, timeout: float = 10.0):
+        """Drains the buffer; anything left stays in the spool for the next start."""
+        if self._worker is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        left = len(self._events)
+        if left and not self.spool_path:
+            print(f"Interaction buffer stopped. {left} events DROPPED: flush failed and INTERACTION_SPOOL_PATH is not set.")
+        elif left:
+            print(f"Interaction buffer stopped. {left} events left in {self.spool_path} for the next start.")
+        else:
+            print("Interaction buffer stopped. All events flushed.")
+
+    def stats(self) -> dict:
+        uptime = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "buffered": len(self._events),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "rejected": self.rejected,
+            "events_per_sec": round(self.enqueued / uptime, 2),
+            "flushes": self.flush_count,
+            "avg_batch_size": round(self.flushed / self.flush_count, 1) if self.flush_count else 0,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "avg_flush_ms": round(self.total_flush_ms / self.flush_count, 1) if self.flush_count else 0,
+            "spool": bool(self.spool_path),
+        }
+
+
+interaction_buffer = InteractionBuffer()
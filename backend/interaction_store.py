@@ -0,0 +1,121 @@
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from database import get_interaction_buckets_collection
+
+# Events per bucket document; buckets are also split per user per month
+BUCKET_SIZE = int(os.getenv("INTERACTION_BUCKET_SIZE", "200"))
+HISTORY_PAGE_SIZE = 20
+# Recent event ids kept on each counters document, so a retried flush can't count an event twice
+COUNTER_DEDUP_WINDOW = int(os.getenv("INTERACTION_DEDUP_WINDOW", "1000"))
+
+BUCKET_INDEXES = [
+    # Filling the open bucket: equality on user + period, range on count
+    [("user_email", ASCENDING), ("period", ASCENDING), ("count", ASCENDING)],
+    # Paging history newest-first
+    [("user_email", ASCENDING), ("last_ts", DESCENDING)],
+    # Finding events a retried flush already wrote
+    [("events.event_id", ASCENDING)],
+]
+
+
+def ensure_indexes():
+    """Sync index creation for scripts; the API creates them through the repository."""
+    buckets = get_interaction_buckets_collection()
+    if buckets is None:
+        return
+    for keys in BUCKET_INDEXES:
+        buckets.create_index(keys)
+
+
+def make_event(action: str, recipe_name: str, details: Optional[Dict[str, Any]] = None, ts: Optional[datetime] = None) -> dict:
+    ts = ts or datetime.now()
+    return {
+        # Stable across flush retries and spool replays; writes are deduplicated on it
+        "event_id": uuid.uuid4().hex,
+        "ts": ts,
+        "timestamp": str(ts),
+        "action": action,
+        "recipe_name": recipe_name,
+        "details": details or {}
+    }
+
+
+def interaction_ops(email: str, event: dict):
+    """
+    Bulk-writable (bucket op, counter op) for one event. The counter op only
+    matches while the event id is not among the document's recent ids, so a
+    repeat upserts a duplicate _id instead of counting twice; callers treat
+    that DuplicateKeyError as already applied. The bucket op is not guarded:
+    callers leave out events that are already in a bucket.
+    """
+    ts = event["ts"]
+    bucket_op = UpdateOne(
+        {"user_email": email, "period": ts.strftime("%Y-%m"), "count": {"$lt": BUCKET_SIZE}},
+        {
+            "$push": {"events": event},
+            "$inc": {"count": 1},
+            "$min": {"first_ts": ts},
+            "$max": {"last_ts": ts},
+        },
+        upsert=True
+    )
+
+    counter_update = {
+        "$inc": {"total": 1, f"actions.{event['action']}": 1},
+        "$push": {"event_ids": {"$each": [event["event_id"]], "$slice": -COUNTER_DEDUP_WINDOW}},
+    }
+    if event["action"] == "like":
+        counter_update["$addToSet"] = {"liked_recipes": event["recipe_name"]}
+    elif event["action"] == "unlike":
+        counter_update["$pull"] = {"liked_recipes": event["recipe_name"]}
+    counter_op = UpdateOne({"_id": email, "event_ids": {"$ne": event["event_id"]}}, counter_update, upsert=True)
+    return bucket_op, counter_op
+
+
+def counters_view(doc: Optional[dict]) -> dict:
+    doc = doc or {}
+    return {
+        "total_interactions": doc.get("total", 0),
+        "actions": doc.get("actions", {}),
+        "liked_recipes": doc.get("liked_recipes", []),
+    }
+
+
+def history_pipeline(email: str, limit: int = HISTORY_PAGE_SIZE, before: Optional[datetime] = None) -> list:
+    """Aggregation for a newest-first page of events (limit + 1 to detect a next page)."""
+    match = {"user_email": email}
+    if before is not None:
+        match["first_ts"] = {"$lt": before}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"last_ts": -1}},
+        # Every matched bucket holds at least one qualifying event
+        {"$limit": limit + 1},
+        {"$unwind": "$events"},
+        {"$replaceRoot": {"newRoot": "$events"}},
+    ]
+    if before is not None:
+        pipeline.append({"$match": {"ts": {"$lt": before}}})
+    pipeline += [{"$sort": {"ts": -1}}, {"$limit": limit + 1}, {"$project": {"_id": 0}}]
+    return pipeline
+
+
+def history_page(events: List[dict], limit: int):
+    """
+    Turns newest-first pipeline output into (events oldest-first, next cursor);
+    pass the cursor back as `before` to fetch the previous page.
+    """
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = events[-1]["ts"].isoformat()
+    events = list(reversed(events))
+    for event in events:
+        event.pop("ts", None)
+        event.pop("event_id", None)
+    return events, next_cursor
@@ -0,0 +1,177 @@
+import asyncio
+import io
+import os
+import shutil
+import sys
+import time
+import concurrent.futures
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Prebuilt detector, exported to ONNX at build time with `python local_detector.py`.
+# Startup never downloads or exports weights; without this file the local tier is skipped.
+LOCAL_DETECTOR_PATH = os.getenv("LOCAL_DETECTOR_PATH", os.getenv("YOLO_MODEL_PATH", "yolov8n.onnx"))
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+# Detections below this confidence are ignored entirely
+YOLO_MIN_CONFIDENCE = float(os.getenv("YOLO_MIN_CONFIDENCE", "0.35"))
+# Local results are trusted only above these; otherwise the remote VLM is called
+YOLO_ACCEPT_CONFIDENCE = float(os.getenv("YOLO_ACCEPT_CONFIDENCE", "0.6"))
+YOLO_MIN_FOOD_COVERAGE = float(os.getenv("YOLO_MIN_FOOD_COVERAGE", "0.6"))
+
+# COCO food classes, with the display names the VLM prompt asks for. Stock
+# weights know only these, so most pantry photos (raw vegetables, dairy,
+# staples) still escalate to the VLM; food-trained weights widen the fast path.
+FOOD_CLASSES = {
+    "banana": "Banana (Kela)",
+    "apple": "Apple (Seb)",
+    "orange": "Orange (Santra)",
+    "broccoli": "Broccoli",
+    "carrot": "Carrot (Gajar)",
+    "sandwich": "Sandwich",
+    "hot dog": "Hot Dog",
+    "pizza": "Pizza",
+    "donut": "Donut",
+    "cake": "Cake",
+}
+# Custom food-trained weights can declare their own classes
+if os.getenv("YOLO_FOOD_CLASSES"):
+    FOOD_CLASSES = {c.strip(): c.strip().title() for c in os.getenv("YOLO_FOOD_CLASSES").split(",") if c.strip()}
+
+yolo_model = None
+# The model is not thread-safe; all inference goes through this single worker
+_inference_worker = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-inference")
+
+
+def load_local_detector():
+    global yolo_model
+    if not os.path.exists(LOCAL_DETECTOR_PATH):
+        print(f"No local detector at {LOCAL_DETECTOR_PATH}. Run `python local_detector.py` at build time. "
+              f"Local detection disabled.")
+        return None
+    # Keep ultralytics from pip-installing runtimes or reaching the network while the server starts
+    os.environ.setdefault("YOLO_AUTOINSTALL", "false")
+    os.environ.setdefault("YOLO_OFFLINE", "true")
+    try:
+        from ultralytics import YOLO
+    except ImportError:
+        print("ultralytics not installed. Local detection disabled.")
+        return None
+
+    try:
+        model = YOLO(LOCAL_DETECTOR_PATH, task="detect")
+        # Warm up so the first real request doesn't pay for graph initialisation
+        model.predict(Image.new("RGB", (YOLO_IMGSZ, YOLO_IMGSZ)), imgsz=YOLO_IMGSZ, device="cpu", verbose=False)
+        yolo_model = model
+        print(f"Local YOLO detector loaded ({LOCAL_DETECTOR_PATH}).")
+    except Exception as e:
+        print(f"Error loading YOLO model: {e}")
+        yolo_model = None
+    return yolo_model
+
+
+def _to_bbox(xyxyn) -> List[int]:
+    # Ultralytics gives normalized [x1, y1, x2, y2]; the API uses [ymin, xmin, ymax, xmax] on a 0-1000 scale
+    x1, y1, x2, y2 = [float(v) for v in xyxyn]
+    return [int(y1 * 1000), int(x1 * 1000), int(y2 * 1000), int(x2 * 1000)]
+
+
+def _run_inference(images: List[Image.Image]) -> List[List[Dict]]:
+    results = yolo_model.predict(images, imgsz=YOLO_IMGSZ, device="cpu", conf=YOLO_MIN_CONFIDENCE, verbose=False)
+    batches = []
+    for result in results:
+        detections = []
+        for box in result.boxes:
+            class_name = yolo_model.names[int(box.cls[0])]
+            detections.append({
+                "class_name": class_name,
+                "confidence": float(box.conf[0]),
+                "bbox": _to_bbox(box.xyxyn[0]),
+                "is_food": class_name in FOOD_CLASSES,
+            })
+        batches.append(detections)
+    return batches
+
+
+def _decode(image_bytes: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+
+async def detect_images_async(image_bytes_list: List[bytes]) -> List[List[Dict]]:
+    loop = asyncio.get_running_loop()
+    # Decode in parallel on the default pool; only inference is serialised
+    images = await asyncio.gather(*[
+        loop.run_in_executor(None, _decode, image_bytes) for image_bytes in image_bytes_list
+    ])
+    return await loop.run_in_executor(_inference_worker, _run_inference, list(images))
+
+
+def accept_local_result(detections: List[Dict]) -> bool:
+    """True when the local detections are confident and mostly food."""
+    if not detections:
+        return False
+    food = [d for d in detections if d["is_food"]]
+    if not food:
+        return False
+    coverage = len(food) / len(detections)
+    mean_confidence = sum(d["confidence"] for d in food) / len(food)
+    return coverage >= YOLO_MIN_FOOD_COVERAGE and mean_confidence >= YOLO_ACCEPT_CONFIDENCE
+
+
+def to_ingredients(detections: List[Dict]) -> Tuple[List[str], Dict[str, List[int]]]:
+    """Same shape as parse_ingredients_with_bboxes: (names, lower-name -> bbox)."""
+    ingredients = []
+    bbox_map = {}
+    # Highest confidence box wins when a class appears several times
+    for d in sorted(detections, key=lambda d: d["confidence"], reverse=True):
+        if not d["is_food"]:
+            continue
+        name = FOOD_CLASSES[d["class_name"]]
+        if name.lower() in bbox_map:
+            continue
+        ingredients.append(name)
+        bbox_map[name.lower()] = d["bbox"]
+    return ingredients, bbox_map
+
+
+async def detect_local(image_bytes: bytes) -> Optional[Tuple[List[str], Dict[str, List[int]]]]:
+    """Returns local ingredients when they clear the thresholds, else None."""
+    if yolo_model is None:
+        return None
+    start = time.perf_counter()
+    try:
+        detections = (await detect_images_async([image_bytes]))[0]
+    except Exception as e:
+        print(f"Local detection failed: {e}")
+        return None
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    accepted = accept_local_result(detections)
+    print(f"Local YOLO: {len(detections)} objects in {elapsed_ms:.0f}ms ({'accepted' if accepted else 'escalating to VLM'})")
+    return to_ingredients(detections) if accepted else None
+
+
+async def detect_local_batch(image_bytes_list: List[bytes]) -> List[Optional[Tuple[List[str], Dict[str, List[int]]]]]:
+    """Runs every image in one inference batch; None marks images that need the VLM."""
+    if yolo_model is None or not image_bytes_list:
+        return [None] * len(image_bytes_list)
+    start = time.perf_counter()
+    try:
+        batches = await detect_images_async(image_bytes_list)
+    except Exception as e:
+        print(f"Local batch detection failed: {e}")
+        return [None] * len(image_bytes_list)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    results = [to_ingredients(d) if accept_local_result(d) else None for d in batches]
+    accepted = sum(1 for r in results if r is not None)
+    print(f"Local YOLO batch: {len(image_bytes_list)} images in {elapsed_ms:.0f}ms, {accepted} accepted")
+    return results
+
+
+if __name__ == "__main__":
+    # Build step: fetch the stock (or given) weights and export them to ONNX at LOCAL_DETECTOR_PATH
+    from ultralytics import YOLO
+    weights = sys.argv[1] if len(sys.argv) > 1 else "yolov8n.pt"
+    exported = YOLO(weights).export(format="onnx", imgsz=YOLO_IMGSZ)
+    if os.path.abspath(exported) != os.path.abspath(LOCAL_DETECTOR_PATH):
+        shutil.move(exported, LOCAL_DETECTOR_PATH)
+    print(f"Local detector written to {LOCAL_DETECTOR_PATH}. Ship it with the backend.")
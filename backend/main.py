@@ -1,31 +1,27 @@
-import requests
 import time
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Depends, status
+# Startup is reported per phase, starting with this module's imports
+IMPORT_STARTED = time.perf_counter()
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Depends, status, WebSocket, WebSocketDisconnect, Request
 from pydantic import BaseModel
-from deep_translator import GoogleTranslator
 import pickle
-import pandas as pd
 from typing import List, Optional, Dict, Any
 import os
 from dotenv import load_dotenv
-import nltk
-from nltk.corpus import stopwords
 import string
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
 import numpy as np
-from youtube_search import YoutubeSearch
-import concurrent.futures
+import threading
 import json
 import base64
-import socket
 import random
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import timedelta, datetime
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.concurrency import run_in_threadpool
-from PIL import Image, ExifTags
-import io
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import iterate_in_threadpool
+import asyncio
+from contextlib import asynccontextmanager
 
 
 from pathlib import Path
@@ -35,11 +31,44 @@ env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 # Database & Auth
-from database import get_users_collection, get_recipe_collection
-from auth import get_current_user, create_access_token, get_password_hash, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES, UserInDB
+from database import get_recipe_collection
+from repository import get_repository, DatabaseUnavailable
+from interaction_store import make_event
+from admin_users import ADMIN_PAGE_SIZE, ADMIN_MAX_PAGE_SIZE, export_rows, to_api_row, refresh_user_stats_periodically
+from interaction_buffer import interaction_buffer, BufferFull
+from auth import get_current_user, update_cached_profile, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, UserInDB
+from password_hashing import password_hasher, HashingBusy
+from user_cache import invalidate_user, watch_user_changes, token_claims_cache, user_profile_cache
+from openrouter import call_openrouter_with_fallback, stream_openrouter_with_fallback, sse_event
+from chat_sessions import chat_sessions
+from retry import execute_with_retry
+from enrichment import enrichment_executor, cancel_on_disconnect, raise_if_cancelled, RequestCancelled
+from single_flight import get_flight, flight_key, timeout_until, single_flight_stats, FlightTimeout
+from budget import RequestBudget, BUDGET_HEADER, OLLAMA_MIN_BUDGET_MS
+from stage_timing import StageTimings
+from metrics import registry, track_dependency, RECOMMEND_STAGE_SECONDS, DETECT_STAGE_SECONDS, HTTP_REQUEST_SECONDS
+from tracing import start_trace, end_trace, detach, traced_body, exporter as trace_exporter
+from uploads import prepare_image, PreparedImage, MAX_UPLOAD_BYTES, MAX_BATCH_IMAGES
+from translation import translate_text, translate_texts
+from recipe_translations import load_recipe_translations, localize_recipe
+from local_detector import load_local_detector, detect_local, detect_local_batch
+from perishability import analyze_perishability_batched
+from startup import startup_report
+import tokenizer
+from ranking import clean_ingredient_text, clean_ingredients, query_text, combined_similarity
+
+# Heavy libraries (pandas, scikit-learn, NLTK, Ollama, YouTube search) are imported by the
+# subsystems that use them, once they load in warm_start, not here.
+startup_report.record_imports(IMPORT_STARTED)
 
 # Initialize FastAPI
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_data_layer()
+    yield
+    await stop_data_layer()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -48,13 +77,67 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Budget/degradation flags on /recommend responses, and the trace id for bug reports
+    expose_headers=["X-Degraded", "X-Request-Budget-Ms", "X-Request-Elapsed-Ms", "X-Trace-Id"],
 )
 
+# Reject oversized uploads from Content-Length before the body is parsed.
+# Per-file limits are still enforced while streaming in uploads.prepare_image.
+UPLOAD_PATHS = {"/detect-ingredients", "/verify-step", "/verify-step/stream", "/chat", "/chat/stream"}
+MULTI_UPLOAD_PATHS = {"/detect-ingredients/batch"}
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    path = request.url.path
+    if request.method == "POST" and (path in UPLOAD_PATHS or path in MULTI_UPLOAD_PATHS or path.startswith("/chat/sessions/")):
+        files_allowed = MAX_BATCH_IMAGES if path in MULTI_UPLOAD_PATHS else 1
+        # Headroom for the other multipart fields
+        limit = MAX_UPLOAD_BYTES * files_allowed + 64 * 1024
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            return JSONResponse(status_code=413, content={"detail": "Upload too large"})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route templates keep label cardinality bounded (/recipe/{recipe_id}, not every id)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start, route.path if route else "unmatched", request.method, str(response.status_code)
+    )
+    return response
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Root span for everything the request does; see tracing.py for propagation and sampling
+    root, token = start_trace(f"{request.method} {request.url.path}", request.headers.get("traceparent"),
+                              method=request.method)
+    if root is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        root.error(e)
+        end_trace(root, token)
+        raise
+    route = request.scope.get("route")
+    if route is not None:
+        root.name = f"{request.method} {route.path}"
+    root.set("status_code", response.status_code)
+    response.headers["X-Trace-Id"] = root.trace.trace_id
+    # The body is sent after this returns; the root ends with its last chunk, so streams are traced whole
+    detach(token)
+    response.body_iterator = traced_body(response.body_iterator, root)
+    return response
+
 # --- Models ---
 class RecipeRequest(BaseModel):
     ingredients: str
     prep_time: int
     cook_time: int
+    lang: Optional[str] = None # Serve stored translations (hi/es/fr) when available
 
 class UserCreate(BaseModel):
     email: str
@@ -92,6 +175,8 @@ class Recipe(BaseModel):
     course: Optional[str] = None
     diet: Optional[str] = None
     servings: Optional[int] = None
+    # Optional parts left out because the request ran out of time, e.g. "youtube_link"
+    degraded: List[str] = []
 
 class ForgotPasswordRequest(BaseModel):
     email: str
@@ -104,158 +189,68 @@ class TranslationRequest(BaseModel):
     text: str
     target_lang: str
 
+class TranslationBatchRequest(BaseModel):
+    texts: List[str]
+    target_lang: str
+
+class ChatSessionCreate(BaseModel):
+    recipe_name: str = "Unknown Recipe"
+    step_label: str = "General"
+    instruction: str = ""
+
 # --- Globals & Setup ---
-model_data = None
-tfidf_vectorizer = None
-tfidf_matrix = None
-df_english = None
-
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
-
-# Ordered by preference
-VISION_MODELS = [
-    "allenai/molmo-2-8b:free",
-    "google/gemini-2.0-flash-exp:free",
-    "google/gemma-3-27b-it:free",
-    "nvidia/nemotron-nano-12b-v2-vl:free",
-    "qwen/qwen-2.5-vl-7b-instruct:free",
-    "meta-llama/llama-3.2-11b-vision-instruct:free"
-]
-
-MODEL_PATH = r"recipe_recommender_model.pkl"
-
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+# Vectorizer + matrix; compact models score with a plain sparse dot product (tfidf_index.py)
+tfidf_index = None
+# Set at startup when SCORER_SHARDS > 0 (sharded_scorer.py)
+sharded_scorer = None
+# Local YOLO tier, set at startup when a prebuilt detector exists (local_detector.py)
+yolo_model = None
+# Scoring columns resident; display fields come from Mongo or the DataFrame (recipe_store.py)
+recipe_store = None
+
+# Point at the output of optimize_model.py to serve the compact artifact
+MODEL_PATH = os.getenv("MODEL_PATH", r"recipe_recommender_model.pkl")
+
+# Representative pantries run once at startup to fill caches before traffic arrives
+WARMUP_QUERIES = [q for q in os.getenv(
+    "WARMUP_QUERIES", "onion, tomato, garlic;paneer, peas, cream;rice, dal, turmeric;chicken, ginger, yogurt"
+).split(";") if q.strip()]
 
 def load_model():
-    global model_data, tfidf_vectorizer, tfidf_matrix, df_english
+    global tfidf_index, recipe_store
+    # pandas and scikit-learn come in with the pickle; import them here rather than at startup
+    from recipe_store import build_recipe_store
+    from tfidf_index import TfidfIndex
+    if not os.path.exists(MODEL_PATH):
+        print(f"Model file not found at {MODEL_PATH}")
+        raise FileNotFoundError(MODEL_PATH)
     try:
-        if os.path.exists(MODEL_PATH):
-            with open(MODEL_PATH, 'rb') as f:
-                model_data = pickle.load(f)
-            
-            # Unpack the model data
-            tfidf_vectorizer = model_data['tfidf_vectorizer']
-            tfidf_matrix = model_data['tfidf_matrix']
-            
-            # Load from MongoDB
-            # Load from MongoDB - DISABLED per user request to use Pickle file
-            # mongo_recipes = get_recipe_collection()
-            # if mongo_recipes is not None:
-            #     print("Loading recipes from MongoDB...")
-            #     # Sort by Srno to match TF-IDF matrix alignment!
-            #     cursor = mongo_recipes.find().sort("Srno", 1)
-            #     recipes_list = list(cursor)
-            #     if recipes_list:
-            #         df_english = pd.DataFrame(recipes_list)
-            #         print(f"Loaded {len(df_english)} recipes from MongoDB.")
-            #     else:
-            #          print("MongoDB collection text empty. Fallback to pickle dataframe.")
-            #          df_english = model_data['dataframe']
-            # else:
-            #      print("MongoDB not connected. Fallback to pickle dataframe.")
-            df_english = model_data['dataframe']
-            
-            print("Model loaded successfully.")
-        else:
-            print(f"Model file not found at {MODEL_PATH}")
+        with open(MODEL_PATH, 'rb') as f:
+            model_data = pickle.load(f)
+        
+        # Unpack the model data
+        tfidf_index = TfidfIndex(model_data['tfidf_vectorizer'], model_data['tfidf_matrix'], model_data.get('tfidf_format'))
+        print(f"TF-IDF index: {tfidf_index.stats()}")
+        # Rows stay aligned with the TF-IDF matrix; the full DataFrame is dropped when Mongo serves display fields
+        recipe_store = build_recipe_store(model_data)
+        
+        print("Model loaded successfully.")
     except Exception as e:
         print(f"Error loading model: {e}")
-
-load_model()
-
-try:
-    import ollama
-    print("Ollama module loaded. Using 'llama3' for text analysis.")
-except ImportError:
-    print("Error: Ollama module not found. Please install with `pip install ollama`.")
-
-    print("Error: Ollama module not found. Please install with `pip install ollama`.")
+        raise
+
+def warm_up():
+    """Runs WARMUP_QUERIES end to end (minus YouTube) so first requests skip cold caches."""
+    if tfidf_index is None or recipe_store is None:
+        raise RuntimeError("Model not loaded")
+    for query in WARMUP_QUERIES:
+        ingredients = [i.strip() for i in query.split(",") if i.strip()]
+        recommendations = get_recommendations_logic(ingredients, 30, 30)
+        for _, row in recommendations.iterrows():
+            process_recipe_row(row, ingredients, youtube_link="")
+    return len(WARMUP_QUERIES)
 
 # --- Helper Functions ---
-COOKING_STOPWORDS = {
-    "teaspoon", "tsp", "tablespoon", "tbsp", "cup", "gram", "gms", "g", "kg", "ml", "liter", "litre", "l", "lb", "oz", "pinch", "bunch", "sprig", "cloves",
-    "chopped", "sliced", "diced", "minced", "grated", "crushed", "beaten", "whisked", "sifted", "melted", "slit", "halved", "quartered", "cubed",
-    "peeled", "cored", "seeded", "washed", "cleaned", "dried", "roasted", "toasted", "fried", "boiled", "warm", "cold", "hot", "lukewarm",
-    "taste", "size", "small", "medium", "large", "fresh", "whole", "powder", "seeds", "oil", "leaves", "wedges", "fillet", "fillets", "boneless", "skinless",
-    "water", "salt", "ice" 
-}
-
-def encode_image(file_bytes: bytes) -> str:
-    return base64.b64encode(file_bytes).decode("utf-8")
-
-
-def call_openrouter_with_fallback(payload: dict):
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://localhost:8000", # Required by OpenRouter 
-        "X-Title": "LocalDev" # Required by OpenRouter
-    }
-
-    last_exception = None
-
-    for model in VISION_MODELS:
-        payload["model"] = model
-        print(f"Trying model: {model}")
-
-        for attempt in range(3):  # retry 3 times per model
-            try:
-                response = requests.post(
-                    OPENROUTER_URL,
-                    json=payload,
-                    headers=headers,
-                    timeout=60
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    if "choices" in data and len(data["choices"]) > 0:
-                        return data, model
-                    else:
-                        print(f"Model {model} returned 200 but missing 'choices' or empty: {data}")
-                        # Treat as error to try next model
-                        last_exception = f"Model {model} returned invalid response format"
-                        break # Try next model
-
-                # Rate limit → retry with backoff
-                if response.status_code == 429:
-                    wait_time = (attempt + 1) * 2  # 2s, 4s, 6s
-                    print(f"Rate limited on {model}, retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                
-                # 404 Not Found → Skip immediately
-                if response.status_code == 404:
-                    print(f"Model {model} not found (404). Skipping.")
-                    break # Break inner loop to try next model
-
-                # Other errors → log and break to next model
-                print(f"Error {response.status_code} with {model}: {response.text}")
-                last_exception = f"Error {response.status_code}: {response.text}"
-                break # Break inner loop to try next model
-
-            except Exception as e:
-                print(f"Exception with {model}: {e}")
-                last_exception = str(e)
-                # Don't break immediately on connection errors, maybe retry?
-                # For now let's retry on exception too
-                time.sleep(2) 
-
-    # If all models fail
-    raise HTTPException(
-        status_code=500,
-        detail=f"All models failed. Last error: {last_exception}"
-    )
-
 import re
 
 def parse_ingredients_with_bboxes(text):
@@ -314,180 +309,84 @@ def parse_ingredients_with_bboxes(text):
     return ingredients, bbox_map
 
 
-def execute_with_retry(func, retries=3, delay=1, default=None):
-    """
-    Executes a function with retry logic for network-related errors.
-    """
-    for attempt in range(retries):
-        try:
-            return func()
-        except (requests.exceptions.RequestException, socket.gaierror, Exception) as e:
-            print(f"Attempt {attempt + 1}/{retries} failed for {func.__name__ if hasattr(func, '__name__') else 'unknown'}: {e}")
-            if attempt < retries - 1:
-                time.sleep(delay * (attempt + 1))  # Simple backoff
-            else:
-                print(f"All retries failed. Returning default.")
-                return default
-
-def clean_ingredient_text(text):
-    text = text.lower()
-    text = ''.join([i for i in text if not i.isdigit()])
-    text = text.replace("/", " ").replace(".", " ")
-    try:
-        tokens = nltk.word_tokenize(text)
-    except:
-        tokens = text.split()
-    clean_tokens = []
-    for word in tokens:
-        word = word.strip(string.punctuation)
-        if not word: continue
-        if word in COOKING_STOPWORDS: continue
-        if word in stopwords.words('english'): continue
-        if len(word) < 2: continue 
-        clean_tokens.append(word)
-    return ' '.join(clean_tokens)
-
-def preprocess_text(text):
-    return clean_ingredient_text(text)
-
-def calculate_similarity(user_ingredients, user_prep_time, user_cook_time):
-    if tfidf_vectorizer is None or tfidf_matrix is None or df_english is None:
+def calculate_similarity(user_ingredients, user_prep_time, user_cook_time, timings: Optional[StageTimings] = None):
+    if tfidf_index is None or recipe_store is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
-
-    user_ingredients_text = preprocess_text(', '.join(user_ingredients))
-    user_tfidf = tfidf_vectorizer.transform([user_ingredients_text])
-    cosine_similarities = cosine_similarity(user_tfidf, tfidf_matrix)[0]
-
-    max_prep = df_english['PrepTimeInMins'].max()
-    max_cook = df_english['CookTimeInMins'].max()
-    if max_prep == 0: max_prep = 1
-    if max_cook == 0: max_cook = 1
-
-    prep_time_similarity = 1 - abs(df_english['PrepTimeInMins'] - user_prep_time) / max_prep
-    cook_time_similarity = 1 - abs(df_english['CookTimeInMins'] - user_cook_time) / max_cook
-
-    min_length = min(len(cosine_similarities), len(prep_time_similarity), len(cook_time_similarity))
-    cosine_similarities = cosine_similarities[:min_length]
-    prep_time_similarity = prep_time_similarity[:min_length]
-    cook_time_similarity = cook_time_similarity[:min_length]
-
-    # Weight ingredients significantly higher (80%) than time (20%)
-    combined_similarity = (cosine_similarities * 0.8) + (prep_time_similarity * 0.1) + (cook_time_similarity * 0.1)
-    return combined_similarity
-
-def get_recommendations_logic(user_ingredients_list, user_prep_time, user_cook_time, top_n=9):
-    combined_similarity = calculate_similarity(user_ingredients_list, user_prep_time, user_cook_time)
-    sorted_indices = combined_similarity.argsort()[::-1]
-    top_indices = sorted_indices[:top_n]
-    recommendations = df_english.iloc[top_indices].copy()
-    
-    if hasattr(combined_similarity, 'iloc'):
-        scores = combined_similarity.iloc[top_indices] * 100
-    else:
-        scores = combined_similarity[top_indices] * 100
-        
-    recommendations['similarity_score'] = scores.astype(int).values
-    return recommendations
-
-def remove_metadata(image_bytes: bytes) -> bytes:
-    """
-    Strips EXIF metadata from an image byte stream.
-    Returns the cleaned image as bytes.
-    """
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Create a new image with the same mode and size.
-        # This implementation simply saves the image again without the exif data.
-        # Note: We need to respect the format if possible, default to JPEG.
-        
-        output_buffer = io.BytesIO()
-        fmt = image.format if image.format else 'JPEG'
-        
-        # Save without passing 'exif' parameter strips it by default in PIL
-        image.save(output_buffer, format=fmt)
-        
-        return output_buffer.getvalue()
-    except Exception as e:
-        print(f"Error stripping metadata: {e}")
-        # If anything fails (e.g. not an image), return original bytes
-        return image_bytes
-
-
-def get_youtube_link(query):
+    timings = timings or StageTimings()
+
+    # Ingredients arrive cleaned ("normalize" is the caller's stage); this builds the query from them
+    with timings.stage("vectorize"):
+        query_vector = tfidf_index.query_vector(query_text(user_ingredients))
+    with timings.stage("score"):
+        return _combined_similarity(tfidf_index.vector_scores(query_vector), user_prep_time, user_cook_time)
+
+def _combined_similarity(cosine_similarities, user_prep_time, user_cook_time):
+    scoring = recipe_store.scoring
+    min_length = min(len(cosine_similarities), len(scoring))
+    return combined_similarity(cosine_similarities[:min_length],
+                               scoring['PrepTimeInMins'][:min_length], scoring['CookTimeInMins'][:min_length],
+                               user_prep_time, user_cook_time, recipe_store.max_prep, recipe_store.max_cook)
+
+def get_recommendations_logic(user_ingredients_list, user_prep_time, user_cook_time, top_n=9, exclude_terms=None,
+                              timings: Optional[StageTimings] = None, cancel_event: Optional[threading.Event] = None):
+    timings = timings or StageTimings()
+    if sharded_scorer is not None:
+        # Scatter-gather: each shard process returns its top_n, merged here ("score" includes the top-k)
+        with timings.stage("vectorize"):
+            query_vector = tfidf_index.query_vector(query_text(user_ingredients_list))
+        raise_if_cancelled(cancel_event)
+        with timings.stage("score"):
+            top_indices, scores = sharded_scorer.top_k(query_vector, user_prep_time, user_cook_time, top_n, exclude_terms)
+        raise_if_cancelled(cancel_event)
+        with timings.stage("hydrate"):
+            return recipe_store.rows(top_indices, scores * 100)
+
+    combined = np.array(calculate_similarity(user_ingredients_list, user_prep_time, user_cook_time, timings), dtype=np.float64)
+    with timings.stage("topk"):
+        if exclude_terms:
+            # Same point as the shard workers: rows containing an excluded term never make the top-k
+            combined[tfidf_index.rows_with_terms(exclude_terms)] = -np.inf
+        sorted_indices = combined.argsort()[::-1]
+        top_indices = sorted_indices[:top_n]
+        top_indices = top_indices[np.isfinite(combined[top_indices])]
+        scores = combined[top_indices] * 100
+
+    raise_if_cancelled(cancel_event)
+    # Display fields for just these rows, fetched in one batch
+    with timings.stage("hydrate"):
+        return recipe_store.rows(top_indices, np.asarray(scores))
+
+# Concurrent requests for the same upstream work share one call
+youtube_flight = get_flight("youtube")
+ollama_recipe_flight = get_flight("ollama_recipe")
+
+def get_youtube_link(query, deadline=None):
     def _search():
-        results = YoutubeSearch(query + " recipe", max_results=1).to_dict()
+        from youtube_search import YoutubeSearch
+        with track_dependency("youtube", "search"):
+            results = YoutubeSearch(query + " recipe", max_results=1).to_dict()
         if results:
             return f"https://www.youtube.com/watch?v={results[0]['id']}"
         return ""
 
-    return execute_with_retry(_search, retries=3, delay=2, default="")
+    def _search_with_retry():
+        return execute_with_retry(_search, retries=3, delay=2, default="", deadline=deadline)
 
-def analyze_perishability(ingredients_list, extra_text=""):
-    if not ingredients_list and not extra_text:
-        return []
-    
-    prompt = f"""
-    You are an expert food safety assistant. Analyze the following ingredients and estimate their perishability.
-    
-    Detected Ingredients List: {', '.join(ingredients_list)}
-    User Description: {extra_text}
-    
-    Task:
-    1. Extract any additional ingredients from the 'User Description'.
-    2. Combine them with the 'Detected Ingredients List'.
-    3. Remove duplicates.
-    4. For each ingredient, estimate:
-       - "days_to_expiry": (int) estimated days until expiry (use 999 for non-perishables like salt/spices/rice)
-       - "priority": (string) "High", "Medium", or "Low" based on urgency to use.
-    
-    STRICT Guidelines for Priority:
-    - High (Red): Raw meats (Chicken, Beef, Pork), Seafood, Leafy Greens. Use within 1-3 days.
-    - Medium (Yellow): Eggs, Milk, Soft Cheeses, Most Fresh Vegetables/Fruits. Use within 4-14 days.
-    - Low (Green): Rice, Grains, Pasta, Hard Cheeses, Frozen Foods, Canned Goods, Spices. Use within 15+ days.
-
-    Return ONLY a valid JSON array where each object has:
-    - "name": (string) ingredient name (CLEAN UP NAMES: Remove quantities/numbers. KEEP Indian names in parentheses if available. Example: "Red Tomatoes" -> "Tomatoes", "Zucchini (Turai)" -> "Zucchini (Turai)", "Carrot [10 20 30 40]" -> "Carrot")
-    - "days_to_expiry": (int)
-    - "priority": (string)
-    
-    Do not add any markdown formatting or extra text. Just the JSON.
-    """
-    
     try:
-        response = ollama.chat(model='llama3', format='json', messages=[
-            {'role': 'user', 'content': prompt},
-        ])
-        content = response['message']['content']
-        clean_content = content.replace("```json", "").replace("```", "").strip()
-        
-        try:
-             data = json.loads(clean_content)
-        except json.JSONDecodeError:
-             start = clean_content.find('[')
-             end = clean_content.rfind(']')
-             if start != -1 and end != -1:
-                 data = json.loads(clean_content[start:end+1])
-             else:
-                 raise
-
-        if isinstance(data, dict):
-            for key, value in data.items():
-                if isinstance(value, list):
-                    return value
-            return [data]
-            
-        if isinstance(data, list):
-            return [item for item in data if isinstance(item, dict)]
-            
-        return [] 
-        
-    except Exception as e:
-        print(f"Error analyzing perishability: {e}")
-        fallback_list = ingredients_list + (extra_text.split(',') if extra_text else [])
-        return [{"name": ing.strip(), "days_to_expiry": 7, "priority": "Medium"} for ing in fallback_list if ing.strip()]
+        return youtube_flight.do(flight_key(query), _search_with_retry, timeout=timeout_until(deadline))
+    except FlightTimeout:
+        return ""
+
+def generate_recipe_with_ollama(ingredients: List[str], timeout: Optional[float] = None) -> Recipe:
+    # Same ingredients in any order make the same prompt
+    key = flight_key(*sorted(i.strip().lower() for i in ingredients))
+    try:
+        return ollama_recipe_flight.do(key, _generate_recipe_with_ollama, ingredients, timeout, timeout=timeout)
+    except FlightTimeout as e:
+        print(f"Error generating recipe with Ollama: {e}")
+        return ai_recipe_error()
 
-def generate_recipe_with_ollama(ingredients: List[str]) -> Recipe:
+def _generate_recipe_with_ollama(ingredients: List[str], timeout: Optional[float] = None) -> Recipe:
     print(f"Generating AI recipe for: {ingredients}")
     prompt = f"""
     Create a unique and delicious recipe using these ingredients: {', '.join(ingredients)}.
@@ -510,9 +409,13 @@ def generate_recipe_with_ollama(ingredients: List[str]) -> Recipe:
     """
     
     try:
-        response = ollama.chat(model='llama3', format='json', messages=[
-            {'role': 'user', 'content': prompt},
-        ])
+        # A per-call client so the request budget bounds the generation
+        import ollama
+        client = ollama.Client(timeout=timeout) if timeout else ollama
+        with track_dependency("ollama", "recipe"):
+            response = client.chat(model='llama3', format='json', messages=[
+                {'role': 'user', 'content': prompt},
+            ])
         content = response['message']['content']
         data = json.loads(content)
         
@@ -540,29 +443,34 @@ def generate_recipe_with_ollama(ingredients: List[str]) -> Recipe:
         )
     except Exception as e:
         print(f"Error generating recipe with Ollama: {e}")
-        # Return a dummy error recipe
-        return Recipe(
-            id=-1,
-            name="Could not generate recipe",
-            translated_name="Error",
-            ingredients="None",
-            prep_time=0,
-            cook_time=0,
-            url="",
-            youtube_link="",
-            missing_ingredients=[],
-            match_score=0,
-            instructions=["Please try again with different ingredients."],
-            cuisine="None",
-            course="None",
-            diet="None",
-            servings=0
-        )
+        return ai_recipe_error()
+
+def ai_recipe_error() -> Recipe:
+    # A dummy error recipe
+    return Recipe(
+        id=-1,
+        name="Could not generate recipe",
+        translated_name="Error",
+        ingredients="None",
+        prep_time=0,
+        cook_time=0,
+        url="",
+        youtube_link="",
+        missing_ingredients=[],
+        match_score=0,
+        instructions=["Please try again with different ingredients."],
+        cuisine="None",
+        course="None",
+        diet="None",
+        servings=0
+    )
 
-def process_recipe_row(row, user_ingredients_list=[]):
+def process_recipe_row(row, user_ingredients_list=[], youtube_link=None):
+    # Pass youtube_link to skip the lookup (e.g. when it is enriched separately)
+    import pandas as pd
     ingreds = str(row['Ingredients']) if 'Ingredients' in row and pd.notna(row['Ingredients']) else "Not listed"
     recipe_name = str(row['RecipeName'])
-    youtube_url = get_youtube_link(recipe_name)
+    youtube_url = get_youtube_link(recipe_name) if youtube_link is None else youtube_link
     
     r_ing_list = []
     if ingreds.strip().startswith("[") and ingreds.strip().endswith("]"):
@@ -606,7 +514,7 @@ def process_recipe_row(row, user_ingredients_list=[]):
         youtube_link=youtube_url,
         missing_ingredients=missing,
         match_score=int(row['similarity_score']) if 'similarity_score' in row else 0,
-        instructions=nltk.sent_tokenize(str(row['Instructions'])) if 'Instructions' in row and pd.notna(row['Instructions']) else [],
+        instructions=tokenizer.sent_tokenize(str(row['Instructions'])) if 'Instructions' in row and pd.notna(row['Instructions']) else [],
         cuisine=str(row['Cuisine']) if 'Cuisine' in row else "",
         course=str(row['Course']) if 'Course' in row else "",
         diet=str(row['Diet']) if 'Diet' in row else "",
@@ -642,15 +550,12 @@ def apply_profile_filters(recipes_df, constraints):
 # --- Endpoints ---
 
 @app.post("/register", response_model=Token)
-def register(user: UserCreate):
-    users_collection = get_users_collection()
-    if users_collection is None:
-        raise HTTPException(status_code=503, detail="Database unavailable")
-
-    if users_collection.find_one({"email": user.email}):
+async def register(user: UserCreate):
+    repository = get_repository()
+    if await repository.email_exists(user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     default_profile = {
         "name": user.email.split("@")[0],
         "experience_level": "Intermediate",
@@ -663,11 +568,14 @@ def register(user: UserCreate):
         "email": user.email,
         "hashed_password": hashed_password,
         "is_admin": False,
-        "profile": default_profile,
-        "interactions": []
+        "profile": default_profile
     }
     
-    users_collection.insert_one(new_user)
+    try:
+        await repository.create_user(new_user)
+    except ValueError:
+        # Lost a race with a concurrent registration; the unique index caught it
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -677,17 +585,21 @@ def register(user: UserCreate):
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    users_collection = get_users_collection()
-    if users_collection is None:
-        raise HTTPException(status_code=503, detail="Database unavailable")
-
-    user = users_collection.find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    repository = get_repository()
+    user = await repository.find_user_view(form_data.username)
+    valid = False
+    if user:
+        valid, new_hash = await password_hasher.verify(form_data.password, user["hashed_password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash is not None:
+        # Stored hash used an older cost; upgrade it while we have the plaintext
+        await repository.set_password_hash(user["email"], new_hash)
+        invalidate_user(user["email"])
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["email"]}, expires_delta=access_token_expires
@@ -695,79 +607,124 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/profile")
-def get_profile(current_user: UserInDB = Depends(get_current_user)):
+async def get_profile(current_user: UserInDB = Depends(get_current_user)):
+    repository = get_repository()
     profile_data = current_user.profile.copy()
-    profile_data["interactions"] = current_user.interactions
+    # Latest page of history plus precomputed counters instead of the full list
+    (interactions, next_cursor), counters = await asyncio.gather(
+        repository.interaction_history(current_user.email),
+        repository.interaction_counters(current_user.email)
+    )
+    profile_data["interactions"] = interactions
+    profile_data["interactions_next_cursor"] = next_cursor
+    profile_data["interaction_stats"] = {"total": counters["total_interactions"], "actions": counters["actions"]}
+    profile_data["liked_recipes"] = counters["liked_recipes"]
     profile_data["is_admin"] = current_user.is_admin
     return profile_data
 
-@app.post("/profile")
-def update_profile(profile_update: UserProfileUpdate, current_user: UserInDB = Depends(get_current_user)):
-    users_collection = get_users_collection()
-    if users_collection is None:
-        raise HTTPException(status_code=503, detail="Database unavailable")
+@app.get("/profile/interactions")
+async def get_profile_interactions(before: Optional[str] = None, limit: int = 20, current_user: UserInDB = Depends(get_current_user)):
+    try:
+        before_ts = datetime.fromisoformat(before) if before else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    limit = max(1, min(limit, 100))
+    interactions, next_cursor = await get_repository().interaction_history(current_user.email, limit=limit, before=before_ts)
+    return {"interactions": interactions, "next_cursor": next_cursor}
 
+@app.post("/profile")
+async def update_profile(profile_update: UserProfileUpdate, current_user: UserInDB = Depends(get_current_user)):
     updates = {k: v for k, v in profile_update.model_dump().items() if v is not None}
     
     if not updates:
         return current_user.profile
 
-    mongo_updates = {f"profile.{k}": v for k, v in updates.items()}
-    
-    users_collection.update_one(
-        {"email": current_user.email},
-        {"$set": mongo_updates}
-    )
+    await get_repository().update_profile(current_user.email, updates)
     
     new_profile = current_user.profile.copy()
     new_profile.update(updates)
+    update_cached_profile(current_user, new_profile)
     return new_profile
 
 @app.post("/interaction")
 def log_interaction(interaction: InteractionRequest, current_user: UserInDB = Depends(get_current_user)):
-    users_collection = get_users_collection()
-    if users_collection is None:
-        raise HTTPException(status_code=503, detail="Database unavailable")
-
-    new_interaction = {
-        "timestamp": str(datetime.now()),
-        "action": interaction.action,
-        "recipe_name": interaction.recipe_name,
-        "details": interaction.details or {}
-    }
-    
-    users_collection.update_one(
-        {"email": current_user.email},
-        {"$push": {"interactions": new_interaction}}
-    )
+    # Sync on purpose: add() may block for backpressure, which must not happen on the event loop
+    new_interaction = make_event(interaction.action, interaction.recipe_name, interaction.details)
+    # Acknowledged once buffered; the flusher writes batches with bulk_write
+    try:
+        interaction_buffer.add(current_user.email, new_interaction)
+    except BufferFull:
+        raise HTTPException(status_code=503, detail="Too many pending interactions, please retry")
     return {"status": "success"}
 
+def add_youtube_links(recipes, cancel_event=None, budget: Optional[RequestBudget] = None):
+    """Looks up links on the shared enrichment pool; lookups cut off by the budget leave the link empty."""
+    deadline = budget.work_deadline if budget else None
+    lookup = lambda name: get_youtube_link(name, deadline=deadline)
+    links = enrichment_executor.map(lookup, [r.name for r in recipes], default=None, deadline=deadline, cancel_event=cancel_event)
+    for recipe, link in zip(recipes, links):
+        if link is None:
+            recipe.youtube_link = ""
+            recipe.degraded.append("youtube_link")
+            if budget:
+                budget.degrade("youtube_link")
+        else:
+            recipe.youtube_link = link
+    return recipes
+
 @app.post("/recommend", response_model=List[Recipe])
-def recommend_recipes_endpoint(request: RecipeRequest, current_user: Optional[UserInDB] = Depends(get_current_user)):
-    if df_english is None:
+async def recommend_recipes_endpoint(request: RecipeRequest, http_request: Request, current_user: Optional[UserInDB] = Depends(get_current_user)):
+    # Whole-request budget (X-Request-Budget-Ms or the server default); optional stages degrade to fit it
+    budget = RequestBudget.from_header(http_request.headers.get(BUDGET_HEADER))
+    timings = StageTimings(RECOMMEND_STAGE_SECONDS)
+    # Enrichment still queued when the client goes away or the budget ends is dropped
+    cancel_event = threading.Event()
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, cancel_event))
+    try:
+        results = await asyncio.wait_for(
+            run_in_threadpool(recommend_recipes, request, current_user, cancel_event, budget, timings),
+            timeout=max(budget.deadline - time.monotonic(), 0)
+        )
+        # Encoded here rather than by FastAPI so serialisation shows up as its own stage
+        with timings.stage("serialize"):
+            content = jsonable_encoder(results)
+        return JSONResponse(content=content, headers=budget.headers())
+    except asyncio.TimeoutError:
+        # The threadpool call keeps running; this stops it at its next stage
+        cancel_event.set()
+        raise HTTPException(status_code=504, detail="Recommendation exceeded its time budget", headers=budget.headers())
+    except RequestCancelled:
+        # Only reached on disconnect; nobody reads this response
+        raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        watcher.cancel()
+        timings.observe()
+
+def recommend_recipes(request: RecipeRequest, current_user: Optional[UserInDB], cancel_event: threading.Event, budget: RequestBudget,
+                      timings: StageTimings):
+    if recipe_store is None:
         raise HTTPException(status_code=503, detail="Model failed to load.")
 
     try:
-        raw_list = [i.strip() for i in request.ingredients.split(',')]
-        ingredients_list = []
-        for i in raw_list:
-            cleaned = clean_ingredient_text(i)
-            if cleaned:
-                ingredients_list.append(cleaned)
-        
-        if not ingredients_list and raw_list:
-             ingredients_list = [r for r in raw_list if r]
-
-        base_recs = get_recommendations_logic(ingredients_list, request.prep_time, request.cook_time, top_n=50)
+        with timings.stage("normalize"):
+            ingredients_list = clean_ingredients(request.ingredients)
+
+        # Single-term allergens are dropped before candidates are picked, in either scoring path;
+        # phrases are left to the substring check in apply_profile_filters
+        exclude_terms = tfidf_index.term_ids(current_user.profile.get("allergies", [])) if current_user and tfidf_index else None
+        base_recs = get_recommendations_logic(ingredients_list, request.prep_time, request.cook_time, top_n=50,
+                                              exclude_terms=exclude_terms, timings=timings, cancel_event=cancel_event)
         
-        if current_user:
-             constraints = {
-                 "allergies": current_user.profile.get("allergies", []),
-                 "dietary_preferences": current_user.profile.get("dietary_preferences", []),
-             }
-             filtered_recs = apply_profile_filters(base_recs, constraints)
-        else:
-             filtered_recs = base_recs
+        raise_if_cancelled(cancel_event)
+        with timings.stage("filter"):
+            if current_user:
+                 constraints = {
+                     "allergies": current_user.profile.get("allergies", []),
+                     "dietary_preferences": current_user.profile.get("dietary_preferences", []),
+                 }
+                 filtered_recs = apply_profile_filters(base_recs, constraints)
+            else:
+                 filtered_recs = base_recs
         
         # Check if we have good matches
         top_recs = filtered_recs.head(9)
@@ -778,164 +735,354 @@ def recommend_recipes_endpoint(request: RecipeRequest, current_user: Optional[Us
         
         # Threshold for fallback (e.g. < 30% match)
         results = []
+        raise_if_cancelled(cancel_event)
         if top_recs.empty or best_score < 30:
-            print(f"Match score {best_score}% is below threshold (30%). Triggering Ollama fallback...")
-            ai_recipe = generate_recipe_with_ollama(ingredients_list)
-            results.append(ai_recipe)
+            if budget.allows(OLLAMA_MIN_BUDGET_MS):
+                print(f"Match score {best_score}% is below threshold (30%). Triggering Ollama fallback...")
+                with timings.stage("ai_fallback"):
+                    ai_recipe = generate_recipe_with_ollama(ingredients_list, timeout=budget.remaining())
+                results.append(ai_recipe)
+            else:
+                budget.degrade("ai_recipe")
             
             # Still append the best partial matches if any
             if not top_recs.empty:
-                 with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                     func = lambda r: process_recipe_row(r, ingredients_list)
-                     partials = list(executor.map(func, [row for _, row in top_recs.iterrows()]))
-                     results.extend(partials)
+                 with timings.stage("build"):
+                     partials = [process_recipe_row(row, ingredients_list, youtube_link="") for _, row in top_recs.iterrows()]
+                 with timings.stage("enrich"):
+                     results.extend(add_youtube_links(partials, cancel_event, budget))
         else:
-             with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                  func = lambda r: process_recipe_row(r, ingredients_list)
-                  results = list(executor.map(func, [row for _, row in top_recs.iterrows()]))
+             with timings.stage("build"):
+                 results = [process_recipe_row(row, ingredients_list, youtube_link="") for _, row in top_recs.iterrows()]
+             with timings.stage("enrich"):
+                 results = add_youtube_links(results, cancel_event, budget)
+
+        raise_if_cancelled(cancel_event)
+        if request.lang:
+            if budget.expired():
+                budget.degrade("translation")
+                for r in results:
+                    r.degraded.append("translation")
+            else:
+                with timings.stage("localize"):
+                    results = [localize_recipe(r, request.lang) for r in results]
             
         return results
 
+    except (HTTPException, RequestCancelled):
+        raise
     except Exception as e:
         print(f"Error generating recommendations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+DETECTION_PROMPT = "Identify the food ingredients in this image. For EACH ingredient, provide its name in English, followed by the Hindi name in parentheses if available (e.g. 'Eggplant (Baingan)', 'Okra (Bhindi)'). Follow with its Bounding Box. Format: 'Name [ymin, xmin, ymax, xmax]'. Coordinates must be normalized to 0-1000 scale. Return a list."
+
+def detect_with_vlm(image: PreparedImage):
+    """Blocking remote detection. Returns (ingredients, bbox_map, used_model)."""
+    payload = {
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": DETECTION_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image.data_url
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+
+    result, used_model = call_openrouter_with_fallback(payload)
+    detected_text = result["choices"][0]["message"]["content"]
+    print(f"OpenRouter Detection ({used_model}): {detected_text}")
+
+    # Parse detected text for bboxes
+    detected_ingredients_list, bbox_map = parse_ingredients_with_bboxes(detected_text)
+    return detected_ingredients_list, bbox_map, used_model
+
+def merge_bboxes(prioritized_ingredients, bbox_map, source_map=None):
+    # Merge bboxes back into the result
+    # source_map (optional): lower-name -> index of the image the bbox belongs to
+    filtered_results = []
+    seen_names = set()
+    
+    for item in prioritized_ingredients:
+        name = item.get("name", "")
+        if not name: continue
+        
+        # Normalize name for lookup
+        # The LLM might have slightly changed the name (e.g. capitalized)
+        # We try to find a matching bbox in our map
+        
+        # Check exact match lower
+        matched_name = name.lower() if name.lower() in bbox_map else None
+        
+        # If not found, try simple partial match
+        if not matched_name:
+             for mapped_name in bbox_map:
+                 if mapped_name in name.lower() or name.lower() in mapped_name:
+                     matched_name = mapped_name
+                     break
+        
+        item["bbox"] = bbox_map.get(matched_name) if matched_name else None # Can be None
+        if source_map is not None:
+            item["image_index"] = source_map.get(matched_name) if matched_name else None
+        
+        if name.lower() not in seen_names:
+            filtered_results.append(item)
+            seen_names.add(name.lower())
+
+    filtered_results.sort(key=lambda x: x.get('days_to_expiry', 999))
+    return filtered_results
+
 @app.post("/detect-ingredients")
 async def detect_ingredients(file: UploadFile = File(None), text_input: str = Form(None)):
+    """
+    Staged pipeline: perishability for typed ingredients starts right away and
+    overlaps with upload → metadata strip → detection; a second perishability
+    pass covers only the newly detected items. Blocking work never runs on the
+    event loop.
+    """
     if not file and not text_input:
         raise HTTPException(status_code=400, detail="Either an image file or text input is required.")
+    timings = StageTimings(DETECT_STAGE_SECONDS)
+    text_items = [t.strip() for t in text_input.split(',') if t.strip()] if text_input else []
+    text_task = None
 
     try:
-        detected_text = ""
+        if text_items:
+            text_task = asyncio.ensure_future(timings.run(
+                "perishability_text", run_in_threadpool(analyze_perishability_batched, text_items, "")
+            ))
+
+        detected_ingredients_list, bbox_map = [], {}
         used_model = "None"
         
         if file:
-            if not file.content_type.startswith("image/"):
-                 raise HTTPException(status_code=400, detail="Only image files are allowed")
-            
-            image_bytes = await file.read()
-            
-            # Privacy: Remove metadata before sending to AI
-            image_bytes = remove_metadata(image_bytes)
-            
-            image_base64 = encode_image(image_bytes)
-
-            payload = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Identify the food ingredients in this image. For EACH ingredient, provide its name in English, followed by the Hindi name in parentheses if available (e.g. 'Eggplant (Baingan)', 'Okra (Bhindi)'). Follow with its Bounding Box. Format: 'Name [ymin, xmin, ymax, xmax]'. Coordinates must be normalized to 0-1000 scale. Return a list."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:{file.content_type};base64,{image_base64}"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-            
-            # Run blocking code in threadpool
-            result, used_model = await run_in_threadpool(call_openrouter_with_fallback, payload)
-            detected_text = result["choices"][0]["message"]["content"]
-            print(f"OpenRouter Detection ({used_model}): {detected_text}")
+            # Bounded read + reduced decode; re-encoding also strips metadata (privacy)
+            image = await timings.run("prepare_image", prepare_image(file))
+
+            # Local CPU tier first; the remote VLM only sees photos it isn't confident about
+            local_result = await timings.run("local_detection", detect_local(image.jpeg_bytes))
+            if local_result is not None:
+                detected_ingredients_list, bbox_map = local_result
+                used_model = "local-yolo"
+            else:
+                detected_ingredients_list, bbox_map, used_model = await timings.run(
+                    "vision", run_in_threadpool(detect_with_vlm, image)
+                )
 
-        # Parse detected text for bboxes
-        detected_ingredients_list, bbox_map = parse_ingredients_with_bboxes(detected_text)
+        # Second pass only for what the detector added on top of the typed items
+        typed = {t.lower() for t in text_items}
+        new_items = [n for n in detected_ingredients_list if n.lower() not in typed]
+        detected_priorities = []
+        if new_items:
+            detected_priorities = await timings.run(
+                "perishability_detected", run_in_threadpool(analyze_perishability_batched, new_items, "")
+            )
+        text_priorities = await text_task if text_task else []
+
+        with timings.stage("merge"):
+            filtered_results = merge_bboxes(detected_priorities + text_priorities, bbox_map)
+
+        stage_timings = timings.as_dict()
+        print(f"Detection timings (ms): {stage_timings}")
+        return {"detected_ingredients": filtered_results, "detector": used_model, "timings": stage_timings}
         
-        # Combine text input and detected text for perishability analysis
-        # If text input exists, add it to the list
-        if text_input:
-             detected_ingredients_list.extend([t.strip() for t in text_input.split(',') if t.strip()])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error during detection: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if text_task is not None and not text_task.done():
+            text_task.cancel()
+        timings.observe()
 
-        # Pass specific list to analyze_perishability
-        prioritized_ingredients = analyze_perishability(detected_ingredients_list, extra_text="")
-        
-        # Merge bboxes back into the result
-        filtered_results = []
+@app.post("/detect-ingredients/batch")
+async def detect_ingredients_batch(files: List[UploadFile] = File(...), text_input: str = Form(None)):
+    """
+    Pantry scan: several photos in one request. Local detection runs as one
+    inference batch, only unconfident photos go to the VLM (in parallel), and
+    perishability is analyzed once for the deduplicated union.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="At least one image file is required.")
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IMAGES} images per scan.")
+
+    try:
+        # Bounded reads and reduced decodes run in parallel; metadata is stripped on re-encode
+        images = await asyncio.gather(*[prepare_image(file) for file in files])
+
+        local_results = await detect_local_batch([image.jpeg_bytes for image in images])
+
+        async def _detect_remote(index):
+            names, bboxes, _ = await run_in_threadpool(detect_with_vlm, images[index])
+            return names, bboxes
+
+        remote_indices = [i for i, r in enumerate(local_results) if r is None]
+        remote_results = await asyncio.gather(*[_detect_remote(i) for i in remote_indices])
+        per_image = list(local_results)
+        for index, result in zip(remote_indices, remote_results):
+            per_image[index] = result
+
+        # Dedupe across photos; the first photo an ingredient appears in keeps its bbox
+        detected_ingredients_list, bbox_map, source_map = [], {}, {}
         seen_names = set()
-        
-        for item in prioritized_ingredients:
-            name = item.get("name", "")
-            if not name: continue
-            
-            # Normalize name for lookup
-            # The LLM might have slightly changed the name (e.g. capitalized)
-            # We try to find a matching bbox in our map
-            
-            # Check exact match lower
-            bbox = bbox_map.get(name.lower())
-            
-            # If not found, try simple partial match
-            if not bbox:
-                 for mapped_name, mapped_bbox in bbox_map.items():
-                     if mapped_name in name.lower() or name.lower() in mapped_name:
-                         bbox = mapped_bbox
-                         break
-            
-            item["bbox"] = bbox # Can be None
-            
-            if name.lower() not in seen_names:
-                filtered_results.append(item)
+        for index, (names, bboxes) in enumerate(per_image):
+            for name in names:
+                if name.lower() in seen_names:
+                    continue
                 seen_names.add(name.lower())
+                detected_ingredients_list.append(name)
+                if name.lower() in bboxes:
+                    bbox_map[name.lower()] = bboxes[name.lower()]
+                    source_map[name.lower()] = index
 
-        filtered_results.sort(key=lambda x: x.get('days_to_expiry', 999))
-        
-        return {"detected_ingredients": filtered_results}
-        
+        if text_input:
+             detected_ingredients_list.extend([t.strip() for t in text_input.split(',') if t.strip()])
+
+        prioritized_ingredients = await run_in_threadpool(analyze_perishability_batched, detected_ingredients_list, "")
+        filtered_results = merge_bboxes(prioritized_ingredients, bbox_map, source_map)
+
+        return {
+            "detected_ingredients": filtered_results,
+            "images": len(images),
+            "local_images": len(images) - len(remote_indices),
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error during detection: {e}")
+        print(f"Error during batch detection: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/verify-step")
-async def verify_cooking_step(file: UploadFile = File(...), instruction: str = Form(...)):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Only image files are allowed")
+async def build_verify_step_payload(file: UploadFile, instruction: str) -> dict:
+    # Bounded read + reduced decode; re-encoding also strips metadata (privacy)
+    image = await prepare_image(file)
 
-    try:
-        image_bytes = await file.read()
-        
-        # Privacy: Remove metadata before sending to AI
-        image_bytes = remove_metadata(image_bytes)
-        
-        image_base64 = encode_image(image_bytes)
+    prompt = f"""
+    You are a friendly Indian Chef assistant. 
+    I am currently cooking and following this step: "{instruction}". 
+    
+    Please look at the attached image of my cooking. 
+    Does it look correct according to the instruction? 
+    
+    If it looks correct, say 'Looks perfect ji!'. 
+    If not, explain what is wrong and how to fix it in simple Indian English.
+    Keep your response concise and helpful.
+    """
 
-        prompt = f"""
-        You are a friendly Indian Chef assistant. 
-        I am currently cooking and following this step: "{instruction}". 
-        
-        Please look at the attached image of my cooking. 
-        Does it look correct according to the instruction? 
-        
-        If it looks correct, say 'Looks perfect ji!'. 
-        If not, explain what is wrong and how to fix it in simple Indian English.
-        Keep your response concise and helpful.
-        """
-
-        payload = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{file.content_type};base64,{image_base64}"
-                            }
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image.data_url
                         }
-                    ]
-                }
-            ]
-        }
+                    }
+                ]
+            }
+        ]
+    }
+
+def build_chef_system_instruction(recipe_name: str, step_label: str, instruction: str) -> str:
+    return f"""
+    You are a friendly and encouraging Indian Chef assistant.
+    The user is cooking "{recipe_name}".
+    Current Context: {step_label} - "{instruction}".
+    
+    Your Goal: Help the user with this step, answer their questions, or verify their progress if they share an image.
+    Personality: Warm, helpful, speaks in Indian English (e.g., uses "ji", "beta", "don't worry").
+    
+    Guidelines:
+    - Keep answers concise (1-2 paragraphs max) as the user is busy cooking.
+    - If they send an image, analyze it relative to the current step instruction.
+    - If they ask for help, explain simply.
+    """
+
+async def build_chat_payload(text_input: str, file: Optional[UploadFile], context: str, history: Optional[str]) -> dict:
+    # Parse Context
+    ctx = json.loads(context)
+    recipe_name = ctx.get("recipe_name", "Unknown Recipe")
+    step_label = ctx.get("step_label", "General")
+    instruction = ctx.get("instruction", "")
+    
+    # Parse History (if needed for context, usually last few messages)
+    # For this simple implementation, we might just rely on immediate context + user query
+    # But let's check if we want to include history in the prompt.
+    chat_history = []
+    if history:
+        chat_history = json.loads(history)
+
+    # System Prompt
+    system_instruction = build_chef_system_instruction(recipe_name, step_label, instruction)
+    
+    # We can't easily add a separate "system" role message for some VLM models, 
+    # so we often prepend it to the user message or use it if supported.
+    # OpenRouter/OpenAI usually supports developer/system messages, but for safety with VLMs, 
+    # let's prepend context to the user prompt.
+    
+    user_content_blocks = []
+    
+    # Add System Context as text
+    user_content_blocks.append({
+        "type": "text", 
+        "text": f"SYSTEM INSTRUCTION: {system_instruction}\n\nUSER MESSAGE: {text_input}"
+    })
+    
+    if file:
+        image = await prepare_image(file)
+        user_content_blocks.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image.data_url
+            }
+        })
+        print("Image attached to chat.")
+
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": user_content_blocks
+            }
+        ]
+    }
+
+def stream_as_sse(payload: dict, label: str):
+    """Relays OpenRouter tokens to the client as Server-Sent Events."""
+    for kind, data in stream_openrouter_with_fallback(payload):
+        if kind == "token":
+            yield sse_event("token", {"token": data})
+        elif kind == "done":
+            print(f"{label} stream ({data['model']}): ttft={data['ttft_ms']}ms total={data['total_ms']}ms")
+            yield sse_event("done", data)
+        else:
+            print(f"Error during {label} stream: {data}")
+            yield sse_event("error", {"detail": data})
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/verify-step")
+async def verify_cooking_step(file: UploadFile = File(...), instruction: str = Form(...)):
+    try:
+        payload = await build_verify_step_payload(file, instruction)
 
         # Run blocking code in threadpool
         result, used_model = await run_in_threadpool(call_openrouter_with_fallback, payload)
@@ -944,10 +1091,18 @@ async def verify_cooking_step(file: UploadFile = File(...), instruction: str = F
         
         return {"feedback": feedback}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during step verification: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/verify-step/stream")
+async def verify_cooking_step_stream(file: UploadFile = File(...), instruction: str = Form(...)):
+    payload = await build_verify_step_payload(file, instruction)
+    # StreamingResponse iterates sync generators in the threadpool
+    return StreamingResponse(stream_as_sse(payload, "Step Verification"), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/chat")
 async def chat_with_chef(
     text_input: str = Form(...),
@@ -956,72 +1111,7 @@ async def chat_with_chef(
     history: str = Form(None) # JSON string: list of {role, content}
 ):
     try:
-        # Parse Context
-        import json
-        ctx = json.loads(context)
-        recipe_name = ctx.get("recipe_name", "Unknown Recipe")
-        step_label = ctx.get("step_label", "General")
-        instruction = ctx.get("instruction", "")
-        
-        # Parse History (if needed for context, usually last few messages)
-        # For this simple implementation, we might just rely on immediate context + user query
-        # But let's check if we want to include history in the prompt.
-        chat_history = []
-        if history:
-            chat_history = json.loads(history)
-
-        # System Prompt
-        system_instruction = f"""
-        You are a friendly and encouraging Indian Chef assistant.
-        The user is cooking "{recipe_name}".
-        Current Context: {step_label} - "{instruction}".
-        
-        Your Goal: Help the user with this step, answer their questions, or verify their progress if they share an image.
-        Personality: Warm, helpful, speaks in Indian English (e.g., uses "ji", "beta", "don't worry").
-        
-        Guidelines:
-        - Keep answers concise (1-2 paragraphs max) as the user is busy cooking.
-        - If they send an image, analyze it relative to the current step instruction.
-        - If they ask for help, explain simply.
-        """
-        
-        # Construct Messages for OpenRouter
-        messages = []
-        
-        # We can't easily add a separate "system" role message for some VLM models, 
-        # so we often prepend it to the user message or use it if supported.
-        # OpenRouter/OpenAI usually supports developer/system messages, but for safety with VLMs, 
-        # let's prepend context to the user prompt.
-        
-        user_content_blocks = []
-        
-        # Add System Context as text
-        user_content_blocks.append({
-            "type": "text", 
-            "text": f"SYSTEM INSTRUCTION: {system_instruction}\n\nUSER MESSAGE: {text_input}"
-        })
-        
-        if file:
-            if not file.content_type.startswith("image/"):
-                raise HTTPException(status_code=400, detail="Only image files are allowed")
-            image_bytes = await file.read()
-            image_base64 = encode_image(image_bytes)
-            user_content_blocks.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:{file.content_type};base64,{image_base64}"
-                }
-            })
-            print("Image attached to chat.")
-
-        payload = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": user_content_blocks
-                }
-            ]
-        }
+        payload = await build_chat_payload(text_input, file, context, history)
 
         # Run blocking code in threadpool
         result, used_model = await run_in_threadpool(call_openrouter_with_fallback, payload)
@@ -1030,41 +1120,182 @@ async def chat_with_chef(
         
         return {"response": message_content}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_with_chef_stream(
+    text_input: str = Form(...),
+    file: UploadFile = File(None),
+    context: str = Form(...),
+    history: str = Form(None)
+):
+    try:
+        payload = await build_chat_payload(text_input, file, context, history)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid context or history JSON: {e}")
+    return StreamingResponse(stream_as_sse(payload, "Chat"), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# --- Chat sessions (CookingMode) ---
+# Context, trimmed history and processed images live server-side, so each turn
+# only carries the new message plus image references.
+
+def build_session_chat_payload(session, text_input: str, image_ids: List[str]) -> dict:
+    ctx = session.context
+    system_instruction = build_chef_system_instruction(
+        ctx.get("recipe_name", "Unknown Recipe"),
+        ctx.get("step_label", "General"),
+        ctx.get("instruction", "")
+    )
+
+    history_lines = []
+    for message in session.trimmed_history():
+        speaker = "User" if message["role"] == "user" else "Chef"
+        history_lines.append(f"{speaker}: {message['content']}")
+    history_text = "\n".join(history_lines)
+
+    text = f"SYSTEM INSTRUCTION: {system_instruction}\n\n"
+    if history_text:
+        text += f"CONVERSATION SO FAR:\n{history_text}\n\n"
+    text += f"USER MESSAGE: {text_input}"
+
+    user_content_blocks = [{"type": "text", "text": text}]
+    for image_id in image_ids:
+        data_url = session.images.get(image_id)
+        if data_url is None:
+            raise KeyError(image_id)
+        user_content_blocks.append({"type": "image_url", "image_url": {"url": data_url}})
+
+    return {"messages": [{"role": "user", "content": user_content_blocks}]}
+
+@app.post("/chat/sessions")
+def create_chat_session(request: ChatSessionCreate):
+    session = chat_sessions.create(request.model_dump())
+    return {"session_id": session.id}
+
+@app.post("/chat/sessions/{session_id}/images")
+async def upload_chat_session_image(session_id: str, file: UploadFile = File(...)):
+    session = chat_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    # Reduce, strip metadata and encode once; later turns only reference the id
+    image = await prepare_image(file)
+    image_id = chat_sessions.add_image(session, image.data_url)
+    return {"image_id": image_id}
+
+@app.delete("/chat/sessions/{session_id}")
+def delete_chat_session(session_id: str):
+    if not chat_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return {"status": "deleted"}
+
+@app.websocket("/ws/chat/{session_id}")
+async def chat_session_socket(websocket: WebSocket, session_id: str):
+    """
+    Messages in:  {"message": str, "image_ids": [str], "context": {...}?}
+    Messages out: {"type": "token" | "done" | "error", ...}
+    """
+    session = chat_sessions.get(session_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                incoming = json.loads(message.get("text") or message.get("bytes") or "")
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                await websocket.send_json({"type": "error", "detail": "Invalid JSON"})
+                continue
+            if not isinstance(incoming, dict):
+                await websocket.send_json({"type": "error", "detail": "Expected a JSON object"})
+                continue
+
+            context = incoming.get("context")
+            if context:
+                if not isinstance(context, dict):
+                    await websocket.send_json({"type": "error", "detail": "context must be an object"})
+                    continue
+                # CookingMode moves between steps without opening a new session
+                session.context.update(context)
+
+            text_input = str(incoming.get("message", "")).strip()
+            if not text_input:
+                await websocket.send_json({"type": "error", "detail": "Empty message"})
+                continue
+
+            # Re-fetch so an active socket keeps the session from being evicted as idle
+            if chat_sessions.get(session_id) is None:
+                await websocket.send_json({"type": "error", "detail": "Chat session expired"})
+                await websocket.close(code=4404)
+                return
+
+            image_ids = incoming.get("image_ids") or []
+            if not isinstance(image_ids, list):
+                await websocket.send_json({"type": "error", "detail": "image_ids must be a list"})
+                continue
+
+            try:
+                payload = build_session_chat_payload(session, text_input, image_ids)
+            except KeyError as e:
+                await websocket.send_json({"type": "error", "detail": f"Unknown image id {e}"})
+                continue
+
+            reply_tokens = []
+            async for kind, data in iterate_in_threadpool(stream_openrouter_with_fallback(payload)):
+                if kind == "token":
+                    reply_tokens.append(data)
+                    await websocket.send_json({"type": "token", "token": data})
+                elif kind == "done":
+                    print(f"Chat session stream ({data['model']}): ttft={data['ttft_ms']}ms total={data['total_ms']}ms")
+                    await websocket.send_json({"type": "done", **data})
+                else:
+                    print(f"Error during chat session stream: {data}")
+                    await websocket.send_json({"type": "error", "detail": data})
+
+            if reply_tokens:
+                session.add_message("user", text_input)
+                session.add_message("assistant", "".join(reply_tokens))
+
+    except WebSocketDisconnect:
+        pass
+
 @app.get("/recipe/{recipe_id}", response_model=Recipe)
-def get_recipe_details(recipe_id: int):
-    # mongo_recipes = get_recipe_collection()
-    # if mongo_recipes is not None:
-    #     doc = mongo_recipes.find_one({"Srno": recipe_id})
-    #     if doc:
-    #         return process_recipe_row(doc, user_ingredients_list=[])
-    
-    if df_english is None:
+def get_recipe_details(recipe_id: int, lang: Optional[str] = None):
+    if recipe_store is None:
          raise HTTPException(status_code=503, detail="Model not loaded")
          
-    row = df_english[df_english['Srno'] == recipe_id]
-    if row.empty:
+    row = recipe_store.get(recipe_id)
+    if row is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
         
-    return process_recipe_row(row.iloc[0], user_ingredients_list=[])
+    return localize_recipe(process_recipe_row(row, user_ingredients_list=[]), lang)
 
 @app.post("/translate")
-def translate_text(request: TranslationRequest):
-    def _translate():
-        return GoogleTranslator(source='auto', target=request.target_lang).translate(request.text)
-
+def translate_text_endpoint(request: TranslationRequest):
     try:
-        translated = execute_with_retry(_translate, retries=3, delay=1)
-        if not translated:
-            return {"translated_text": request.text}
-        return {"translated_text": translated}
+        return {"translated_text": translate_text(request.text, request.target_lang)}
     except Exception as e:
         print(f"Translation error after retries: {e}")
         return {"translated_text": request.text}
 
+@app.post("/translate/batch")
+def translate_batch_endpoint(request: TranslationBatchRequest):
+    """Translates all steps of a recipe; cached entries never leave the server."""
+    try:
+        translations, cached = translate_texts(request.texts, request.target_lang)
+        return {"translations": translations, "cached": cached}
+    except Exception as e:
+        print(f"Batch translation error: {e}")
+        return {"translations": request.texts, "cached": 0}
+
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -1119,54 +1350,244 @@ def forgot_password(request: ForgotPasswordRequest):
     return {"message": "If this email is registered, a recovery link has been sent."}
 
 @app.post("/reset-password")
-def reset_password(request: ResetPasswordRequest):
-    users_collection = get_users_collection()
-    if users_collection is None:
-        raise HTTPException(status_code=503, detail="Database unavailable")
-
+async def reset_password(request: ResetPasswordRequest):
     try:
         email = base64.urlsafe_b64decode(request.token).decode()
     except:
         raise HTTPException(status_code=400, detail="Invalid token")
         
-    user = users_collection.find_one({"email": email})
-    if not user:
+    repository = get_repository()
+    if not await repository.email_exists(email):
         raise HTTPException(status_code=404, detail="User not found")
         
-    new_hash = get_password_hash(request.new_password)
-    users_collection.update_one({"email": email}, {"$set": {"hashed_password": new_hash}})
+    new_hash = await password_hasher.hash(request.new_password)
+    await repository.set_password_hash(email, new_hash)
+    invalidate_user(email)
     return {"message": "Password updated successfully"}
 
 @app.get("/admin/users")
-def get_all_users(current_user: UserInDB = Depends(get_current_user)):
+async def get_all_users(
+    sort: str = "email",
+    order: str = "asc",
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = ADMIN_PAGE_SIZE,
+    current_user: UserInDB = Depends(get_current_user)
+):
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
     
-    users_collection = get_users_collection()
-    users = list(users_collection.find())
+    # Served from the materialized stats; counts lag by less than twice ADMIN_STATS_REFRESH_SECONDS
+    repository = get_repository()
+    limit = max(1, min(limit, ADMIN_MAX_PAGE_SIZE))
+    (rows, next_cursor), summary = await asyncio.gather(
+        repository.user_stats_page(sort, order, search, cursor, limit),
+        repository.user_stats_summary()
+    )
+    refreshed_at = summary.get("refreshed_at")
+    return {
+        "users": [to_api_row(row) for row in rows],
+        "next_cursor": next_cursor,
+        "summary": {
+            "total_users": summary.get("total_users", 0),
+            "total_interactions": summary.get("total_interactions", 0),
+            "total_likes": summary.get("total_likes", 0),
+            "refreshed_at": refreshed_at.isoformat() if refreshed_at else None
+        }
+    }
+
+@app.post("/admin/users/refresh")
+async def refresh_admin_user_stats(current_user: UserInDB = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    if not await get_repository().refresh_user_stats(force=True):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A refresh is already running")
+    return {"message": "User stats refreshed"}
+
+@app.get("/admin/users/export")
+async def export_users(format: str = "csv", search: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
     
-    stats = []
-    for u in users:
-        interactions = u.get("interactions", [])
-        likes = sum(1 for i in interactions if isinstance(i, dict) and i.get('action') == 'like')
-        stats.append({
-            "email": u["email"],
-            "id": str(u.get("_id", "unknown")),
-            "is_admin": u.get("is_admin", False),
-            "joined_at": "2024-01-01", 
-            "total_interactions": len(interactions),
-            "total_likes": likes
-        })
-        
-    return stats
+    # Streams page by page, so memory stays flat however many users there are
+    rows = get_repository().iter_user_stats(search)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_rows(rows, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=users.{format}"}
+    )
+
+@app.get("/admin/interaction-buffer")
+def get_interaction_buffer_stats(current_user: UserInDB = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    return interaction_buffer.stats()
+
+@app.get("/admin/hashing")
+def get_hashing_stats(current_user: UserInDB = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    return password_hasher.stats()
+
+@app.get("/admin/recipe-store")
+def get_recipe_store_stats(current_user: UserInDB = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    if recipe_store is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return recipe_store.stats()
+
+@app.get("/admin/enrichment")
+def get_enrichment_stats(current_user: UserInDB = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    return enrichment_executor.stats()
+
+@app.get("/admin/single-flight")
+def get_single_flight_stats(current_user: UserInDB = Depends(get_current_user)):
+    """Per upstream: calls made, calls actually sent, and calls suppressed by coalescing."""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    return single_flight_stats()
+
+@app.get("/admin/db-stats")
+def get_db_stats(current_user: UserInDB = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have admin privileges")
+    return get_repository().query_stats.snapshot()
+
+def start_sharded_scorer():
+    global sharded_scorer
+    from sharded_scorer import ShardedScorer, SCORER_SHARDS
+    if SCORER_SHARDS <= 0 or tfidf_index is None or recipe_store is None:
+        return
+    scoring = recipe_store.scoring
+    scorer = ShardedScorer(
+        tfidf_index.matrix, scoring['PrepTimeInMins'].values, scoring['CookTimeInMins'].values,
+        shards=SCORER_SHARDS, scale=tfidf_index.scale, normalized=tfidf_index.normalized
+    )
+    try:
+        scorer.start()
+    except Exception as e:
+        print(f"Sharded scorer failed to start ({e}). Scoring in-process.")
+        scorer.shutdown()
+        return
+    sharded_scorer = scorer
+
+@app.exception_handler(DatabaseUnavailable)
+async def database_unavailable_handler(request: Request, exc: DatabaseUnavailable):
+    return JSONResponse(status_code=503, content={"detail": "Database unavailable"})
+
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request: Request, exc: HashingBusy):
+    return JSONResponse(status_code=503, content={"detail": "Server busy, try again shortly"}, headers={"Retry-After": "1"})
+
+async def warm_start():
+    """
+    Loads what requests need while the server is already answering /healthz.
+    Independent phases run in parallel; /readyz turns 200 once the required ones are done.
+    """
+    await asyncio.gather(
+        startup_report.run("model", load_model),
+        startup_report.run("nltk_data", tokenizer.load),
+        startup_report.run("recipe_translations", load_recipe_translations),
+        startup_report.run("local_detector", start_local_detector),
+        startup_report.run_async("database", prepare_database()),
+    )
+    await startup_report.run("sharded_scorer", start_sharded_scorer)
+    await startup_report.run("warmup", warm_up)
+    startup_report.finish()
+
+def start_local_detector():
+    global yolo_model
+    yolo_model = load_local_detector()
+
+async def prepare_database():
+    repository = get_repository()
+    await repository.ping()
+    # The unique index on users.email must exist before the first registration
+    await repository.ensure_indexes()
+
+async def start_data_layer():
+    # Replays anything left in the spool by a previous crash; flushes run on this loop
+    interaction_buffer.start(asyncio.get_running_loop())
+    app.state.user_cache_watcher = asyncio.create_task(watch_user_changes(get_repository()))
+    app.state.admin_stats_refresher = asyncio.create_task(refresh_user_stats_periodically(get_repository()))
+    await startup_report.run("password_hasher", password_hasher.start)
+    app.state.warm_start = asyncio.create_task(warm_start())
+
+async def stop_data_layer():
+    app.state.warm_start.cancel()
+    app.state.user_cache_watcher.cancel()
+    app.state.admin_stats_refresher.cancel()
+    # The flusher needs the event loop to finish, so wait for it from a thread
+    await run_in_threadpool(interaction_buffer.shutdown)
+    await get_repository().close()
+    await run_in_threadpool(password_hasher.shutdown)
+    enrichment_executor.shutdown()
+    if sharded_scorer is not None:
+        await run_in_threadpool(sharded_scorer.shutdown)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, whether or not it is ready."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once the READY_PHASES have loaded, 503 with per-phase timings until then."""
+    report = startup_report.as_dict()
+    # Still ready, but tokenising is degraded until the NLTK data is shipped
+    if tokenizer.fallbacks():
+        report["tokenizer_fallbacks"] = tokenizer.fallbacks()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+# Gauges and counters kept by other components, read at scrape time
+def _caches():
+    caches = {"token_claims": token_claims_cache, "user_profile": user_profile_cache}
+    if recipe_store is not None and hasattr(recipe_store, "cache"):
+        caches["recipe_docs"] = recipe_store.cache
+    return caches
+
+def _threadpool_statistics():
+    # anyio's limiter for run_in_threadpool; only readable from the event loop thread
+    import anyio.to_thread
+    return anyio.to_thread.current_default_thread_limiter().statistics()
+
+registry.callback("cache_hits_total", "Cache hits.", lambda: {name: c.hits for name, c in _caches().items()}, ["cache"], "counter")
+registry.callback("cache_misses_total", "Cache misses.", lambda: {name: c.misses for name, c in _caches().items()}, ["cache"], "counter")
+registry.callback("cache_hit_ratio", "Hits over lookups since start.", lambda: {
+    name: round(c.hits / (c.hits + c.misses), 4) for name, c in _caches().items() if c.hits + c.misses
+}, ["cache"])
+registry.callback("threadpool_busy", "Threadpool workers running handlers.", lambda: _threadpool_statistics().borrowed_tokens)
+registry.callback("threadpool_size", "Threadpool worker limit.", lambda: _threadpool_statistics().total_tokens)
+registry.callback("threadpool_queue_depth", "Calls waiting for a threadpool worker.", lambda: _threadpool_statistics().tasks_waiting)
+registry.callback("enrichment_queue_depth", "Enrichment tasks waiting for a worker.", lambda: enrichment_executor.stats()["queue_depth"])
+registry.callback("enrichment_running", "Enrichment tasks running.", lambda: enrichment_executor.stats()["running"])
+registry.callback("password_hashing_in_flight", "Hash/verify jobs queued or running.", lambda: password_hasher.stats()["in_flight"])
+registry.callback("recipe_store_missing_rows_total", "Recommended or requested recipes missing their display fields.",
+                  lambda: recipe_store.missing_rows if recipe_store is not None else None, kind="counter")
+registry.callback("interaction_buffer_events", "Interactions waiting to be flushed.", lambda: interaction_buffer.stats()["buffered"])
+registry.callback("traces_exported_total", "Traces written by the trace exporter.", lambda: trace_exporter.exported, kind="counter")
+registry.callback("traces_dropped_total", "Traces dropped because the export queue was full.", lambda: trace_exporter.dropped, kind="counter")
+registry.callback("single_flight_calls_total", "Calls made through single-flight.",
+                  lambda: {name: s["calls"] for name, s in single_flight_stats().items()}, ["upstream"], "counter")
+registry.callback("single_flight_suppressed_total", "Calls that joined an identical in-flight call.",
+                  lambda: {name: s["suppressed"] for name, s in single_flight_stats().items()}, ["upstream"], "counter")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text format. Async so the threadpool gauges read this event loop's limiter."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/admin/promote")
-def promote_user(email: str):
-    users_collection = get_users_collection()
-    user = users_collection.find_one({"email": email})
-    if not user:
+async def promote_user(email: str):
+    if not await get_repository().set_admin(email):
         raise HTTPException(status_code=404, detail="User not found")
-    users_collection.update_one({"email": email}, {"$set": {"is_admin": True}})
+    invalidate_user(email)
     return {"message": f"User {email} is now an admin"}
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+"""
+In-process metrics, served in the Prometheus text format at /metrics.
+
+Histograms keep fixed cumulative buckets per label set behind one lock, so
+an observation costs a bisect and a few additions. Values that already
+live elsewhere (queue depths, cache hits, single-flight counters) are read
+from callbacks at scrape time instead of being updated on the hot path.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from tracing import span
+
+# Seconds; covers sub-millisecond scoring up to slow LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (made cumulative on render), then sum and count
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {values[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    A gauge or counter whose values come from `fn` at scrape time. `fn`
+    returns a number, or a dict of label value (or tuple of them) -> number.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable, labels: Sequence[str] = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label_names = tuple(labels)
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} unavailable: {e}")
+            return []
+        if values is None:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name: str, help: str, fn: Callable, labels: Sequence[str] = (), kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, fn, labels, kind))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+RECOMMEND_STAGE_SECONDS = registry.histogram(
+    "recommend_stage_seconds", "Time spent in each /recommend stage.", ["stage"])
+DETECT_STAGE_SECONDS = registry.histogram(
+    "detect_stage_seconds", "Time spent in each /detect-ingredients stage.", ["stage"])
+DEPENDENCY_SECONDS = registry.histogram(
+    "dependency_call_seconds", "Latency of outbound calls by dependency, target and outcome.",
+    ["dependency", "target", "outcome"])
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_seconds", "Request latency by route template, method and status.", ["route", "method", "status"])
+
+
+class _Call:
+    def __init__(self):
+        self.outcome = "ok"
+
+
+@contextmanager
+def track_dependency(dependency: str, target: str):
+    """
+    Times one outbound call into dependency_call_seconds and traces it as a
+    span. The outcome is "error" if the block raises; callers can set
+    `call.outcome` themselves (e.g. to an HTTP status).
+    """
+    call = _Call()
+    with span(f"{dependency}:{target}", dependency=dependency) as call_span:
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            call.outcome = "error"
+            raise
+        finally:
+            DEPENDENCY_SECONDS.observe(time.perf_counter() - start, dependency, target, call.outcome)
+            call_span.set("outcome", call.outcome)
@@ -0,0 +1,105 @@
+"""
+One-off migration: moves the embedded users.interactions arrays into the
+bucketed interaction_buckets collection and builds interaction_counters.
+
+Each user is migrated and then has its embedded array removed, so the
+script can be re-run after an interruption without duplicating events.
+
+Usage:
+    python migrate_interactions.py [--dry-run]
+"""
+import argparse
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from database import get_users_collection, get_interaction_buckets_collection, get_interaction_counters_collection
+from interaction_store import BUCKET_SIZE, ensure_indexes, make_event
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return datetime(1970, 1, 1)
+
+
+def build_user_documents(email, interactions):
+    events = []
+    for i in interactions:
+        if not isinstance(i, dict) or not i.get("action"):
+            continue
+        events.append(make_event(i["action"], i.get("recipe_name", ""), i.get("details"), parse_timestamp(i.get("timestamp"))))
+    events.sort(key=lambda e: e["ts"])
+
+    buckets = []
+    for event in events:
+        period = event["ts"].strftime("%Y-%m")
+        if not buckets or buckets[-1]["period"] != period or buckets[-1]["count"] >= BUCKET_SIZE:
+            buckets.append({"user_email": email, "period": period, "count": 0, "events": [],
+                            "first_ts": event["ts"], "last_ts": event["ts"]})
+        bucket = buckets[-1]
+        bucket["events"].append(event)
+        bucket["count"] += 1
+        bucket["last_ts"] = event["ts"]
+
+    actions, liked = {}, []
+    for event in events:
+        actions[event["action"]] = actions.get(event["action"], 0) + 1
+        if event["action"] == "like" and event["recipe_name"] not in liked:
+            liked.append(event["recipe_name"])
+        elif event["action"] == "unlike" and event["recipe_name"] in liked:
+            liked.remove(event["recipe_name"])
+    counters = {"total": len(events), "actions": actions, "liked_recipes": liked}
+    return buckets, counters
+
+
+def migrate(dry_run=False):
+    users = get_users_collection()
+    buckets_collection = get_interaction_buckets_collection()
+    counters_collection = get_interaction_counters_collection()
+    if users is None:
+        print("MongoDB not connected. Aborting.")
+        return
+
+    if not dry_run:
+        ensure_indexes()
+
+    migrated_users = migrated_events = 0
+    cursor = users.find({"interactions": {"$exists": True}}, {"email": 1, "interactions": 1})
+    for user in cursor:
+        buckets, counters = build_user_documents(user["email"], user.get("interactions") or [])
+        migrated_users += 1
+        migrated_events += counters["total"]
+        if dry_run:
+            print(f"[dry-run] {user['email']}: {counters['total']} events -> {len(buckets)} buckets")
+            continue
+
+        # Replace anything a previous interrupted run wrote for this user
+        buckets_collection.delete_many({"user_email": user["email"], "migrated": True})
+        if buckets:
+            for bucket in buckets:
+                bucket["migrated"] = True
+            buckets_collection.insert_many(buckets, ordered=False)
+        try:
+            # The 'migrated' guard keeps a re-run from counting the same user twice
+            counters_collection.update_one(
+                {"_id": user["email"], "migrated": {"$ne": True}},
+                {"$inc": {"total": counters["total"], **{f"actions.{a}": n for a, n in counters["actions"].items()}},
+                 "$addToSet": {"liked_recipes": {"$each": counters["liked_recipes"]}},
+                 "$set": {"migrated": True}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+        users.update_one({"_id": user["_id"]}, {"$unset": {"interactions": ""}})
+
+    print(f"{'Would migrate' if dry_run else 'Migrated'} {migrated_events} events for {migrated_users} users.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded interactions into the bucketed event store.")
+    parser.add_argument("--dry-run", action="store_true")
+    migrate(parser.parse_args().dry_run)
@@ -1,68 +1,267 @@
+"""
+Bulk loader for the recipe catalog.
 
-import pickle
-import pandas as pd
-from pymongo import MongoClient
+Streams recipes from the pickled model (or a CSV export) in fixed-size
+chunks and upserts each chunk by Srno with an unordered bulk write, spread
+over several workers. Finished chunks are recorded in a checkpoint file, so
+an interrupted load resumes where it stopped. Secondary indexes are built
+once the data is in, and a verification pass compares the document count
+and an order-independent checksum against the source. A passing
+verification records a marker in 'migrations', which the server requires
+before serving display fields from Mongo; a load in progress removes it.
+
+Usage:
+    python migrate_to_mongo.py [--source recipe_recommender_model.pkl | recipes.csv]
+                               [--chunk-size 1000] [--workers 4] [--restart]
+                               [--dry-run] [--verify-only] [--no-verify]
+"""
+import argparse
+import hashlib
+import json
 import os
+import pickle
 import sys
+import threading
+import time
+import concurrent.futures
+from datetime import datetime
+
+import pandas as pd
+from pymongo import ASCENDING, MongoClient, UpdateOne
 
 # Constants
 MODEL_PATH = "recipe_recommender_model.pkl"
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = "ai_cooking_db"
 COLLECTION_NAME = "recipes"
+MIGRATIONS_COLLECTION = "migrations"
+MARKER_ID = "recipes"  # recipe_store.CATALOG_MARKER_ID
+CHECKPOINT_PATH = "recipes_load.checkpoint.json"
 
-def migrate():
-    # 1. Load Data
-    print(f"Loading model from {MODEL_PATH}...")
-    if not os.path.exists(MODEL_PATH):
-        print("Model file not found!")
-        sys.exit(1)
-        
-    with open(MODEL_PATH, 'rb') as f:
-        model_data = pickle.load(f)
-        
-    df = model_data['dataframe']
-    print(f"Loaded {len(df)} recipes from pickle.")
-    
-    # 2. Connect to Mongo
-    print(f"Connecting to MongoDB at {MONGO_URI}...")
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    collection = db[COLLECTION_NAME]
-    
-    # 3. Check existing
-    count = collection.count_documents({})
-    if count > 0:
-        print(f"Collection '{COLLECTION_NAME}' already has {count} documents.")
-        choice = input("Do you want to clear the collection and re-import? (y/n): ")
-        if choice.lower() == 'y':
-            collection.delete_many({})
-            print("Collection cleared.")
-        else:
-            print("Aborting migration.")
+# Built after the load; the unique Srno index is created up front because every upsert looks it up
+POST_LOAD_INDEXES = [
+    [("Cuisine", ASCENDING), ("Course", ASCENDING), ("Diet", ASCENDING)],
+    [("RecipeName", ASCENDING)],
+]
+
+
+def source_signature(path: str) -> dict:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def iter_chunks(path: str, chunk_size: int):
+    """Yields (chunk number, records). Records are plain dicts with NaN mapped to None."""
+    if path.endswith(".csv"):
+        frames = pd.read_csv(path, chunksize=chunk_size)
+    else:
+        # A pickle can only be loaded whole, but records are still built one chunk at a time
+        with open(path, "rb") as f:
+            df = pickle.load(f)["dataframe"]
+        frames = (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+
+    for number, frame in enumerate(frames):
+        frame = frame.astype(object).where(pd.notnull(frame), None)
+        yield number, frame.to_dict(orient="records")
+
+
+def doc_digest(doc: dict, fields) -> int:
+    canonical = json.dumps({k: doc.get(k) for k in fields}, sort_keys=True, default=str)
+    return int.from_bytes(hashlib.sha1(canonical.encode("utf-8")).digest()[:8], "big")
+
+
+class Checksum:
+    """Count plus XOR of per-document digests, so document order doesn't matter."""
+
+    def __init__(self):
+        self.count = 0
+        self.value = 0
+
+    def add(self, doc: dict, fields):
+        self.count += 1
+        self.value ^= doc_digest(doc, fields)
+
+    def __eq__(self, other):
+        return self.count == other.count and self.value == other.value
+
+    def __str__(self):
+        return f"{self.count} docs, checksum {self.value:016x}"
+
+
+class LoadCheckpoint:
+    def __init__(self, path: str, signature: dict, chunk_size: int, restart: bool = False):
+        self.path = path
+        self.signature = signature
+        self.chunk_size = chunk_size
+        self.done = set()
+        self._lock = threading.Lock()
+        if restart or not os.path.exists(path):
             return
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("source") != signature or state.get("chunk_size") != chunk_size:
+            print("Checkpoint belongs to a different source or chunk size. Use --restart to start over.")
+            sys.exit(1)
+        self.done = set(state.get("done", []))
+
+    def mark_done(self, number: int):
+        with self._lock:
+            self.done.add(number)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"source": self.signature, "chunk_size": self.chunk_size, "done": sorted(self.done)}, f)
+            # Atomic swap so a crash never leaves a half-written checkpoint
+            os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def upsert_chunk(collection, number: int, records: list, retries: int = 3) -> int:
+    ops = [UpdateOne({"Srno": record["Srno"]}, {"$set": record}, upsert=True) for record in records]
+    for attempt in range(retries):
+        try:
+            if collection is not None:
+                collection.bulk_write(ops, ordered=False)
+            return len(ops)
+        except Exception as e:
+            # Upserts are idempotent, so the whole chunk can simply be retried
+            print(f"Chunk {number} attempt {attempt + 1}/{retries} failed: {e}")
+            time.sleep(attempt + 1)
+    raise RuntimeError(f"Chunk {number} failed after {retries} attempts")
+
+
+def load(args, collection, fields_seen):
+    # A dry run neither reads nor advances the checkpoint
+    restart = args.restart or collection is None
+    checkpoint = LoadCheckpoint(args.checkpoint, source_signature(args.source), args.chunk_size, restart)
+    if checkpoint.done:
+        print(f"Resuming: {len(checkpoint.done)} chunks already loaded.")
+
+    if collection is not None:
+        collection.create_index("Srno", unique=True)
+
+    loaded = 0
+    started = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        in_flight = {}
+
+        def collect(finished):
+            nonlocal loaded
+            for future in finished:
+                number = in_flight.pop(future)
+                loaded += future.result()
+                if collection is not None:
+                    checkpoint.mark_done(number)
+            elapsed = time.time() - started
+            print(f"{loaded} docs {'checked' if collection is None else 'upserted'} ({loaded / max(elapsed, 1e-9):.0f} docs/s)")
+
+        for number, records in iter_chunks(args.source, args.chunk_size):
+            if records:
+                fields_seen.update(records[0].keys())
+            if number in checkpoint.done:
+                continue
+            in_flight[executor.submit(upsert_chunk, collection, number, records)] = number
+            # Only a few chunks in memory at a time
+            if len(in_flight) >= args.workers * 2:
+                finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                collect(finished)
+        collect(concurrent.futures.as_completed(list(in_flight)))
+
+    elapsed = time.time() - started
+    print(f"Load finished: {loaded} docs in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.0f} docs/s).")
+    return checkpoint
+
+
+def build_indexes(collection):
+    for keys in POST_LOAD_INDEXES:
+        start = time.time()
+        name = collection.create_index(keys)
+        print(f"Index {name} built in {time.time() - start:.1f}s.")
+
+
+def record_marker(markers, expected: "Checksum", signature: dict):
+    markers.replace_one({"_id": MARKER_ID}, {
+        "_id": MARKER_ID,
+        "count": expected.count,
+        "checksum": f"{expected.value:016x}",
+        "source": signature,
+        "verified_at": datetime.utcnow(),
+    }, upsert=True)
+    print(f"Recorded verified load of {expected.count} recipes.")
+
+
+def verify(args, collection, markers) -> bool:
+    print("Verifying against source...")
+    fields = None
+    expected = Checksum()
+    for _, records in iter_chunks(args.source, args.chunk_size):
+        for record in records:
+            # Every record from a DataFrame has the same columns
+            fields = fields or sorted(record.keys())
+            expected.add(record, fields)
+    fields = fields or []
+
+    actual = Checksum()
+    # Project to the source columns; fields added later (e.g. translations) don't count
+    projection = {field: 1 for field in fields}
+    projection["_id"] = 0
+    for doc in collection.find({}, projection, batch_size=args.chunk_size):
+        actual.add(doc, fields)
+
+    print(f"Source:     {expected}")
+    print(f"Collection: {actual}")
+    if expected == actual:
+        print("Verification passed.")
+        record_marker(markers, expected, source_signature(args.source))
+        return True
+    print("Verification FAILED.")
+    markers.delete_one({"_id": MARKER_ID})
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the recipe catalog into MongoDB.")
+    parser.add_argument("--source", default=MODEL_PATH, help="Pickled model or CSV export")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and load everything")
+    parser.add_argument("--dry-run", action="store_true", help="Read and convert every chunk without writing")
+    parser.add_argument("--verify-only", action="store_true")
+    parser.add_argument("--no-verify", action="store_true")
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"Source {args.source} not found!")
+        sys.exit(1)
+
+    if args.dry_run:
+        fields = set()
+        load(args, None, fields)
+        print(f"Dry run: nothing written. Columns: {sorted(fields)}")
+        return
+
+    print(f"Connecting to MongoDB at {args.mongo_uri}...")
+    client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)
+    collection = client[DB_NAME][COLLECTION_NAME]
+    markers = client[DB_NAME][MIGRATIONS_COLLECTION]
+
+    if not args.verify_only:
+        # The catalog is about to change; servers fall back to the DataFrame until it verifies again
+        markers.delete_one({"_id": MARKER_ID})
+        checkpoint = load(args, collection, set())
+        build_indexes(collection)
+    if args.no_verify:
+        return
+    if not verify(args, collection, markers):
+        sys.exit(1)
+    if not args.verify_only:
+        # Only a verified load is considered finished
+        checkpoint.clear()
 
-    # 4. Convert DataFrame to Records
-    print("Converting DataFrame to dictionary records...")
-    # Convert NaNs to None/null for valid JSON
-    df_clean = df.where(pd.notnull(df), None)
-    records = df_clean.to_dict(orient='records')
-    
-    # Ensure ID match (Srno -> _id if we want, or just verify Srno exists)
-    # Let's keep _id as Mongo's ObjectId for internal use, and index Srno
-    
-    # 5. Insert
-    print(f"Inserting {len(records)} records...")
-    if records:
-        collection.insert_many(records)
-        
-    # 6. Indexing
-    print("Creating index on 'Srno'...")
-    collection.create_index("Srno", unique=True)
-    
-    # 7. Verify
-    new_count = collection.count_documents({})
-    print(f"Migration Complete. Total documents in DB: {new_count}")
 
 if __name__ == "__main__":
-    migrate()
+    main()
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import time
+
+import requests
+from fastapi import HTTPException
+
+from metrics import track_dependency
+from single_flight import get_flight
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Ordered by preference
+VISION_MODELS = [
+    "allenai/molmo-2-8b:free",
+    "google/gemini-2.0-flash-exp:free",
+    "google/gemma-3-27b-it:free",
+    "nvidia/nemotron-nano-12b-v2-vl:free",
+    "qwen/qwen-2.5-vl-7b-instruct:free",
+    "meta-llama/llama-3.2-11b-vision-instruct:free"
+]
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://localhost:8000", # Required by OpenRouter
+        "X-Title": "LocalDev" # Required by OpenRouter
+    }
+
+
+# Identical concurrent prompts (same messages and image) share one request
+openrouter_flight = get_flight("openrouter")
+
+
+def payload_key(payload: dict) -> str:
+    # "model" is overwritten while falling back, so it isn't part of the request identity
+    body = {k: v for k, v in payload.items() if k != "model"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def call_openrouter_with_fallback(payload: dict):
+    return openrouter_flight.do(payload_key(payload), _call_openrouter_with_fallback, payload)
+
+
+def _call_openrouter_with_fallback(payload: dict):
+    headers = _headers()
+
+    last_exception = None
+
+    for model in VISION_MODELS:
+        payload["model"] = model
+        print(f"Trying model: {model}")
+
+        for attempt in range(3):  # retry 3 times per model
+            try:
+                with track_dependency("openrouter", model) as call:
+                    response = requests.post(
+                        OPENROUTER_URL,
+                        json=payload,
+                        headers=headers,
+                        timeout=60
+                    )
+                    call.outcome = str(response.status_code)
+
+                if response.status_code == 200:
+                    data = response.json()
+                    if "choices" in data and len(data["choices"]) > 0:
+                        return data, model
+                    else:
+                        print(f"Model {model} returned 200 but missing 'choices' or empty: {data}")
+                        # Treat as error to try next model
+                        last_exception = f"Model {model} returned invalid response format"
+                        break # Try next model
+
+                # Rate limit → retry with backoff
+                if response.status_code == 429:
+                    wait_time = (attempt + 1) * 2  # 2s, 4s, 6s
+                    print(f"Rate limited on {model}, retrying in {wait_time}s...")
+                    time.sleep(wait_time)
+                    continue
+
+                # 404 Not Found → Skip immediately
+                if response.status_code == 404:
+                    print(f"Model {model} not found (404). Skipping.")
+                    break # Break inner loop to try next model
+
+                # Other errors → log and break to next model
+                print(f"Error {response.status_code} with {model}: {response.text}")
+                last_exception = f"Error {response.status_code}: {response.text}"
+                break # Break inner loop to try next model
+
+            except Exception as e:
+                print(f"Exception with {model}: {e}")
+                last_exception = str(e)
+                # Don't break immediately on connection errors, maybe retry?
+                # For now let's retry on exception too
+                time.sleep(2)
+
+    # If all models fail
+    raise HTTPException(
+        status_code=500,
+        detail=f"All models failed. Last error: {last_exception}"
+    )
+
+
+def _iter_stream_tokens(response):
+    """Yields content deltas from an OpenRouter SSE response body."""
+    for raw_line in response.iter_lines(decode_unicode=True):
+        if not raw_line or not raw_line.startswith("data:"):
+            # Blank separators and ": OPENROUTER PROCESSING" keep-alive comments
+            continue
+        data = raw_line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        chunk = json.loads(data)
+        if "error" in chunk:
+            raise RuntimeError(chunk["error"].get("message", str(chunk["error"])))
+        choices = chunk.get("choices") or []
+        if not choices:
+            continue
+        token = (choices[0].get("delta") or {}).get("content")
+        if token:
+            yield token
+
+
+def stream_openrouter_with_fallback(payload: dict):
+    """
+    Streaming counterpart of call_openrouter_with_fallback.
+
+    Yields ("token", text) tuples as they arrive and finishes with a single
+    ("done", stats) tuple carrying the model, time-to-first-token and total
+    duration. Models are only swapped while nothing has been sent to the
+    caller; a failure after the first token ends the stream with ("error", message).
+    """
+    headers = _headers()
+    payload = dict(payload, stream=True)
+    started = time.perf_counter()
+    last_exception = None
+
+    for model in VISION_MODELS:
+        payload["model"] = model
+        print(f"Trying model (stream): {model}")
+
+        for attempt in range(3):
+            first_token_at = None
+            try:
+                # Timed up to the response headers; the token stream itself is open-ended
+                with track_dependency("openrouter", model) as call:
+                    response = requests.post(OPENROUTER_URL, json=payload, headers=headers, timeout=60, stream=True)
+                    call.outcome = str(response.status_code)
+                with response:
+                    if response.status_code == 429:
+                        wait_time = (attempt + 1) * 2
+                        print(f"Rate limited on {model}, retrying in {wait_time}s...")
+                        time.sleep(wait_time)
+                        continue
+                    if response.status_code != 200:
+                        print(f"Error {response.status_code} with {model}: {response.text}")
+                        last_exception = f"Error {response.status_code}: {response.text}"
+                        break
+
+                    for token in _iter_stream_tokens(response):
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        yield "token", token
+
+                if first_token_at is None:
+                    print(f"Model {model} streamed no content. Skipping.")
+                    last_exception = f"Model {model} returned an empty stream"
+                    break
+
+                total_ms = (time.perf_counter() - started) * 1000
+                ttft_ms = (first_token_at - started) * 1000
+                print(f"Stream from {model}: first token {ttft_ms:.0f}ms, total {total_ms:.0f}ms")
+                yield "done", {"model": model, "ttft_ms": round(ttft_ms), "total_ms": round(total_ms)}
+                return
+
+            except Exception as e:
+                print(f"Exception with {model} (stream): {e}")
+                last_exception = str(e)
+                if first_token_at is not None:
+                    # Tokens already reached the client; switching models would garble the reply.
+                    yield "error", f"Stream interrupted: {e}"
+                    return
+                time.sleep(2)
+
+    yield "error", f"All models failed. Last error: {last_exception}"
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,201 @@
+"""
+Offline optimisation pass for the recommender artifact.
+
+Reads recipe_recommender_model.pkl and writes a compact copy:
+  - scores cast to float32, sparse indices to int32
+  - vocabulary terms found in fewer than --min-df recipes pruned from both
+    the matrix and the vectorizer (vocabulary_, idf_)
+  - rows L2-normalised, so serving uses a sparse dot product
+  - optionally weights quantised to 8 bits (--quantize)
+
+It then ranks sample pantries both ways the way the API does (ingredient
+cleaning and tokenising from ranking.py, then the combined ingredient and
+time score) and reports how many top-9 results change, plus memory and
+latency deltas. The output is only written if at least --min-identical of
+the queries keep the same top-9. Serve the result with MODEL_PATH=<output>.
+
+With --scoring-only the DataFrame is replaced by its scoring columns, so
+workers don't unpickle display fields they fetch from Mongo anyway. Such a
+model needs a verified catalog load (migrate_to_mongo.py) to serve.
+
+Usage:
+    python optimize_model.py [--min-df 2] [--quantize] [--queries 500] [--scoring-only]
+                             [--min-identical 0.9] [--force]
+                             [--output recipe_recommender_model.compact.pkl]
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+import copy
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+import tokenizer
+from ranking import clean_ingredients, combined_similarity, query_text
+from recipe_store import scoring_frame
+from tfidf_index import TfidfIndex
+
+MODEL_PATH = "recipe_recommender_model.pkl"
+OUTPUT_PATH = "recipe_recommender_model.compact.pkl"
+TOP_N = 9
+
+
+def prune_vocabulary(vectorizer, matrix, min_df: int):
+    """Drops columns present in fewer than min_df rows; returns (vectorizer, matrix, kept columns)."""
+    doc_freq = np.diff(matrix.tocsc().indptr)
+    keep = np.flatnonzero(doc_freq >= min_df)
+
+    pruned = copy.deepcopy(vectorizer)
+    old_to_new = {old: new for new, old in enumerate(keep)}
+    pruned.vocabulary_ = {term: old_to_new[idx] for term, idx in vectorizer.vocabulary_.items() if idx in old_to_new}
+    if getattr(vectorizer, "idf_", None) is not None:
+        pruned.idf_ = vectorizer.idf_[keep]
+        # Newer sklearn validates the input width against the inner transformer
+        transformer = getattr(pruned, "_tfidf", None)
+        if hasattr(transformer, "n_features_in_"):
+            transformer.n_features_in_ = len(keep)
+    # Only kept for introspection, and can be larger than the vocabulary itself
+    if hasattr(pruned, "stop_words_"):
+        delattr(pruned, "stop_words_")
+    return pruned, matrix[:, keep], keep
+
+
+def compact_matrix(matrix, quantize: bool):
+    matrix = normalize(matrix.tocsr().astype(np.float32), norm="l2", copy=False)
+    matrix.indices = matrix.indices.astype(np.int32)
+    matrix.indptr = matrix.indptr.astype(np.int32)
+    tfidf_format = {"normalized": True, "dtype": "float32", "scale": 1.0}
+    if quantize:
+        # Unit-length rows keep every weight in [0, 1]
+        scale = 1.0 / 255
+        matrix.data = np.rint(matrix.data / scale).astype(np.uint8)
+        tfidf_format.update({"dtype": "uint8", "scale": scale})
+    matrix.eliminate_zeros()
+    return matrix, tfidf_format
+
+
+def sample_queries(df, count: int, seed: int = 7):
+    """
+    Pantry-like requests: the first few ingredients of random recipes, as a
+    user would type them, with the prep and cook times of another recipe.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(df), size=min(count, len(df)), replace=False)
+    queries = []
+    for i in picks:
+        ingredients = str(df.iloc[i].get("Ingredients", ""))
+        items = [x.strip(" []'\"") for x in ingredients.split(",") if x.strip()]
+        times = df.iloc[rng.integers(len(df))]
+        queries.append((", ".join(items[:rng.integers(2, 7)]), float(times["PrepTimeInMins"]), float(times["CookTimeInMins"])))
+    return queries
+
+
+def served_top(cosine, prep, cook, user_prep, user_cook):
+    """Top-N positions by the API's combined score; ties keep row order on both sides."""
+    combined = combined_similarity(cosine, prep, cook, user_prep, user_cook,
+                                   max(float(prep.max()), 1.0), max(float(cook.max()), 1.0))
+    return set(np.argsort(-combined, kind="stable")[:TOP_N])
+
+
+def compare(exact_vectorizer, exact_matrix, compact: TfidfIndex, df, queries):
+    prep = df["PrepTimeInMins"].to_numpy(dtype=np.float32)
+    cook = df["CookTimeInMins"].to_numpy(dtype=np.float32)
+    changed, identical = [], 0
+    exact_ms, compact_ms = [], []
+    for ingredients, user_prep, user_cook in queries:
+        query = query_text(clean_ingredients(ingredients))
+
+        start = time.perf_counter()
+        exact_scores = cosine_similarity(exact_vectorizer.transform([query]), exact_matrix)[0]
+        exact_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        compact_scores = compact.scores(query)
+        compact_ms.append((time.perf_counter() - start) * 1000)
+
+        exact_top = served_top(exact_scores, prep, cook, user_prep, user_cook)
+        compact_top = served_top(compact_scores, prep, cook, user_prep, user_cook)
+        diff = len(exact_top - compact_top)
+        changed.append(diff)
+        identical += diff == 0
+    return changed, identical, exact_ms, compact_ms
+
+
+def matrix_bytes(matrix) -> int:
+    matrix = matrix.tocsr()
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a compact TF-IDF model and report its quality.")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--min-df", type=int, default=2, help="Keep terms present in at least this many recipes")
+    parser.add_argument("--quantize", action="store_true", help="Store weights as uint8")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--min-identical", type=float, default=0.9,
+                        help="Fraction of queries whose served top-9 must not change")
+    parser.add_argument("--force", action="store_true", help="Write the output even if the quality gate fails")
+    parser.add_argument("--scoring-only", action="store_true",
+                        help="Keep only the scoring columns; display fields are served from Mongo")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"Model file {args.model} not found!")
+        sys.exit(1)
+    with open(args.model, "rb") as f:
+        model_data = pickle.load(f)
+    vectorizer = model_data["tfidf_vectorizer"]
+    matrix = model_data["tfidf_matrix"].tocsr()
+    df = model_data["dataframe"]
+    print(f"Loaded {matrix.shape[0]} recipes x {matrix.shape[1]} terms, {matrix.nnz} non-zeros, "
+          f"{matrix.data.dtype}/{matrix.indices.dtype}.")
+
+    pruned_vectorizer, pruned_matrix, keep = prune_vocabulary(vectorizer, matrix, args.min_df)
+    compact, tfidf_format = compact_matrix(pruned_matrix, args.quantize)
+    tfidf_format["min_df"] = args.min_df
+    print(f"Vocabulary: {matrix.shape[1]} -> {len(keep)} terms (min_df={args.min_df}).")
+
+    index = TfidfIndex(pruned_vectorizer, compact, tfidf_format)
+    # Missing NLTK data changes how queries tokenise; compare with what the server will use
+    print(f"Tokenizer: {tokenizer.load()}")
+    queries = sample_queries(df, args.queries)
+    changed, identical, exact_ms, compact_ms = compare(vectorizer, matrix, index, df, queries)
+
+    before, after = matrix_bytes(matrix), index.nbytes()
+    vec_before, vec_after = len(pickle.dumps(vectorizer)), len(pickle.dumps(pruned_vectorizer))
+    print("\n--- Quality ---")
+    print(f"Queries: {len(queries)}; identical served top-{TOP_N}: {identical} ({identical / max(len(queries), 1):.1%})")
+    print(f"Changed results per query: mean {np.mean(changed):.2f}, max {max(changed, default=0)} of {TOP_N}")
+    print("\n--- Memory ---")
+    print(f"Matrix:     {before / 1e6:.1f}MB -> {after / 1e6:.1f}MB ({after / max(before, 1):.0%})")
+    print(f"Vectorizer: {vec_before / 1e6:.1f}MB -> {vec_after / 1e6:.1f}MB")
+    print("\n--- Latency per query (similarity only, before combining) ---")
+    print(f"Exact:   p50 {np.percentile(exact_ms, 50):.2f}ms  p95 {np.percentile(exact_ms, 95):.2f}ms")
+    print(f"Compact: p50 {np.percentile(compact_ms, 50):.2f}ms  p95 {np.percentile(compact_ms, 95):.2f}ms")
+
+    identical_ratio = identical / max(len(queries), 1)
+    if identical_ratio < args.min_identical:
+        print(f"\nQuality gate FAILED: {identical_ratio:.1%} of served top-{TOP_N} unchanged, "
+              f"need {args.min_identical:.1%}. Try a lower --min-df or drop --quantize.")
+        if not args.force:
+            sys.exit(1)
+        print("Writing anyway (--force).")
+
+    model_data["tfidf_vectorizer"] = pruned_vectorizer
+    model_data["tfidf_matrix"] = compact
+    model_data["tfidf_format"] = tfidf_format
+    if args.scoring_only:
+        model_data["scoring"] = scoring_frame(model_data.pop("dataframe"))
+        print(f"Scoring-only: kept {', '.join(model_data['scoring'].columns)}.")
+    with open(args.output, "wb") as f:
+        pickle.dump(model_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"\nWrote {args.output}. Serve it with MODEL_PATH={args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import threading
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from process_pools import pool_context
+from tracing import span, remote_context, run_remote, adopt
+
+# Cost for new hashes; stored hashes below it are upgraded on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash/verify calls allowed in flight (running + queued) before callers wait
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+# How long a caller waits for a slot before the request is refused
+HASH_QUEUE_TIMEOUT_SECONDS = float(os.getenv("HASH_QUEUE_TIMEOUT", "5.0"))
+
+# Kept free of app imports so spawned workers import only passlib and tracing (stdlib only)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # new_hash is set only when the stored hash uses outdated parameters
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class HashingExecutor:
+    """
+    Runs bcrypt in a process pool so it neither blocks the event loop nor
+    competes for the GIL. A semaphore bounds in-flight work; callers that
+    cannot get a slot within the timeout get HashingBusy instead of piling up.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING,
+                 queue_timeout: float = HASH_QUEUE_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._pool = None
+        self._start_lock = threading.Lock()
+        self._slots = None
+        # Stats
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def start(self):
+        """Blocking; starts and warms the workers. Called at startup, or from a thread if that failed."""
+        with self._start_lock:
+            if self._pool is not None:
+                return
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+            try:
+                # Pay for worker start-up now rather than on the first login
+                list(pool.map(_hash, ["warmup"] * self.workers))
+            except Exception:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            self._pool = pool
+            print(f"Password hashing pool started ({self.workers} workers, {BCRYPT_ROUNDS} rounds).")
+
+    async def _run(self, fn, *args):
+        if self._pool is None:
+            # Startup failed or hasn't run; never start workers on the event loop
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.start)
+            except Exception as e:
+                print(f"Password hashing pool unavailable: {e}")
+                raise HashingBusy()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        name = fn.__name__.lstrip("_")
+        with span(f"password_hashing.{name}"):
+            return await self._run_in_slot(name, fn, *args)
+
+    async def _run_in_slot(self, name, fn, *args):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HashingBusy()
+        self.in_flight += 1
+        try:
+            # The worker's span shows bcrypt time; the gap up to it is queueing
+            result, spans = await asyncio.get_running_loop().run_in_executor(
+                self._pool, run_remote, remote_context(), name, fn, *args
+            )
+            adopt(spans)
+            return result
+        except BrokenProcessPool:
+            # A worker died; drop the pool so the next call starts a fresh one
+            print("Password hashing pool broke; restarting it on the next call.")
+            self._pool = None
+            raise HashingBusy()
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Returns (valid, new_hash); new_hash is not None when the user should be rehashed."""
+        valid, new_hash = await self._run(_verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": BCRYPT_ROUNDS,
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
+
+
+password_hasher = HashingExecutor()
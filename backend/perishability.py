@@ -0,0 +1,276 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from metrics import track_dependency
+from tracing import span
+from single_flight import get_flight, flight_key, timeout_until
+
+
+def _ollama():
+    # Imported on first use; the client library is slow to import and not needed to start serving
+    import ollama
+    return ollama
+
+
+PERISHABILITY_MODEL = "llama3"
+
+# Requests arriving within this window share one Ollama call. 0 disables batching.
+BATCH_WINDOW_MS = int(os.getenv("PERISHABILITY_BATCH_WINDOW_MS", "50"))
+MAX_BATCH_SIZE = int(os.getenv("PERISHABILITY_MAX_BATCH_SIZE", "8"))
+# Batches in flight to Ollama at once; the next batch is collected while these run
+BATCH_WORKERS = int(os.getenv("PERISHABILITY_BATCH_WORKERS", "2"))
+# Longest a caller waits for its batch before answering with the heuristic fallback
+BATCH_WAIT_SECONDS = float(os.getenv("PERISHABILITY_BATCH_WAIT_SECONDS", "60"))
+
+PERISHABILITY_GUIDELINES = """
+    For each ingredient, estimate:
+       - "days_to_expiry": (int) estimated days until expiry (use 999 for non-perishables like salt/spices/rice)
+       - "priority": (string) "High", "Medium", or "Low" based on urgency to use.
+
+    STRICT Guidelines for Priority:
+    - High (Red): Raw meats (Chicken, Beef, Pork), Seafood, Leafy Greens. Use within 1-3 days.
+    - Medium (Yellow): Eggs, Milk, Soft Cheeses, Most Fresh Vegetables/Fruits. Use within 4-14 days.
+    - Low (Green): Rice, Grains, Pasta, Hard Cheeses, Frozen Foods, Canned Goods, Spices. Use within 15+ days.
+
+    Each ingredient object has:
+    - "name": (string) ingredient name (CLEAN UP NAMES: Remove quantities/numbers. KEEP Indian names in parentheses if available. Example: "Red Tomatoes" -> "Tomatoes", "Zucchini (Turai)" -> "Zucchini (Turai)", "Carrot [10 20 30 40]" -> "Carrot")
+    - "days_to_expiry": (int)
+    - "priority": (string)
+    """
+
+
+def _build_prompt(ingredients_list, extra_text):
+    return f"""
+    You are an expert food safety assistant. Analyze the following ingredients and estimate their perishability.
+
+    Detected Ingredients List: {', '.join(ingredients_list)}
+    User Description: {extra_text}
+
+    Task:
+    1. Extract any additional ingredients from the 'User Description'.
+    2. Combine them with the 'Detected Ingredients List'.
+    3. Remove duplicates.
+    4. Estimate perishability as described below.
+    {PERISHABILITY_GUIDELINES}
+    Return ONLY a valid JSON array of ingredient objects.
+
+    Do not add any markdown formatting or extra text. Just the JSON.
+    """
+
+
+def _build_batch_prompt(batch):
+    request_lines = []
+    for key, (ingredients_list, extra_text) in batch:
+        request_lines.append(
+            f'    "{key}": Detected Ingredients List: {", ".join(ingredients_list)} | User Description: {extra_text}'
+        )
+    requests_block = "\n".join(request_lines)
+
+    return f"""
+    You are an expert food safety assistant. You will receive several independent ingredient requests, each with a key.
+    For EACH request, extract any additional ingredients from its 'User Description', combine them with its
+    'Detected Ingredients List', remove duplicates and estimate perishability as described below.
+    {PERISHABILITY_GUIDELINES}
+    Requests:
+{requests_block}
+
+    Return ONLY a valid JSON object mapping every request key to a JSON array of ingredient objects,
+    e.g. {{"r0": [...], "r1": [...]}}. Do not merge ingredients across keys.
+
+    Do not add any markdown formatting or extra text. Just the JSON.
+    """
+
+
+def _clean_json_content(content):
+    return content.replace("```json", "").replace("```", "").strip()
+
+
+def _fallback_result(ingredients_list, extra_text):
+    fallback_list = ingredients_list + (extra_text.split(',') if extra_text else [])
+    return [{"name": ing.strip(), "days_to_expiry": 7, "priority": "Medium"} for ing in fallback_list if ing.strip()]
+
+
+def analyze_perishability(ingredients_list, extra_text=""):
+    if not ingredients_list and not extra_text:
+        return []
+
+    prompt = _build_prompt(ingredients_list, extra_text)
+
+    try:
+        with track_dependency("ollama", "perishability"):
+            response = _ollama().chat(model=PERISHABILITY_MODEL, format='json', messages=[
+                {'role': 'user', 'content': prompt},
+            ])
+        content = response['message']['content']
+        clean_content = _clean_json_content(content)
+
+        try:
+             data = json.loads(clean_content)
+        except json.JSONDecodeError:
+             start = clean_content.find('[')
+             end = clean_content.rfind(']')
+             if start != -1 and end != -1:
+                 data = json.loads(clean_content[start:end+1])
+             else:
+                 raise
+
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if isinstance(value, list):
+                    return value
+            return [data]
+
+        if isinstance(data, list):
+            return [item for item in data if isinstance(item, dict)]
+
+        return []
+
+    except Exception as e:
+        print(f"Error analyzing perishability: {e}")
+        return _fallback_result(ingredients_list, extra_text)
+
+
+class PerishabilityBatcher:
+    """
+    Collects perishability requests arriving within a short window and answers
+    them with a single keyed Ollama prompt. Requests whose part of the batched
+    output is missing or malformed are resolved with None, which tells the
+    caller to fall back to an individual analyze_perishability call.
+
+    One thread collects batches; up to `workers` batches are sent to Ollama
+    concurrently, so a slow batch doesn't hold up the ones behind it.
+    """
+
+    def __init__(self, window_ms: int = BATCH_WINDOW_MS, max_batch_size: int = MAX_BATCH_SIZE,
+                 workers: int = BATCH_WORKERS):
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.workers = max(1, workers)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self.batches_sent = 0
+        self.requests_batched = 0
+        self.fallbacks = 0
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="perishability-batch")
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="perishability-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, ingredients_list, extra_text="") -> Future:
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((list(ingredients_list), extra_text or "", future))
+        return future
+
+    def _collect(self, batch):
+        """Fills `batch` in place, so requests already taken off the queue are known if this fails."""
+        batch.append(self._queue.get())
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                self._collect(batch)
+                if len(batch) == 1:
+                    # Nothing to share the prompt with; let the caller run it directly.
+                    batch[0][2].set_result(None)
+                    continue
+                self._executor.submit(self._send, batch)
+            except Exception as e:
+                # The thread keeps collecting; only this batch's callers see the error
+                print(f"Perishability batcher error: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _send(self, batch):
+        try:
+            self._dispatch(batch)
+        except Exception as e:
+            print(f"Perishability batch failed: {e}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    def _dispatch(self, batch):
+        keyed = [(f"r{i}", (ingredients, extra)) for i, (ingredients, extra, _) in enumerate(batch)]
+        prompt = _build_batch_prompt(keyed)
+
+        start = time.perf_counter()
+        with track_dependency("ollama", "perishability_batch"):
+            response = _ollama().chat(model=PERISHABILITY_MODEL, format='json', messages=[
+                {'role': 'user', 'content': prompt},
+            ])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.batches_sent += 1
+            self.requests_batched += len(batch)
+        print(f"Perishability batch of {len(batch)} answered in {elapsed_ms:.0f}ms")
+
+        try:
+            data = json.loads(_clean_json_content(response['message']['content']))
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+
+        for (key, _), (_, _, future) in zip(keyed, batch):
+            items = data.get(key)
+            if isinstance(items, list) and all(isinstance(item, dict) for item in items):
+                future.set_result(items)
+            else:
+                with self._lock:
+                    self.fallbacks += 1
+                future.set_result(None)
+
+
+perishability_batcher = PerishabilityBatcher()
+# Identical concurrent requests share one answer instead of each joining a batch
+perishability_flight = get_flight("perishability")
+
+
+def analyze_perishability_batched(ingredients_list, extra_text=""):
+    """Blocking call; shares an Ollama prompt with concurrent callers where possible."""
+    if not ingredients_list and not extra_text:
+        return []
+    key = flight_key(",".join(sorted(str(i).strip().lower() for i in ingredients_list)), extra_text or "")
+    return perishability_flight.do(key, _analyze_batched, ingredients_list, extra_text)
+
+
+def _analyze_batched(ingredients_list, extra_text):
+    if perishability_batcher.window <= 0:
+        return analyze_perishability(ingredients_list, extra_text)
+
+    deadline = time.monotonic() + BATCH_WAIT_SECONDS
+    # The shared prompt runs on the batcher thread; this span covers the wait for it
+    try:
+        with span("perishability.batch_wait"):
+            result = perishability_batcher.submit(ingredients_list, extra_text).result(timeout=timeout_until(deadline))
+    except FutureTimeoutError:
+        print(f"Perishability batch not answered within {BATCH_WAIT_SECONDS:g}s. Using the fallback estimate.")
+        return _fallback_result(ingredients_list, extra_text)
+    except Exception as e:
+        print(f"Perishability batch failed: {e}. Analyzing individually.")
+        result = None
+    if result is None:
+        return analyze_perishability(ingredients_list, extra_text)
+    return result
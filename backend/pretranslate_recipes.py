@@ -0,0 +1,185 @@
+"""
+Offline pre-translation of the recipe catalog.
+
+Translates every recipe name and its sentence-split instructions into the
+supported locales and appends the results to recipe_translations.jsonl
+(next to the model), optionally mirroring them into the 'recipes'
+collection as translations.<lang>. The job is resumable: (Srno, lang)
+pairs already present in the output are skipped.
+
+Usage:
+    python pretranslate_recipes.py [--langs hi,es,fr] [--workers 4] [--rate 5]
+                                   [--limit N] [--translator google|local] [--mongo]
+"""
+import argparse
+import os
+import pickle
+import sys
+import threading
+import time
+import json
+import concurrent.futures
+
+import pandas as pd
+
+import tokenizer
+from recipe_translations import SUPPORTED_LANGS, TRANSLATIONS_PATH, read_translation_records
+
+MODEL_PATH = "recipe_recommender_model.pkl"
+# Google rejects payloads above 5000 characters
+MAX_JOINED_CHARS = 4500
+
+
+class RateLimiter:
+    """Spaces calls evenly so all workers together stay under `rate` calls/sec."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class LocalTranslator:
+    """Offline stand-in for testing the pipeline without network access."""
+
+    def __init__(self, target: str):
+        self.target = target
+
+    def translate(self, text: str) -> str:
+        return f"[{self.target}] {text}"
+
+
+def make_translator(kind: str, lang: str):
+    """The calling thread's translator; translators are not shared between workers."""
+    if kind == "local":
+        return LocalTranslator(lang)
+    from translation import get_translator
+    return get_translator(lang)
+
+
+def split_instructions(instructions) -> list:
+    if instructions is None or (isinstance(instructions, float) and pd.isna(instructions)):
+        return []
+    return tokenizer.sent_tokenize(str(instructions))
+
+
+def translate_recipe(row, lang, translator_kind, limiter, retries=3):
+    """One upstream call per recipe: name and steps joined one per line."""
+    for attempt in range(retries):
+        limiter.wait()
+        try:
+            translator = make_translator(translator_kind, lang)
+            steps = [" ".join(s.split()) for s in split_instructions(row.get("Instructions"))]
+            name = " ".join(str(row.get("RecipeName", "")).split())
+            lines = [name] + steps
+            joined = "\n".join(lines)
+            parts = []
+            if len(joined) <= MAX_JOINED_CHARS:
+                translated = translator.translate(joined)
+                parts = [p.strip() for p in translated.split("\n")] if translated else []
+            if len(parts) != len(lines):
+                # Too long, or the separator was lost upstream; one call per line
+                parts = []
+                for line in lines:
+                    limiter.wait()
+                    parts.append((translator.translate(line) or line).strip())
+            return {"srno": int(row["Srno"]), "lang": lang, "name": parts[0], "instructions": parts[1:]}
+        except Exception as e:
+            print(f"Srno {row.get('Srno')} [{lang}] attempt {attempt + 1}/{retries} failed: {e}")
+            time.sleep(attempt + 1)
+    return None
+
+
+def pending_jobs(df, langs, done):
+    for _, row in df.iterrows():
+        srno = int(row["Srno"])
+        for lang in langs:
+            if (srno, lang) not in done:
+                yield row, lang
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-translate recipe names and instructions.")
+    parser.add_argument("--langs", default=",".join(SUPPORTED_LANGS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=5.0, help="Max upstream calls per second across all workers")
+    parser.add_argument("--limit", type=int, default=None, help="Only translate the first N recipes")
+    parser.add_argument("--translator", choices=["google", "local"], default="google")
+    parser.add_argument("--output", default=TRANSLATIONS_PATH)
+    parser.add_argument("--mongo", action="store_true", help="Also store results in the recipes collection")
+    args = parser.parse_args()
+
+    langs = [l.strip() for l in args.langs.split(",") if l.strip()]
+
+    print(f"Loading model from {MODEL_PATH}...")
+    if not os.path.exists(MODEL_PATH):
+        print("Model file not found!")
+        sys.exit(1)
+    with open(MODEL_PATH, "rb") as f:
+        df = pickle.load(f)["dataframe"][["Srno", "RecipeName", "Instructions"]]
+    if args.limit:
+        df = df.head(args.limit)
+
+    done = {(int(r["srno"]), r["lang"]) for r in read_translation_records(args.output)}
+    total = len(df) * len(langs)
+    print(f"{len(done)} translations already stored. {total} requested for {len(df)} recipes in {langs}.")
+
+    recipes = None
+    if args.mongo:
+        from database import get_recipe_collection
+        recipes = get_recipe_collection()
+        if recipes is None:
+            print("MongoDB not connected. Writing to file only.")
+
+    print(f"Tokenizer: {tokenizer.load()}")
+    limiter = RateLimiter(args.rate)
+    write_lock = threading.Lock()
+    written = 0
+    started = time.time()
+
+    with open(args.output, "a", encoding="utf-8") as out, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        in_flight = set()
+        for row, lang in pending_jobs(df, langs, done):
+            in_flight.add(executor.submit(translate_recipe, row, lang, args.translator, limiter))
+            # Bound memory on large catalogs by keeping only a window of futures
+            if len(in_flight) >= args.workers * 4:
+                finished, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                written += _store(finished, out, write_lock, recipes)
+                if written and written % 100 == 0:
+                    print(f"{written} translations stored ({written / (time.time() - started):.1f}/s)")
+        written += _store(concurrent.futures.as_completed(in_flight), out, write_lock, recipes)
+
+    print(f"Done. Stored {written} new translations in {time.time() - started:.1f}s.")
+
+
+def _store(futures, out, lock, recipes):
+    stored = 0
+    for future in futures:
+        record = future.result()
+        if record is None:
+            continue
+        with lock:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+        if recipes is not None:
+            recipes.update_one(
+                {"Srno": record["srno"]},
+                {"$set": {f"translations.{record['lang']}": {"name": record["name"], "instructions": record["instructions"]}}}
+            )
+        stored += 1
+    return stored
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""
+Start method for the app's process pools.
+
+By the time a pool starts, the parent already runs threads (the interaction
+flusher, the enrichment pool, the trace exporter, anyio's workers). Forking
+it can copy a lock some other thread was holding into the child, which then
+deadlocks. Workers are therefore started from a fork server, or spawned
+where no fork server exists (Windows, macOS defaults).
+
+Either way a worker re-imports the launching script, so run the app with
+`uvicorn main:app`; under `python main.py` each worker would load main.
+"""
+import multiprocessing
+
+
+def pool_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
@@ -0,0 +1,60 @@
+"""
+The served recommendation ranking: how ingredient text is cleaned into a
+TF-IDF query, and how ingredient and time similarity combine into the score
+recipes are ranked by. Shared by the API, the sharded scorer workers and
+optimize_model.py's quality gate, so all three rank the same way.
+"""
+import string
+from typing import List
+
+import tokenizer
+
+# Weight ingredients significantly higher (80%) than time (prep and cook 10% each)
+INGREDIENT_WEIGHT = 0.8
+TIME_WEIGHT = 0.1
+
+COOKING_STOPWORDS = {
+    "teaspoon", "tsp", "tablespoon", "tbsp", "cup", "gram", "gms", "g", "kg", "ml", "liter", "litre", "l", "lb", "oz", "pinch", "bunch", "sprig", "cloves",
+    "chopped", "sliced", "diced", "minced", "grated", "crushed", "beaten", "whisked", "sifted", "melted", "slit", "halved", "quartered", "cubed",
+    "peeled", "cored", "seeded", "washed", "cleaned", "dried", "roasted", "toasted", "fried", "boiled", "warm", "cold", "hot", "lukewarm",
+    "taste", "size", "small", "medium", "large", "fresh", "whole", "powder", "seeds", "oil", "leaves", "wedges", "fillet", "fillets", "boneless", "skinless",
+    "water", "salt", "ice" 
+}
+
+
+def clean_ingredient_text(text):
+    text = text.lower()
+    text = ''.join([i for i in text if not i.isdigit()])
+    text = text.replace("/", " ").replace(".", " ")
+    try:
+        tokens = tokenizer.word_tokenize(text)
+    except:
+        tokens = text.split()
+    clean_tokens = []
+    for word in tokens:
+        word = word.strip(string.punctuation)
+        if not word: continue
+        if word in COOKING_STOPWORDS: continue
+        if word in tokenizer.english_stopwords(): continue
+        if len(word) < 2: continue 
+        clean_tokens.append(word)
+    return ' '.join(clean_tokens)
+
+
+def clean_ingredients(ingredients: str) -> List[str]:
+    """Comma-separated user input -> cleaned ingredient names; the raw names if cleaning empties them all."""
+    raw_list = [i.strip() for i in ingredients.split(',')]
+    cleaned = [c for c in (clean_ingredient_text(i) for i in raw_list) if c]
+    return cleaned or [r for r in raw_list if r]
+
+
+def query_text(ingredients_list: List[str]) -> str:
+    """The text vectorised for a list of ingredients."""
+    return clean_ingredient_text(', '.join(ingredients_list))
+
+
+def combined_similarity(cosine, prep_times, cook_times, user_prep_time, user_cook_time, max_prep, max_cook):
+    """Score recipes are ranked by; works on numpy arrays and pandas Series alike."""
+    prep_time_similarity = 1 - abs(prep_times - user_prep_time) / max_prep
+    cook_time_similarity = 1 - abs(cook_times - user_cook_time) / max_cook
+    return cosine * INGREDIENT_WEIGHT + prep_time_similarity * TIME_WEIGHT + cook_time_similarity * TIME_WEIGHT
@@ -0,0 +1,203 @@
+"""
+Recipe storage split into a resident scoring part and lazily fetched
+display fields.
+
+Scoring only needs Srno and the time columns, row-aligned with the TF-IDF
+matrix. With RECIPE_STORE=mongo those are all a worker keeps; names,
+ingredients, instructions and URLs for the final candidates are fetched
+from the 'recipes' collection in one $in query and kept in a bounded LRU.
+RECIPE_STORE=memory (or Mongo being unavailable) keeps the full DataFrame.
+
+Mongo is only trusted once migrate_to_mongo.py has verified a load and left
+a marker in 'migrations' for a catalog of the model's size. A scoring-only
+artifact (optimize_model.py --scoring-only) carries no DataFrame at all and
+so can only be served that way.
+"""
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from metrics import track_dependency
+from user_cache import TTLCache
+
+RECIPE_STORE = os.getenv("RECIPE_STORE", "mongo")
+RECIPE_CACHE_SIZE = int(os.getenv("RECIPE_CACHE_SIZE", "2000"))
+
+SCORING_COLUMNS = ["Srno", "PrepTimeInMins", "CookTimeInMins"]
+# Written by migrate_to_mongo.py after a verified load
+CATALOG_MARKER_ID = "recipes"
+DISPLAY_COLUMNS = [
+    "Srno", "RecipeName", "TranslatedRecipeName", "Ingredients", "PrepTimeInMins", "CookTimeInMins",
+    "Servings", "Cuisine", "Course", "Diet", "Instructions", "URL",
+]
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def scoring_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Just SCORING_COLUMNS, in compact dtypes."""
+    return pd.DataFrame({
+        "Srno": df["Srno"].astype(np.int32).values,
+        "PrepTimeInMins": df["PrepTimeInMins"].astype(np.float32).values,
+        "CookTimeInMins": df["CookTimeInMins"].astype(np.float32).values,
+    })
+
+
+class RecipeStore:
+    """Scoring columns in RAM plus a way to load full rows for chosen positions."""
+
+    def __init__(self, scoring: pd.DataFrame):
+        self.scoring = scoring
+        self.max_prep = max(float(scoring["PrepTimeInMins"].max()), 1.0)
+        self.max_cook = max(float(scoring["CookTimeInMins"].max()), 1.0)
+        # Candidates whose display fields couldn't be found
+        self.missing_rows = 0
+        self._missing_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.scoring)
+
+    def fetch(self, srnos: List[int]) -> Dict[int, dict]:
+        raise NotImplementedError
+
+    def _record_missing(self, missing: List[int]):
+        with self._missing_lock:
+            self.missing_rows += len(missing)
+        print(f"Recipe store: {len(missing)} recipes missing display fields (Srno {missing[:10]}).")
+
+    def rows(self, positions, scores=None) -> pd.DataFrame:
+        """Full rows for matrix positions, in order, with an optional similarity_score column."""
+        srnos = [int(s) for s in self.scoring["Srno"].values[positions]]
+        docs = self.fetch(srnos)
+        keep = [i for i, srno in enumerate(srnos) if srno in docs]
+        if len(keep) < len(srnos):
+            self._record_missing([srno for srno in srnos if srno not in docs])
+        rows = pd.DataFrame([docs[srnos[i]] for i in keep], columns=DISPLAY_COLUMNS)
+        if scores is not None:
+            rows["similarity_score"] = np.asarray(scores)[keep].astype(int)
+        return rows
+
+    def get(self, srno: int) -> Optional[pd.Series]:
+        docs = self.fetch([srno])
+        if srno not in docs:
+            # Only a catalog gap if the model knows the recipe; otherwise it's a bad id
+            if srno in set(self.scoring["Srno"].values.tolist()):
+                self._record_missing([srno])
+            return None
+        return pd.Series(docs[srno])
+
+    def stats(self) -> dict:
+        return {"recipes": len(self), "resident_bytes": _frame_bytes(self.scoring), "missing_rows": self.missing_rows}
+
+
+class InMemoryRecipeStore(RecipeStore):
+    def __init__(self, df: pd.DataFrame):
+        super().__init__(df)
+        self.df = df
+        self._positions = {int(s): i for i, s in enumerate(df["Srno"].values)}
+
+    def fetch(self, srnos):
+        return {s: self.df.iloc[self._positions[s]].to_dict() for s in srnos if s in self._positions}
+
+    def rows(self, positions, scores=None):
+        # Same shape as before the split: the original rows plus the score
+        rows = self.df.iloc[positions].copy()
+        if scores is not None:
+            rows["similarity_score"] = np.asarray(scores).astype(int)
+        return rows
+
+    def stats(self):
+        return {"recipes": len(self), "resident_bytes": _frame_bytes(self.df), "backend": "memory",
+                "missing_rows": self.missing_rows}
+
+
+class MongoRecipeStore(RecipeStore):
+    def __init__(self, scoring: pd.DataFrame, collection, cache_size: int = RECIPE_CACHE_SIZE):
+        super().__init__(scoring)
+        self.collection = collection
+        self.cache = TTLCache(cache_size)
+        self.queries = 0
+
+    def fetch(self, srnos):
+        docs = {}
+        missing = []
+        for srno in srnos:
+            doc = self.cache.get(srno)
+            if doc is None:
+                missing.append(srno)
+            else:
+                docs[srno] = doc
+        if missing:
+            # One round trip for every uncached candidate
+            self.queries += 1
+            projection = {field: 1 for field in DISPLAY_COLUMNS}
+            projection["_id"] = 0
+            with track_dependency("mongo", "recipes.find"):
+                found = list(self.collection.find({"Srno": {"$in": missing}}, projection))
+            for doc in found:
+                doc = {field: doc.get(field) for field in DISPLAY_COLUMNS}
+                self.cache.set(doc["Srno"], doc)
+                docs[doc["Srno"]] = doc
+        return docs
+
+    def stats(self):
+        return {
+            "recipes": len(self),
+            "resident_bytes": _frame_bytes(self.scoring),
+            "backend": "mongo",
+            "cached_docs": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "queries": self.queries,
+            "missing_rows": self.missing_rows,
+        }
+
+
+def verified_catalog(rows: int):
+    """The recipes collection if a verified load of `rows` recipes is recorded, else None."""
+    from database import get_migrations_collection, get_recipe_collection
+    markers = get_migrations_collection()
+    if markers is None:
+        return None
+    try:
+        marker = markers.find_one({"_id": CATALOG_MARKER_ID})
+    except Exception as e:
+        print(f"Recipe collection unavailable ({e}).")
+        return None
+    if marker is None:
+        print("No verified recipe load recorded. Run migrate_to_mongo.py.")
+        return None
+    if marker.get("count") != rows:
+        print(f"Verified recipe load has {marker.get('count')} recipes; the model has {rows}.")
+        return None
+    return get_recipe_collection()
+
+
+def build_recipe_store(model_data: dict) -> RecipeStore:
+    """
+    Uses Mongo for display fields when configured and a verified load of the
+    catalog is recorded; otherwise keeps the DataFrame.
+    """
+    df = model_data.get("dataframe")
+    if df is None:
+        scoring = model_data["scoring"]
+        collection = verified_catalog(len(scoring))
+        if collection is None:
+            raise RuntimeError("Scoring-only model needs the verified recipe catalog in Mongo")
+        print(f"Recipe store: Mongo-backed, {_frame_bytes(scoring) // 1024}KB resident (scoring-only model).")
+        return MongoRecipeStore(scoring, collection)
+    if RECIPE_STORE == "mongo":
+        collection = verified_catalog(len(df))
+        if collection is not None:
+            scoring = scoring_frame(df)
+            print(f"Recipe store: Mongo-backed, {_frame_bytes(scoring) // 1024}KB resident "
+                  f"instead of {_frame_bytes(df) // 1024}KB. Write a scoring-only model "
+                  f"(optimize_model.py --scoring-only) to skip loading the DataFrame.")
+            return MongoRecipeStore(scoring, collection)
+        print("Keeping the full DataFrame in memory.")
+    return InMemoryRecipeStore(df)
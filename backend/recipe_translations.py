@@ -0,0 +1,60 @@
+import json
+import os
+from typing import Dict, Optional
+
+# Locales shipped by the frontend (frontend/src/locales)
+SUPPORTED_LANGS = ["hi", "es", "fr"]
+
+TRANSLATIONS_PATH = os.getenv("RECIPE_TRANSLATIONS_PATH", "recipe_translations.jsonl")
+
+# Srno -> lang -> {"name": str, "instructions": [str]}
+recipe_translations: Dict[int, Dict[str, dict]] = {}
+
+
+def read_translation_records(path: str = TRANSLATIONS_PATH):
+    """Yields records written by pretranslate_recipes.py, skipping torn lines."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write leaves a partial last line; the job redoes it on resume
+                continue
+
+
+def load_recipe_translations(path: str = TRANSLATIONS_PATH) -> int:
+    recipe_translations.clear()
+    count = 0
+    for record in read_translation_records(path):
+        recipe_translations.setdefault(int(record["srno"]), {})[record["lang"]] = {
+            "name": record.get("name", ""),
+            "instructions": record.get("instructions", []),
+        }
+        count += 1
+    if count:
+        print(f"Loaded {count} stored recipe translations.")
+    return count
+
+
+def get_recipe_translation(srno: int, lang: Optional[str]) -> Optional[dict]:
+    if not lang or lang == "en":
+        return None
+    return recipe_translations.get(srno, {}).get(lang)
+
+
+def localize_recipe(recipe, lang: Optional[str]):
+    """Swaps in stored translations; recipes without one are returned unchanged."""
+    translation = get_recipe_translation(recipe.id, lang)
+    if translation is None:
+        return recipe
+    updates = {}
+    if translation.get("name"):
+        updates["translated_name"] = translation["name"]
+    if translation.get("instructions"):
+        updates["instructions"] = translation["instructions"]
+    return recipe.model_copy(update=updates) if updates else recipe
@@ -0,0 +1,488 @@
+"""
+Async data-access layer for users, profiles, interactions and admin views.
+
+All endpoint database I/O goes through `get_repository()`, which returns
+either the MongoDB implementation (PyMongo's AsyncMongoClient, connected
+lazily and recreated after connection failures) or an in-memory stand-in
+selected with DATA_BACKEND=memory for local testing.
+"""
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from interaction_store import (
+    BUCKET_INDEXES, HISTORY_PAGE_SIZE, counters_view, history_page, history_pipeline, interaction_ops
+)
+from admin_users import (
+    ADMIN_PAGE_SIZE, EXPORT_BATCH_SIZE, LEASE_COLLECTION, STATS_COLLECTION, STATS_INDEXES, SUMMARY_COLLECTION,
+    SUMMARY_PIPELINE, UNKNOWN_JOIN_DATE, decode_cursor, encode_cursor, is_fresh, lease_acquire, lease_release,
+    page_query, refresh_pipeline
+)
+from metrics import DEPENDENCY_SECONDS
+from tracing import span
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = "ai_cooking_db"
+DATA_BACKEND = os.getenv("DATA_BACKEND", "mongo")
+
+# Pool sizing: one pool per worker process
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "2000"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+USER_VIEW_PROJECTION = {"email": 1, "hashed_password": 1, "is_admin": 1, "profile": 1}
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class QueryStats:
+    """Per-operation call count and latency."""
+
+    def __init__(self):
+        self._stats = defaultdict(lambda: {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+    def record(self, op: str, elapsed_ms: float, error: bool = False):
+        DEPENDENCY_SECONDS.observe(elapsed_ms / 1000, "mongo", op, "error" if error else "ok")
+        entry = self._stats[op]
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        if error:
+            entry["errors"] += 1
+        if elapsed_ms > SLOW_QUERY_MS:
+            print(f"Slow query {op}: {elapsed_ms:.0f}ms")
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            op: {
+                "count": s["count"],
+                "errors": s["errors"],
+                "avg_ms": round(s["total_ms"] / s["count"], 2) if s["count"] else 0,
+                "max_ms": round(s["max_ms"], 2),
+            }
+            for op, s in self._stats.items()
+        }
+
+
+class Repository(ABC):
+    """Interface shared by the Mongo and in-memory backends."""
+
+    def __init__(self):
+        self.query_stats = QueryStats()
+
+    @asynccontextmanager
+    async def timed(self, op: str):
+        start = time.perf_counter()
+        error = False
+        try:
+            with span(f"mongo:{op}", dependency="mongo"):
+                yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.query_stats.record(op, (time.perf_counter() - start) * 1000, error)
+
+    # Users
+    @abstractmethod
+    async def find_user_view(self, email: str) -> Optional[dict]: ...
+    @abstractmethod
+    async def email_exists(self, email: str) -> bool: ...
+    @abstractmethod
+    async def create_user(self, user_doc: dict):
+        """Raises ValueError when the email is already registered."""
+    @abstractmethod
+    async def update_profile(self, email: str, updates: Dict[str, Any]): ...
+    @abstractmethod
+    async def set_password_hash(self, email: str, hashed_password: str): ...
+    @abstractmethod
+    async def set_admin(self, email: str) -> bool: ...
+
+    # Interactions
+    @abstractmethod
+    async def record_interactions(self, events_by_email: List[tuple]): ...
+    @abstractmethod
+    async def interaction_history(self, email: str, limit: int = HISTORY_PAGE_SIZE, before: Optional[datetime] = None): ...
+    @abstractmethod
+    async def interaction_counters(self, email: str) -> dict: ...
+
+    # Admin stats (materialized; see admin_users.py)
+    @abstractmethod
+    async def refresh_user_stats(self, force: bool = False) -> bool:
+        """
+        Rebuilds the stats unless they are still fresh (ignored with `force`)
+        or another worker is already rebuilding them; True if this call did.
+        """
+    @abstractmethod
+    async def user_stats_page(self, sort: str = "email", order: str = "asc", search: Optional[str] = None,
+                              cursor: Optional[str] = None, limit: int = ADMIN_PAGE_SIZE): ...
+    @abstractmethod
+    async def user_stats_summary(self) -> dict: ...
+
+    async def iter_user_stats(self, search: Optional[str] = None):
+        """Async iterator over every stats row in email order, one page in memory at a time."""
+        cursor = None
+        while True:
+            rows, cursor = await self.user_stats_page(search=search, cursor=cursor, limit=EXPORT_BATCH_SIZE)
+            for row in rows:
+                yield row
+            if cursor is None:
+                return
+
+    async def watch_user_changes(self):
+        """Async iterator of changed user _ids; empty when unsupported."""
+        return
+        yield
+
+    async def ping(self):
+        """Round trip to the backend; raises DatabaseUnavailable when it can't be reached."""
+        pass
+
+    async def ensure_indexes(self):
+        """Creates indexes (including the unique one on users.email) once per process."""
+        pass
+
+    async def close(self):
+        pass
+
+
+class MongoRepository(Repository):
+    def __init__(self, uri: str = MONGO_URI, db_name: str = DB_NAME):
+        super().__init__()
+        self.uri = uri
+        self.db_name = db_name
+        self._client = None
+        self._indexes_ready = False
+        self._lock = asyncio.Lock()
+
+    async def _db(self):
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    from pymongo import AsyncMongoClient
+                    # No round trip here: the driver connects on first use
+                    self._client = AsyncMongoClient(
+                        self.uri,
+                        maxPoolSize=MONGO_MAX_POOL_SIZE,
+                        minPoolSize=MONGO_MIN_POOL_SIZE,
+                        maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+                        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    )
+        return self._client[self.db_name]
+
+    async def _reset(self):
+        # Drop the client after connection failures so the next call reconnects cleanly
+        async with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def op(self, name: str):
+        from pymongo.errors import ConnectionFailure
+        async with self.timed(name):
+            try:
+                yield await self._db()
+            except ConnectionFailure as e:
+                print(f"MongoDB unavailable during {name}: {e}")
+                await self._reset()
+                raise DatabaseUnavailable(str(e))
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        async with self.op("ensure_indexes") as db:
+            await db["users"].create_index("email", unique=True)
+            for keys in BUCKET_INDEXES:
+                await db["interaction_buckets"].create_index(keys)
+        self._indexes_ready = True
+
+    async def ping(self):
+        async with self.op("ping") as db:
+            await db.command("ping")
+
+    # Users
+
+    async def find_user_view(self, email):
+        async with self.op("users.find_view") as db:
+            return await db["users"].find_one({"email": email}, USER_VIEW_PROJECTION)
+
+    async def email_exists(self, email):
+        async with self.op("users.exists") as db:
+            return await db["users"].find_one({"email": email}, {"_id": 1}) is not None
+
+    async def create_user(self, user_doc):
+        from pymongo.errors import DuplicateKeyError
+        await self.ensure_indexes()
+        async with self.op("users.insert") as db:
+            try:
+                await db["users"].insert_one(user_doc)
+            except DuplicateKeyError:
+                raise ValueError("Email already registered")
+
+    async def update_profile(self, email, updates):
+        async with self.op("users.update_profile") as db:
+            await db["users"].update_one({"email": email}, {"$set": {f"profile.{k}": v for k, v in updates.items()}})
+
+    async def set_password_hash(self, email, hashed_password):
+        async with self.op("users.set_password") as db:
+            await db["users"].update_one({"email": email}, {"$set": {"hashed_password": hashed_password}})
+
+    async def set_admin(self, email):
+        async with self.op("users.set_admin") as db:
+            result = await db["users"].update_one({"email": email}, {"$set": {"is_admin": True}})
+            return result.matched_count > 0
+
+    # Interactions
+
+    async def record_interactions(self, events_by_email):
+        """
+        Idempotent per event id, so a batch that partly failed (or is replayed
+        from the spool) can be written again. Each worker's flusher is the only
+        writer of its events, so checking buckets before pushing is race-free.
+        """
+        if not events_by_email:
+            return
+        from pymongo.errors import BulkWriteError
+        await self.ensure_indexes()
+        event_ids = [event["event_id"] for _, event in events_by_email]
+        async with self.op("interactions.bulk_write") as db:
+            written = set()
+            buckets = await db["interaction_buckets"].find(
+                {"events.event_id": {"$in": event_ids}}, {"events.event_id": 1}
+            ).to_list(None)
+            for bucket in buckets:
+                written.update(e.get("event_id") for e in bucket["events"])
+
+            bucket_ops, counter_ops = [], []
+            for email, event in events_by_email:
+                bucket_op, counter_op = interaction_ops(email, event)
+                if event["event_id"] not in written:
+                    bucket_ops.append(bucket_op)
+                counter_ops.append(counter_op)
+            if bucket_ops:
+                # Ordered so events for the same user land in their buckets in sequence
+                await db["interaction_buckets"].bulk_write(bucket_ops, ordered=True)
+            try:
+                await db["interaction_counters"].bulk_write(counter_ops, ordered=False)
+            except BulkWriteError as e:
+                # Duplicate keys are counter updates applied by an earlier attempt
+                if e.details.get("writeConcernErrors") or any(
+                        err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+
+    async def interaction_history(self, email, limit=HISTORY_PAGE_SIZE, before=None):
+        async with self.op("interactions.history") as db:
+            cursor = await db["interaction_buckets"].aggregate(history_pipeline(email, limit, before))
+            events = await cursor.to_list(None)
+        return history_page(events, limit)
+
+    async def interaction_counters(self, email):
+        async with self.op("interactions.counters") as db:
+            return counters_view(await db["interaction_counters"].find_one({"_id": email}))
+
+    # Admin stats
+
+    async def refresh_user_stats(self, force=False):
+        from pymongo.errors import DuplicateKeyError
+        refreshed_at = datetime.utcnow()
+        async with self.op("admin_stats.refresh") as db:
+            # One refresh at a time across workers: runs overlapping would delete each other's rows
+            query, update = lease_acquire(refreshed_at)
+            try:
+                await db[LEASE_COLLECTION].update_one(query, update, upsert=True)
+            except DuplicateKeyError:
+                return False
+            try:
+                # Checked under the lease, so a refresh that just finished elsewhere is seen
+                if not force and is_fresh(await db[SUMMARY_COLLECTION].find_one({"_id": "users"}), refreshed_at):
+                    return False
+                for keys in STATS_INDEXES:
+                    await db[STATS_COLLECTION].create_index(keys)
+                await (await db["users"].aggregate(refresh_pipeline(refreshed_at), allowDiskUse=True)).to_list(None)
+                # Rows not touched by this run belong to deleted users
+                await db[STATS_COLLECTION].delete_many({"refreshed_at": {"$lt": refreshed_at}})
+                summary = await (await db[STATS_COLLECTION].aggregate(SUMMARY_PIPELINE)).to_list(None)
+                summary = summary[0] if summary else {"_id": "users", "total_users": 0, "total_interactions": 0, "total_likes": 0}
+                summary["refreshed_at"] = refreshed_at
+                await db[SUMMARY_COLLECTION].replace_one({"_id": "users"}, summary, upsert=True)
+                return True
+            finally:
+                await db[LEASE_COLLECTION].update_one(*lease_release(datetime.utcnow()))
+
+    async def user_stats_page(self, sort="email", order="asc", search=None, cursor=None, limit=ADMIN_PAGE_SIZE):
+        query, sort_spec, field = page_query(sort, order, search, cursor)
+        async with self.op("admin_stats.page") as db:
+            rows = await db[STATS_COLLECTION].find(query).sort(sort_spec).limit(limit + 1).to_list(None)
+        next_cursor = encode_cursor(rows[limit - 1], field) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    async def user_stats_summary(self):
+        async with self.op("admin_stats.summary") as db:
+            return await db[SUMMARY_COLLECTION].find_one({"_id": "users"}) or {}
+
+    async def watch_user_changes(self):
+        db = await self._db()
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        async with await db["users"].watch(pipeline) as stream:
+            async for change in stream:
+                yield change["documentKey"]["_id"]
+
+    async def close(self):
+        await self._reset()
+
+
+class InMemoryRepository(Repository):
+    """Dict-backed stand-in with the same semantics, for tests and offline dev."""
+
+    def __init__(self):
+        super().__init__()
+        self.users: Dict[str, dict] = {}
+        self.events: Dict[str, List[dict]] = defaultdict(list)
+        self.counters: Dict[str, dict] = {}
+        self.applied_event_ids = set()
+        self.stats_rows: List[dict] = []
+        self.stats_summary: dict = {}
+
+    async def find_user_view(self, email):
+        async with self.timed("users.find_view"):
+            doc = self.users.get(email)
+            return {k: v for k, v in doc.items() if k in USER_VIEW_PROJECTION or k == "_id"} if doc else None
+
+    async def email_exists(self, email):
+        async with self.timed("users.exists"):
+            return email in self.users
+
+    async def create_user(self, user_doc):
+        async with self.timed("users.insert"):
+            if user_doc["email"] in self.users:
+                raise ValueError("Email already registered")
+            user_doc.setdefault("_id", f"mem-{len(self.users) + 1}")
+            self.users[user_doc["email"]] = user_doc
+
+    async def update_profile(self, email, updates):
+        async with self.timed("users.update_profile"):
+            if email in self.users:
+                self.users[email].setdefault("profile", {}).update(updates)
+
+    async def set_password_hash(self, email, hashed_password):
+        async with self.timed("users.set_password"):
+            if email in self.users:
+                self.users[email]["hashed_password"] = hashed_password
+
+    async def set_admin(self, email):
+        async with self.timed("users.set_admin"):
+            if email not in self.users:
+                return False
+            self.users[email]["is_admin"] = True
+            return True
+
+    async def record_interactions(self, events_by_email):
+        async with self.timed("interactions.bulk_write"):
+            for email, event in events_by_email:
+                if event["event_id"] in self.applied_event_ids:
+                    continue
+                self.applied_event_ids.add(event["event_id"])
+                self.events[email].append(dict(event))
+                counter = self.counters.setdefault(email, {"total": 0, "actions": {}, "liked_recipes": []})
+                counter["total"] += 1
+                counter["actions"][event["action"]] = counter["actions"].get(event["action"], 0) + 1
+                liked = counter["liked_recipes"]
+                if event["action"] == "like" and event["recipe_name"] not in liked:
+                    liked.append(event["recipe_name"])
+                elif event["action"] == "unlike" and event["recipe_name"] in liked:
+                    liked.remove(event["recipe_name"])
+
+    async def interaction_history(self, email, limit=HISTORY_PAGE_SIZE, before=None):
+        async with self.timed("interactions.history"):
+            events = [dict(e) for e in self.events.get(email, []) if before is None or e["ts"] < before]
+            events.sort(key=lambda e: e["ts"], reverse=True)
+            return history_page(events[:limit + 1], limit)
+
+    async def interaction_counters(self, email):
+        async with self.timed("interactions.counters"):
+            return counters_view(self.counters.get(email))
+
+    async def refresh_user_stats(self, force=False):
+        async with self.timed("admin_stats.refresh"):
+            if not force and is_fresh(self.stats_summary, datetime.utcnow()):
+                return False
+            self._refresh_user_stats()
+        return True
+
+    def _refresh_user_stats(self):
+        refreshed_at = datetime.utcnow()
+        rows = []
+        for user in self.users.values():
+            counter = self.counters.get(user["email"], {})
+            rows.append({
+                "_id": user["email"].lower(),
+                "email": user["email"],
+                "user_id": str(user["_id"]),
+                "is_admin": user.get("is_admin", False),
+                "joined_at": None,
+                "joined_sort": UNKNOWN_JOIN_DATE,
+                "total_interactions": counter.get("total", 0),
+                "total_likes": counter.get("actions", {}).get("like", 0),
+                "refreshed_at": refreshed_at,
+            })
+        self.stats_rows = rows
+        self.stats_summary = {
+            "total_users": len(rows),
+            "total_interactions": sum(r["total_interactions"] for r in rows),
+            "total_likes": sum(r["total_likes"] for r in rows),
+            "refreshed_at": refreshed_at,
+        }
+
+    async def user_stats_page(self, sort="email", order="asc", search=None, cursor=None, limit=ADMIN_PAGE_SIZE):
+        async with self.timed("admin_stats.page"):
+            return self._user_stats_page(sort, order, search, cursor, limit)
+
+    def _user_stats_page(self, sort, order, search, cursor, limit):
+        query, sort_spec, field = page_query(sort, order, search, cursor)
+        reverse = sort_spec[0][1] == -1
+        sort_key = (lambda r: r["_id"]) if field == "_id" else (lambda r: (r.get(field) or 0, r["_id"]))
+        rows = sorted(self.stats_rows, key=sort_key, reverse=reverse)
+        if search:
+            rows = [r for r in rows if r["_id"].startswith(search.strip().lower())]
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            after = last_id if field == "_id" else (value or 0, last_id)
+            rows = [r for r in rows if (sort_key(r) < after if reverse else sort_key(r) > after)]
+        rows = rows[:limit + 1]
+        next_cursor = encode_cursor(rows[limit - 1], field) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    async def user_stats_summary(self):
+        async with self.timed("admin_stats.summary"):
+            return self.stats_summary
+
+
+_repository: Optional[Repository] = None
+
+
+def get_repository() -> Repository:
+    global _repository
+    if _repository is None:
+        _repository = InMemoryRepository() if DATA_BACKEND == "memory" else MongoRepository()
+    return _repository
+
+
+def set_repository(repository: Repository):
+    """Swaps the backend, e.g. for an in-memory stand-in in tests."""
+    global _repository
+    _repository = repository
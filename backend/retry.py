@@ -0,0 +1,25 @@
+import socket
+import time
+
+import requests
+
+
+def execute_with_retry(func, retries=3, delay=1, default=None, deadline=None):
+    """
+    Executes a function with retry logic for network-related errors.
+    `deadline` (time.monotonic()) stops retrying once the next attempt would start after it.
+    """
+    for attempt in range(retries):
+        try:
+            return func()
+        except (requests.exceptions.RequestException, socket.gaierror, Exception) as e:
+            print(f"Attempt {attempt + 1}/{retries} failed for {func.__name__ if hasattr(func, '__name__') else 'unknown'}: {e}")
+            backoff = delay * (attempt + 1)
+            if deadline is not None and time.monotonic() + backoff >= deadline:
+                print("No time left for another attempt. Returning default.")
+                return default
+            if attempt < retries - 1:
+                time.sleep(backoff)  # Simple backoff
+            else:
+                print(f"All retries failed. Returning default.")
+                return default
@@ -0,0 +1,184 @@
+"""
+Scatter-gather scoring across worker processes.
+
+The TF-IDF matrix is split row-wise into SCORER_SHARDS contiguous shards.
+Each shard's CSR arrays and time columns are copied once into shared memory
+and attached by a dedicated worker process, so workers hold no private copy.
+A query vector is broadcast to every shard; each returns its local top-k
+(after masking rows that contain excluded terms) and the parent merges them.
+SCORER_SHARDS=0 keeps scoring in-process.
+"""
+import os
+import threading
+import concurrent.futures
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from process_pools import pool_context
+from ranking import combined_similarity
+from tracing import span, remote_context, run_remote, adopt
+
+SCORER_SHARDS = int(os.getenv("SCORER_SHARDS", "0"))
+
+# --- Worker side ---
+
+_shard = None
+
+
+def _attach(name: str, shape, dtype):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _init_shard(spec: dict):
+    """Runs once in each worker: maps the shard's arrays without copying them."""
+    global _shard
+    blocks, arrays = [], {}
+    for key, (name, shape, dtype) in spec["arrays"].items():
+        block, array = _attach(name, shape, dtype)
+        blocks.append(block)
+        arrays[key] = array
+    matrix = sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=spec["shape"], copy=False)
+    _shard = {
+        "offset": spec["offset"],
+        "matrix": matrix,
+        "prep": arrays["prep"],
+        "cook": arrays["cook"],
+        "scale": spec["scale"],
+        "blocks": blocks,  # Keeps the mappings alive
+    }
+
+
+def _score_shard(query_indices, query_data, prep_time, cook_time, max_prep, max_cook, top_k, exclude_terms):
+    matrix = _shard["matrix"]
+    query = sparse.csr_matrix(
+        (query_data, query_indices, np.array([0, len(query_indices)])), shape=(1, matrix.shape[1])
+    )
+    cosine = matrix.dot(query.T).toarray().ravel() * np.float32(_shard["scale"])
+    combined = combined_similarity(cosine, _shard["prep"], _shard["cook"], prep_time, cook_time, max_prep, max_cook)
+    if exclude_terms:
+        # Rows containing any excluded term (e.g. an allergen) never make the top-k
+        excluded = matrix[:, exclude_terms].getnnz(axis=1) > 0
+        combined[excluded] = -np.inf
+
+    k = min(top_k, len(combined))
+    if k == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    local = np.argpartition(combined, -k)[-k:]
+    return local + _shard["offset"], combined[local]
+
+
+def _ping():
+    return _shard is not None
+
+# --- Parent side ---
+
+
+class ShardedScorer:
+    def __init__(self, matrix, prep_times, cook_times, shards: int, scale: float = 1.0, normalized: bool = True):
+        matrix = matrix.tocsr()
+        if not normalized:
+            # Unit rows turn cosine similarity into the dot product the workers compute
+            matrix = normalize(matrix.astype(np.float32), norm="l2")
+        self.shape = matrix.shape
+        self.shards = max(1, shards)
+        self.scale = scale
+        self.max_prep = max(float(np.max(prep_times)), 1.0)
+        self.max_cook = max(float(np.max(cook_times)), 1.0)
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._executors: List[concurrent.futures.ProcessPoolExecutor] = []
+        self._start_lock = threading.Lock()
+        self._specs = [
+            self._share_shard(matrix, np.asarray(prep_times, dtype=np.float32), np.asarray(cook_times, dtype=np.float32), start, stop)
+            for start, stop in self._bounds(matrix.shape[0])
+        ]
+
+    def _bounds(self, rows: int):
+        edges = np.linspace(0, rows, self.shards + 1, dtype=np.int64)
+        return [(int(edges[i]), int(edges[i + 1])) for i in range(self.shards)]
+
+    def _share(self, array: np.ndarray):
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        self._blocks.append(block)
+        return block.name, array.shape, array.dtype.str
+
+    def _share_shard(self, matrix, prep, cook, start, stop) -> dict:
+        part = matrix[start:stop]
+        return {
+            "offset": start,
+            "shape": part.shape,
+            "scale": self.scale,
+            "arrays": {
+                "data": self._share(part.data),
+                "indices": self._share(part.indices.astype(np.int32)),
+                "indptr": self._share(part.indptr.astype(np.int32)),
+                "prep": self._share(prep[start:stop]),
+                "cook": self._share(cook[start:stop]),
+            },
+        }
+
+    def start(self):
+        with self._start_lock:
+            if self._executors:
+                return
+            # One single-process pool per shard, so each shard stays attached to one worker
+            executors = [
+                concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1, initializer=_init_shard, initargs=(spec,), mp_context=pool_context()
+                )
+                for spec in self._specs
+            ]
+            for executor in executors:
+                executor.submit(_ping).result()
+            self._executors = executors
+        print(f"Sharded scorer started: {self.shards} shards over {self.shape[0]} rows.")
+
+    def top_k(self, query_vector, prep_time: float, cook_time: float, top_k: int,
+              exclude_terms: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Global (positions, combined scores) sorted best first."""
+        if not self._executors:
+            self.start()
+        query = normalize(sparse.csr_matrix(query_vector, dtype=np.float32), norm="l2")
+        args = (query.indices, query.data, float(prep_time), float(cook_time),
+                self.max_prep, self.max_cook, top_k, list(exclude_terms or []))
+        with span("sharded_scorer.scatter", shards=len(self._executors)):
+            context = remote_context()
+            futures = [
+                executor.submit(run_remote, context, f"score_shard[{i}]", _score_shard, *args)
+                for i, executor in enumerate(self._executors)
+            ]
+            parts = []
+            for future in futures:
+                part, spans = future.result()
+                adopt(spans)
+                parts.append(part)
+        positions = np.concatenate([part[0] for part in parts])
+        scores = np.concatenate([part[1] for part in parts])
+        order = np.argsort(scores)[::-1][:top_k]
+        keep = order[np.isfinite(scores[order])]
+        return positions[keep], scores[keep]
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._executors = []
+        for block in self._blocks:
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "shards": self.shards,
+            "rows": self.shape[0],
+            "shared_bytes": sum(block.size for block in self._blocks),
+            "running": bool(self._executors),
+        }
@@ -0,0 +1,124 @@
+"""
+Single-flight coalescing for identical in-flight upstream calls.
+
+The first caller for a key (the leader) runs the call in its own thread;
+callers arriving with the same key while it runs wait on the leader's
+future instead of issuing their own request. The result, or the exception,
+goes to every waiter. Nothing is cached: once the call finishes the key is
+free and the next caller starts a new one.
+
+A waiter that gives up (its timeout passes) only stops waiting; the shared
+call carries on for the leader and the other waiters.
+"""
+import copy
+import hashlib
+import threading
+import time
+import concurrent.futures
+from typing import Any, Callable, Dict, Optional
+
+from tracing import span
+
+
+class FlightTimeout(Exception):
+    """A waiter's timeout passed before the shared call finished."""
+    pass
+
+
+def flight_key(*parts) -> str:
+    """Case- and whitespace-insensitive key; long parts (prompts, images) are hashed."""
+    normalized = "\x1f".join(" ".join(str(part).lower().split()) for part in parts)
+    if len(normalized) <= 200:
+        return normalized
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        # Stats
+        self.calls = 0
+        self.executed = 0
+        self.suppressed = 0
+        self.errors = 0
+        self.waiter_timeouts = 0
+
+    def do(self, key: str, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Runs fn(*args) unless a call with the same key is already in flight,
+        in which case it waits up to `timeout` seconds for that call instead.
+        Waiters get a deep copy so they can't mutate each other's results.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+                self.executed += 1
+            else:
+                self.suppressed += 1
+
+        if not leader:
+            try:
+                with span(f"single_flight.wait:{self.name}"):
+                    return copy.deepcopy(future.result(timeout=timeout))
+            except concurrent.futures.TimeoutError:
+                with self._lock:
+                    self.waiter_timeouts += 1
+                raise FlightTimeout(f"{self.name}: gave up waiting for in-flight call after {timeout:.2f}s")
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            with self._lock:
+                self.errors += 1
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "upstream_calls": self.executed,
+                "suppressed": self.suppressed,
+                "suppressed_ratio": round(self.suppressed / self.calls, 3) if self.calls else 0,
+                "errors": self.errors,
+                "waiter_timeouts": self.waiter_timeouts,
+                "in_flight": len(self._calls),
+            }
+
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    """One shared SingleFlight per upstream, created on first use."""
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = SingleFlight(name)
+            _flights[name] = flight
+        return flight
+
+
+def single_flight_stats() -> dict:
+    with _flights_lock:
+        flights = list(_flights.values())
+    return {flight.name: flight.stats() for flight in flights}
+
+
+def timeout_until(deadline: Optional[float]) -> Optional[float]:
+    """Seconds from now until a time.monotonic() deadline, for use as a waiter timeout."""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
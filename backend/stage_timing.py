@@ -0,0 +1,54 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from tracing import span
+
+
+class StageTimings:
+    """
+    Wall-clock milliseconds per pipeline stage, plus the request total. A
+    stage entered more than once accumulates. Pass a metrics histogram to
+    have every stage observed into it when the request finishes.
+    """
+
+    def __init__(self, histogram=None):
+        self._started = time.perf_counter()
+        self._seconds: Dict[str, float] = {}
+        self.histogram = histogram
+
+    @property
+    def stages(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self._seconds.items()}
+
+    def _record(self, name: str, start: float):
+        self._seconds[name] = self._seconds.get(name, 0.0) + time.perf_counter() - start
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            self._record(name, start)
+
+    async def run(self, name: str, awaitable):
+        start = time.perf_counter()
+        try:
+            with span(name):
+                return await awaitable
+        finally:
+            self._record(name, start)
+
+    def as_dict(self) -> Dict[str, float]:
+        result = self.stages
+        result["total"] = round((time.perf_counter() - self._started) * 1000, 1)
+        return result
+
+    def observe(self):
+        """Records each stage once into the histogram."""
+        if self.histogram is None:
+            return
+        for name, seconds in list(self._seconds.items()):
+            self.histogram.observe(seconds, name)
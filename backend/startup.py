@@ -0,0 +1,78 @@
+"""
+Startup phases and readiness.
+
+Importing main only wires up the app; models, corpora and connections load
+in the background once the server is listening (see warm_start in main).
+Each phase's status and duration is kept here for /readyz and the startup log.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from fastapi.concurrency import run_in_threadpool
+
+# Phases that must succeed before /readyz reports ready
+READY_PHASES = [p.strip() for p in os.getenv("READY_PHASES", "model,warmup").split(",") if p.strip()]
+
+
+class StartupReport:
+    def __init__(self, required: List[str] = READY_PHASES):
+        self.required = required
+        self.phases: Dict[str, dict] = {}
+        self.started = time.perf_counter()
+        self.ready_at = None
+
+    def record_imports(self, started: float):
+        """Called by main once its imports are done; startup time is counted from `started`."""
+        self.started = started
+        self.record("imports", started)
+
+    def record(self, name: str, started: float, error: Exception = None):
+        self.phases[name] = {
+            "status": "failed" if error else "done",
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        if error:
+            self.phases[name]["error"] = str(error)
+            print(f"Startup phase '{name}' failed: {error}")
+
+    async def run(self, name: str, fn: Callable, *args):
+        """Runs a blocking phase in the threadpool; failures are recorded, not raised."""
+        return await self.run_async(name, run_in_threadpool(fn, *args))
+
+    async def run_async(self, name: str, awaitable: Awaitable):
+        self.phases[name] = {"status": "running"}
+        started = time.perf_counter()
+        try:
+            result = await awaitable
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.record(name, started, e)
+            return None
+        self.record(name, started)
+        return result
+
+    @property
+    def ready(self) -> bool:
+        return all(self.phases.get(name, {}).get("status") == "done" for name in self.required)
+
+    def finish(self):
+        if self.ready:
+            self.ready_at = time.perf_counter()
+        timings = ", ".join(f"{name} {phase.get('ms', '-')}ms" for name, phase in self.phases.items())
+        state = f"ready after {self.ready_at - self.started:.1f}s" if self.ready_at else "NOT ready"
+        print(f"Startup: {timings}; {state}.")
+
+    def as_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "required": self.required,
+            "uptime_s": round(time.perf_counter() - self.started, 1),
+            "ready_after_s": round(self.ready_at - self.started, 2) if self.ready_at else None,
+            "phases": self.phases,
+        }
+
+
+startup_report = StartupReport()
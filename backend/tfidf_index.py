@@ -0,0 +1,77 @@
+"""
+Ingredient similarity over the TF-IDF matrix.
+
+Models written by optimize_model.py carry a 'tfidf_format' entry: rows are
+already L2-normalised (so cosine similarity is a plain sparse dot product),
+scores are float32 with int32 indices, and weights may be quantised to
+uint8. Older pickles are scored with sklearn's cosine_similarity as before.
+"""
+from typing import Optional
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+class TfidfIndex:
+    def __init__(self, vectorizer, matrix, tfidf_format: Optional[dict] = None):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.format = tfidf_format or {}
+        self.normalized = bool(self.format.get("normalized"))
+        # Quantised weights are stored as round(w / scale)
+        self.scale = float(self.format.get("scale", 1.0))
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def query_vector(self, text: str):
+        vector = self.vectorizer.transform([text])
+        return vector.astype(np.float32) if self.normalized else vector
+
+    def scores(self, text: str) -> np.ndarray:
+        """Cosine similarity of `text` against every recipe row."""
+        return self.vector_scores(self.query_vector(text))
+
+    def vector_scores(self, vector) -> np.ndarray:
+        """Same as scores(), for a vector from query_vector()."""
+        if not self.normalized:
+            return cosine_similarity(vector, self.matrix)[0]
+        # Both sides are unit length, so the dot product is the cosine
+        scores = self.matrix.dot(vector.T).toarray().ravel()
+        if self.scale != 1.0:
+            scores = scores * np.float32(self.scale)
+        return scores.astype(np.float32, copy=False)
+
+    def term_ids(self, words) -> list:
+        """
+        Matrix columns for the entries of `words` that are, as a whole, one
+        vocabulary term. Phrases ("soy sauce") are never split into their
+        words, which would match far more recipes than the phrase does.
+        """
+        vocabulary = self.vectorizer.vocabulary_
+        ids = set()
+        for word in words:
+            term = " ".join(str(word).lower().split())
+            if term in vocabulary:
+                ids.add(vocabulary[term])
+        return sorted(ids)
+
+    def rows_with_terms(self, term_ids) -> np.ndarray:
+        """Boolean mask of recipe rows containing any of the given matrix columns."""
+        return self.matrix[:, list(term_ids)].getnnz(axis=1) > 0
+
+    def nbytes(self) -> int:
+        m = self.matrix
+        return int(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes)
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.matrix.shape[0],
+            "terms": self.matrix.shape[1],
+            "nnz": int(self.matrix.nnz),
+            "dtype": str(self.matrix.data.dtype),
+            "index_dtype": str(self.matrix.indices.dtype),
+            "normalized": self.normalized,
+            "bytes": self.nbytes(),
+        }
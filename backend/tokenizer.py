@@ -0,0 +1,122 @@
+"""
+NLTK tokenising, loaded on first use instead of at import.
+
+The corpora are read from NLTK_DATA_DIR (backend/nltk_data by default),
+which is filled once at build time:
+
+    python tokenizer.py
+
+The server never downloads at startup unless NLTK_DOWNLOAD=1. Without the
+data, tokenising falls back to whitespace/punctuation splitting and
+scikit-learn's English stopword list; fallbacks() names the ones in use
+and /readyz reports them.
+"""
+import os
+import re
+import threading
+from typing import FrozenSet, List
+
+NLTK_DATA_DIR = os.getenv("NLTK_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data"))
+NLTK_DOWNLOAD = os.getenv("NLTK_DOWNLOAD", "0") == "1"
+# (resource path, package) pairs; newer NLTK tokenizers read punkt_tab, older ones punkt
+NLTK_RESOURCES = [
+    ("tokenizers/punkt", "punkt"),
+    ("tokenizers/punkt_tab", "punkt_tab"),
+    ("corpora/stopwords", "stopwords"),
+]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+_lock = threading.Lock()
+_nltk = None
+_stopwords: FrozenSet[str] = frozenset()
+_has_punkt = False
+# Fallbacks that have actually been used since load
+_fallbacks_used = set()
+
+
+def _missing(nltk) -> List[str]:
+    missing = []
+    for path, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(package)
+    return missing
+
+
+def load() -> dict:
+    """Imports NLTK and reads the stopword list; safe to call more than once."""
+    global _nltk, _stopwords, _has_punkt
+    with _lock:
+        if _nltk is not None:
+            return stats()
+        import nltk
+        if NLTK_DATA_DIR not in nltk.data.path:
+            nltk.data.path.insert(0, NLTK_DATA_DIR)
+
+        missing = _missing(nltk)
+        if missing and NLTK_DOWNLOAD:
+            for package in missing:
+                nltk.download(package, download_dir=NLTK_DATA_DIR, quiet=True)
+            missing = _missing(nltk)
+        if missing:
+            print(f"NLTK data missing from {NLTK_DATA_DIR}: {missing}. Run `python tokenizer.py`. Using fallbacks.")
+
+        if "stopwords" in missing:
+            from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+            _stopwords = frozenset(ENGLISH_STOP_WORDS)
+            _fallbacks_used.add("sklearn_stopwords")
+        else:
+            from nltk.corpus import stopwords
+            _stopwords = frozenset(stopwords.words('english'))
+        # Either one is enough; a LookupError at use time still drops to the regex fallback
+        _has_punkt = "punkt" not in missing or "punkt_tab" not in missing
+        _nltk = nltk
+        return stats()
+
+
+def english_stopwords() -> FrozenSet[str]:
+    if _nltk is None:
+        load()
+    return _stopwords
+
+
+def word_tokenize(text: str) -> List[str]:
+    if _nltk is None:
+        load()
+    if _has_punkt:
+        try:
+            return _nltk.word_tokenize(text)
+        except LookupError:
+            pass
+    _fallbacks_used.add("regex_words")
+    return re.findall(r"\w+|[^\w\s]", text)
+
+
+def sent_tokenize(text: str) -> List[str]:
+    if _nltk is None:
+        load()
+    if _has_punkt:
+        try:
+            return _nltk.sent_tokenize(text)
+        except LookupError:
+            pass
+    _fallbacks_used.add("regex_sentences")
+    return [s for s in _SENTENCE_END.split(text.strip()) if s]
+
+
+def fallbacks() -> List[str]:
+    return sorted(_fallbacks_used)
+
+
+def stats() -> dict:
+    return {"data_dir": NLTK_DATA_DIR, "punkt": _has_punkt, "stopwords": len(_stopwords), "fallbacks": fallbacks()}
+
+
+if __name__ == "__main__":
+    import nltk
+    os.makedirs(NLTK_DATA_DIR, exist_ok=True)
+    for _, package in NLTK_RESOURCES:
+        nltk.download(package, download_dir=NLTK_DATA_DIR)
+    print(f"NLTK data written to {NLTK_DATA_DIR}. Ship this directory with the backend.")
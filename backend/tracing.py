@@ -0,0 +1,374 @@
+"""
+Lightweight request tracing.
+
+The HTTP middleware in main opens a root span per request and makes it the
+current span (a contextvar). The root ends once the response body has been
+sent (traced_body), so streamed responses such as SSE chat and the admin
+export are timed to their last chunk. span() nests under whatever is current:
+run_in_threadpool and asyncio tasks carry the context along, the enrichment
+pool copies it per task, and process pools send remote_context() to
+run_remote() in the worker, whose spans are merged back with adopt().
+Outside a request span() is a no-op.
+
+A finished trace is exported when it was sampled (TRACE_SAMPLE_RATE, or an
+incoming traceparent with the sampled flag) or when the request took longer
+than TRACE_SLOW_MS. A background thread writes span trees as JSON lines
+(TRACE_EXPORTER=file, rotated at TRACE_FILE_MAX_BYTES) or posts OTLP/HTTP
+JSON to a collector (TRACE_EXPORTER=otlp). Tracing is off unless one of
+those is chosen (TRACE_EXPORTER=none, the default).
+
+Only the standard library is used, so process-pool workers can import it cheaply.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# The file is rotated to TRACE_FILE.1 .. TRACE_FILE.<backups> once it reaches this size
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# Fraction of requests exported regardless of latency
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Requests slower than this are always exported (0 turns tail sampling off)
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+TRACE_EXPORT_QUEUE = int(os.getenv("TRACE_EXPORT_QUEUE", "1000"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "ai-cooking-backend")
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return f"{random.getrandbits(n_bytes * 8):0{n_bytes * 2}x}"
+
+
+class Trace:
+    """Finished spans of one request, collected until the root span ends."""
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[dict] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span: dict):
+        with self._lock:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "_perf_ns", "duration_ns", "attributes", "status")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self._perf_ns = time.perf_counter_ns()
+        self.duration_ns = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def error(self, exc: BaseException):
+        self.status = "error"
+        self.attributes["error"] = f"{type(exc).__name__}: {exc}"[:300]
+
+    def end(self):
+        self.duration_ns = time.perf_counter_ns() - self._perf_ns
+        self.trace.add(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ns": self.duration_ns,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """Stands in for a span when nothing is being traced."""
+
+    def set(self, key, value):
+        pass
+
+    def error(self, exc):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child of the current span for the duration of the block; exceptions mark it failed."""
+    parent = _current.get()
+    if parent is None:
+        yield NULL_SPAN
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current.get()
+    return current.trace.trace_id if current is not None else None
+
+
+# --- Request roots ---
+
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes) -> Tuple[Optional[Span], Any]:
+    """
+    Opens a root span and makes it current. Continues the caller's trace when
+    a valid W3C traceparent header is given. Returns (root, token) for end_trace.
+    """
+    if TRACE_EXPORTER == "none":
+        return None, None
+    match = TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+    if match:
+        trace = Trace(match.group(1), sampled=bool(int(match.group(3), 16) & 1))
+        parent_id = match.group(2)
+    else:
+        trace = Trace(_new_id(16), sampled=random.random() < TRACE_SAMPLE_RATE)
+        parent_id = None
+    root = Span(trace, name, parent_id, attributes)
+    return root, _current.set(root)
+
+
+def detach(token):
+    """Stops the root being current in this context; the span itself stays open."""
+    if token is not None:
+        _current.reset(token)
+
+
+def end_trace(root: Optional[Span], token):
+    detach(token)
+    finish_trace(root)
+
+
+async def traced_body(body_iterator, root: Span):
+    """Passes a response body through and ends `root` after the last chunk (or when sending fails)."""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    except Exception as e:
+        root.error(e)
+        raise
+    finally:
+        finish_trace(root)
+
+
+def finish_trace(root: Optional[Span]):
+    if root is None or root.duration_ns is not None:
+        return
+    root.end()
+    duration_ms = root.duration_ns / 1e6
+    slow = TRACE_SLOW_MS > 0 and duration_ms >= TRACE_SLOW_MS
+    if root.trace.sampled or slow:
+        if slow:
+            print(f"Slow request {root.name} took {duration_ms:.0f}ms; trace {root.trace.trace_id} exported.")
+        exporter.submit(root.trace)
+
+
+# --- Process pools ---
+
+def remote_context() -> Optional[Tuple[str, str]]:
+    """(trace_id, parent span_id) to hand to run_remote in another process."""
+    current = _current.get()
+    if current is None:
+        return None
+    return current.trace.trace_id, current.span_id
+
+
+def run_remote(context: Optional[Tuple[str, str]], name: str, fn, *args):
+    """Worker side: runs fn(*args) in a span under `context`; returns (result, finished spans)."""
+    if context is None:
+        return fn(*args), []
+    trace = Trace(context[0], sampled=True)
+    remote = Span(trace, name, context[1], {"process.pid": os.getpid()})
+    token = _current.set(remote)
+    try:
+        result = fn(*args)
+    except BaseException as e:
+        remote.error(e)
+        raise
+    finally:
+        _current.reset(token)
+        remote.end()
+    return result, trace.spans
+
+
+def adopt(spans: List[dict]):
+    """Adds spans finished in another process to the current trace."""
+    current = _current.get()
+    if current is None:
+        return
+    for finished in spans:
+        current.trace.add(finished)
+
+
+# --- Export ---
+
+def span_tree(trace: Trace) -> dict:
+    """Nests the trace's spans under their parents; the root is the span whose parent isn't in the trace."""
+    nodes = {s["span_id"]: dict(s, duration_ms=round(s["duration_ns"] / 1e6, 3), children=[]) for s in trace.spans}
+    roots = []
+    for node in sorted(nodes.values(), key=lambda n: n["start_ns"]):
+        parent = nodes.get(node["parent_id"])
+        (parent["children"] if parent is not None else roots).append(node)
+    for node in nodes.values():
+        del node["duration_ns"]
+    return {
+        "trace_id": trace.trace_id,
+        "sampled": trace.sampled,
+        "dropped_spans": trace.dropped,
+        "spans": roots,
+    }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(traces: List[Trace]) -> dict:
+    spans = []
+    for trace in traces:
+        for s in trace.spans:
+            otlp_span = {
+                "traceId": trace.trace_id,
+                "spanId": s["span_id"],
+                "name": s["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(s["start_ns"]),
+                "endTimeUnixNano": str(s["start_ns"] + s["duration_ns"]),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+                "status": {"code": 2 if s["status"] == "error" else 1},
+            }
+            if s["parent_id"]:
+                otlp_span["parentSpanId"] = s["parent_id"]
+            spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+    }]}
+
+
+class TraceExporter:
+    """Writes kept traces from a background thread so requests never wait on I/O."""
+
+    def __init__(self, kind: str = TRACE_EXPORTER, path: str = TRACE_FILE, endpoint: str = TRACE_OTLP_ENDPOINT):
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=TRACE_EXPORT_QUEUE)
+        self._worker = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, trace: Trace):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._worker.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _rotate(self):
+        if TRACE_FILE_MAX_BYTES <= 0:
+            return
+        try:
+            if os.path.getsize(self.path) < TRACE_FILE_MAX_BYTES:
+                return
+        except OSError:
+            return
+        if TRACE_FILE_BACKUPS <= 0:
+            os.remove(self.path)
+            return
+        for n in range(TRACE_FILE_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _drain(self) -> List[Trace]:
+        batch = [self._queue.get()]
+        while len(batch) < 100:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drain()
+            try:
+                if self.kind == "otlp":
+                    self._post(batch)
+                else:
+                    self._rotate()
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        for trace in batch:
+                            f.write(json.dumps(span_tree(trace), default=str) + "\n")
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"Trace export failed ({self.kind}): {e}")
+
+    def _post(self, batch: List[Trace]):
+        body = json.dumps(otlp_payload(batch), default=str).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    def stats(self) -> dict:
+        return {
+            "exporter": self.kind,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+        }
+
+
+exporter = TraceExporter()
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from deep_translator import GoogleTranslator
+
+from database import get_translation_cache_collection
+from metrics import track_dependency
+from retry import execute_with_retry
+from single_flight import get_flight
+
+TRANSLATION_TTL_SECONDS = int(os.getenv("TRANSLATION_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+MEMORY_CACHE_SIZE = int(os.getenv("TRANSLATION_MEMORY_CACHE_SIZE", "5000"))
+# After a Mongo failure the persistent tier is skipped for this long
+MONGO_RETRY_SECONDS = float(os.getenv("TRANSLATION_CACHE_RETRY_SECONDS", "30"))
+# Google rejects payloads above 5000 characters
+MAX_BATCH_CHARS = 4500
+# Lines survive Google translation intact, so misses are joined one per line
+BATCH_SEPARATOR = "\n"
+
+
+def cache_key(text: str, target_lang: str) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{target_lang}:{digest}"
+
+
+class TranslationCache:
+    """
+    Two-level (text hash, target_lang) -> translation cache: a bounded
+    in-memory LRU in front of the Mongo 'translation_cache' collection,
+    whose TTL index expires stale entries. While Mongo is failing the
+    persistent tier is skipped for MONGO_RETRY_SECONDS at a time, so an
+    outage costs one server-selection timeout instead of one per call.
+    """
+
+    def __init__(self, ttl_seconds: int = TRANSLATION_TTL_SECONDS, memory_size: int = MEMORY_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_ready = False
+        self._mongo_down_until = 0.0
+
+    def _mongo_failed(self, what: str, error: Exception):
+        self._mongo_down_until = time.monotonic() + MONGO_RETRY_SECONDS
+        print(f"Translation cache {what} failed: {error}. Using the in-memory cache for {MONGO_RETRY_SECONDS:.0f}s.")
+
+    def _collection(self):
+        if time.monotonic() < self._mongo_down_until:
+            return None
+        collection = get_translation_cache_collection()
+        if collection is not None and not self._index_ready:
+            try:
+                collection.create_index("expires_at", expireAfterSeconds=0)
+                self._index_ready = True
+            except Exception as e:
+                self._mongo_failed("TTL index creation", e)
+                return None
+        return collection
+
+    def _remember(self, key: str, translated: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (translated, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is None:
+                    continue
+                if entry[1] < now:
+                    del self._memory[key]
+                    continue
+                self._memory.move_to_end(key)
+                found[key] = entry[0]
+
+        missing = [key for key in keys if key not in found]
+        collection = self._collection() if missing else None
+        if collection is not None:
+            try:
+                with track_dependency("mongo", "translation_cache.find"):
+                    docs = list(collection.find(
+                        {"_id": {"$in": missing}, "expires_at": {"$gt": datetime.utcnow()}},
+                        {"translated_text": 1, "expires_at": 1}
+                    ))
+                for doc in docs:
+                    found[doc["_id"]] = doc["translated_text"]
+                    expires_at = doc["expires_at"].timestamp() if hasattr(doc["expires_at"], "timestamp") else now + self.ttl_seconds
+                    self._remember(doc["_id"], doc["translated_text"], expires_at)
+            except Exception as e:
+                self._mongo_failed("lookup", e)
+        return found
+
+    def put_many(self, entries: Dict[str, str]):
+        if not entries:
+            return
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        for key, translated in entries.items():
+            self._remember(key, translated, time.time() + self.ttl_seconds)
+
+        collection = self._collection()
+        if collection is None:
+            return
+        try:
+            from pymongo import UpdateOne
+            with track_dependency("mongo", "translation_cache.write"):
+                collection.bulk_write([
+                    UpdateOne({"_id": key}, {"$set": {"translated_text": translated, "expires_at": expires_at}}, upsert=True)
+                    for key, translated in entries.items()
+                ], ordered=False)
+        except Exception as e:
+            self._mongo_failed("write", e)
+
+
+translation_cache = TranslationCache()
+
+_translators = threading.local()
+
+
+def get_translator(target_lang: str) -> GoogleTranslator:
+    """
+    The calling thread's translator for target_lang. translate() stores the
+    request text on the instance, so threads never share one.
+    """
+    # GoogleTranslator validates languages on construction, so reuse one per thread and target
+    translators = getattr(_translators, "by_lang", None)
+    if translators is None:
+        translators = _translators.by_lang = {}
+    translator = translators.get(target_lang)
+    if translator is None:
+        translator = translators[target_lang] = GoogleTranslator(source='auto', target=target_lang)
+    return translator
+
+
+# Requests translating the same text at the same time share one upstream call
+translation_flight = get_flight("translation")
+
+
+def _translate_shared(translator: GoogleTranslator, text: str, target_lang: str) -> Optional[str]:
+    def _translate():
+        with track_dependency("translator", target_lang):
+            return translator.translate(text)
+
+    def _translate_with_retry():
+        return execute_with_retry(_translate, retries=3, delay=1)
+
+    return translation_flight.do(cache_key(text, target_lang), _translate_with_retry)
+
+
+def _chunk_for_upstream(texts: List[str]) -> List[List[str]]:
+    chunks, current, size = [], [], 0
+    for text in texts:
+        if current and size + len(text) + len(BATCH_SEPARATOR) > MAX_BATCH_CHARS:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += len(text) + len(BATCH_SEPARATOR)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _translate_upstream(texts: List[str], target_lang: str) -> List[Optional[str]]:
+    """Translates texts with one upstream request per ~4.5k characters."""
+    translator = get_translator(target_lang)
+    results: List[Optional[str]] = []
+    for chunk in _chunk_for_upstream(texts):
+        translated = _translate_shared(translator, BATCH_SEPARATOR.join(chunk), target_lang)
+        if translated is None:
+            # Retries are exhausted; calling again per item would only multiply the failures
+            print(f"Batched translation of {len(chunk)} texts failed. Leaving them untranslated.")
+            results.extend([None] * len(chunk))
+            continue
+        parts = translated.split(BATCH_SEPARATOR)
+        if len(parts) == len(chunk):
+            results.extend(part.strip() for part in parts)
+            continue
+
+        # The separator did not survive; translate this chunk item by item
+        print(f"Batched translation returned {len(parts)} parts for {len(chunk)} texts. Falling back per item.")
+        for text in chunk:
+            results.append(_translate_shared(translator, text, target_lang))
+    return results
+
+
+def translate_texts(texts: List[str], target_lang: str) -> Tuple[List[str], int]:
+    """
+    Returns (translations in input order, number served from cache). Failed
+    translations fall back to the original text and are not cached.
+    """
+    # Newlines are the batch separator, so keep each text on one line
+    normalized = [" ".join(str(text).split()) for text in texts]
+    keys = [cache_key(text, target_lang) for text in normalized]
+    cached = translation_cache.get_many(list(dict.fromkeys(keys)))
+
+    misses = list(dict.fromkeys(text for text, key in zip(normalized, keys) if key not in cached and text))
+    fresh = {}
+    if misses:
+        for text, translated in zip(misses, _translate_upstream(misses, target_lang)):
+            if translated:
+                fresh[cache_key(text, target_lang)] = translated
+        translation_cache.put_many(fresh)
+
+    results = []
+    for text, key in zip(normalized, keys):
+        results.append(cached.get(key) or fresh.get(key) or text)
+    hits = sum(1 for key in keys if key in cached)
+    return results, hits
+
+
+def translate_text(text: str, target_lang: str) -> str:
+    translations, _ = translate_texts([text], target_lang)
+    return translations[0]
@@ -0,0 +1,134 @@
+import base64
+import io
+import math
+import os
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Longest side after reduction; VLMs downscale anyway and YOLO runs at 640
+MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", "1536"))
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "8"))
+JPEG_QUALITY = int(os.getenv("UPLOAD_JPEG_QUALITY", "85"))
+CHUNK_SIZE = 64 * 1024
+
+# Magic numbers for the formats we accept; checked on the first chunk
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+
+# Checked per upload from the header, before any pixels are decoded
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    return None
+
+
+class PreparedImage:
+    """
+    A size-reduced, metadata-free JPEG ready for local inference or a VLM
+    payload. The base64 data URL is only built when first requested, so
+    requests answered locally never pay for it.
+    """
+
+    def __init__(self, jpeg_bytes: bytes, width: int, height: int, source_type: str, source_bytes: int):
+        self.jpeg_bytes = jpeg_bytes
+        self.width = width
+        self.height = height
+        self.content_type = "image/jpeg"
+        self.source_type = source_type
+        self.source_bytes = source_bytes
+        self._data_url = None
+
+    @property
+    def data_url(self) -> str:
+        if self._data_url is None:
+            self._data_url = "data:image/jpeg;base64," + base64.b64encode(self.jpeg_bytes).decode("ascii")
+        return self._data_url
+
+
+async def read_upload_bounded(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Streams through an upload in chunks, rejecting non-images on the first
+    chunk and anything over max_bytes as soon as the limit is crossed.
+    Chunks are not kept: Starlette already spools uploads over 1 MB to a
+    temp file, so the file is rewound and decoded from there.
+    Returns (size in bytes, sniffed content type).
+    """
+    size = 0
+    sniffed = None
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if sniffed is None:
+            sniffed = sniff_image_type(chunk)
+            if sniffed is None:
+                raise HTTPException(status_code=415, detail="Unsupported image format")
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes // (1024 * 1024)} MB limit")
+
+    if sniffed is None:
+        raise HTTPException(status_code=400, detail="Empty image upload")
+    await file.seek(0)
+    return size, sniffed
+
+
+def _reduce_image(source: BinaryIO, max_dimension: int):
+    try:
+        image = Image.open(source)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+    # PIL's own bomb check is process-wide state; this limit only applies here
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        image.close()
+        raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_IMAGE_PIXELS // 1_000_000} MP limit")
+
+    try:
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, so a 12 MP photo
+        # never materialises at full resolution. draft() picks the scale from
+        # the tighter axis, so ask for the aspect-correct target size. Other
+        # formats decode at full size, bounded by the pixel check above.
+        ratio = min(1.0, max_dimension / max(image.width, image.height))
+        image.draft("RGB", (math.ceil(image.width * ratio), math.ceil(image.height * ratio)))
+        image = image.convert("RGB")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+
+    image.thumbnail((max_dimension, max_dimension))
+
+    output = io.BytesIO()
+    # Saving without 'exif' strips metadata (privacy) as a side effect
+    image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    width, height = image.size
+    image.close()
+    return output.getvalue(), width, height
+
+
+async def prepare_image(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES,
+                        max_dimension: int = MAX_IMAGE_DIMENSION) -> PreparedImage:
+    """Bounded scan -> sniff -> pixel check -> reduced decode -> metadata-free JPEG."""
+    if file.content_type and not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Only image files are allowed")
+
+    source_bytes, sniffed = await read_upload_bounded(file, max_bytes)
+    jpeg_bytes, width, height = await run_in_threadpool(_reduce_image, file.file, max_dimension)
+    prepared = PreparedImage(jpeg_bytes, width, height, sniffed, source_bytes)
+    print(f"Prepared upload: {source_bytes // 1024}KB {sniffed} -> {len(jpeg_bytes) // 1024}KB {width}x{height} JPEG")
+    return prepared
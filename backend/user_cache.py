@@ -0,0 +1,102 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "20000"))
+# Upper bound for a verified token; entries never outlive the token's own exp
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire individually."""
+
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]):
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# token -> (email, exp), expiring with the token itself or after TOKEN_CACHE_TTL_SECONDS
+token_claims_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS)
+# email -> UserInDB (without interactions)
+user_profile_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+# Mongo _id -> email, so change events (which carry only _id) can invalidate by email
+_ids_to_email = TTLCache(USER_CACHE_SIZE)
+
+
+def remember_user_id(user_id, email: str):
+    _ids_to_email.set(user_id, email)
+
+
+def invalidate_user(email: str):
+    user_profile_cache.pop(email)
+
+
+async def watch_user_changes(repository):
+    """
+    Invalidates cached users on writes made by any worker. Needs a replica set;
+    on a standalone mongod the TTL alone bounds staleness.
+    """
+    while True:
+        try:
+            async for user_id in repository.watch_user_changes():
+                email = _ids_to_email.get(user_id)
+                if email:
+                    invalidate_user(email)
+            return  # Backend without change streams
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if "replica set" in str(e).lower() or getattr(e, "code", None) == 40573:
+                print("Change streams unavailable (standalone MongoDB). User cache relies on TTL.")
+                return
+            print(f"User cache change stream error: {e}. Reconnecting in 5s.")
+            await asyncio.sleep(5)
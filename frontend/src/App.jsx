@@ -133,9 +133,10 @@ function AppContent() {
 
   // Derived state
   const likedRecipes = React.useMemo(() => {
-    if (!userProfile?.interactions) return [];
-    const likes = new Set();
-    userProfile.interactions.forEach(i => {
+    if (!userProfile) return [];
+    // Server keeps the liked set; replaying the recent page on top of it is idempotent
+    const likes = new Set(userProfile.liked_recipes || []);
+    (userProfile.interactions || []).forEach(i => {
         if (i.action === 'like') likes.add(i.recipe_name);
         else if (i.action === 'unlike') likes.delete(i.recipe_name);
     });
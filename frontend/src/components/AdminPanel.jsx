@@ -5,19 +5,27 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8010
 
 const AdminPanel = ({ token, onClose }) => {
     const [users, setUsers] = useState([]);
+    const [summary, setSummary] = useState({ total_users: 0, total_interactions: 0, total_likes: 0 });
+    const [nextCursor, setNextCursor] = useState(null);
+    const [sort, setSort] = useState('email');
+    const [order, setOrder] = useState('asc');
+    const [search, setSearch] = useState('');
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
 
     useEffect(() => {
-        fetchUsers();
-    }, []);
+        fetchUsers(null);
+    }, [sort, order, search]);
 
-    const fetchUsers = async () => {
+    const fetchUsers = async (cursor) => {
         try {
             const res = await axios.get(`${API_BASE_URL}/admin/users`, {
-                headers: { Authorization: `Bearer ${token}` }
+                headers: { Authorization: `Bearer ${token}` },
+                params: { sort, order, search: search || undefined, cursor: cursor || undefined }
             });
-            setUsers(res.data);
+            setUsers(prev => cursor ? [...prev, ...res.data.users] : res.data.users);
+            setNextCursor(res.data.next_cursor);
+            setSummary(res.data.summary);
             setLoading(false);
         } catch (err) {
             console.error("Failed to fetch users", err);
@@ -26,11 +34,37 @@ const AdminPanel = ({ token, onClose }) => {
         }
     };
 
+    const toggleSort = (key) => {
+        if (sort === key) {
+            setOrder(order === 'asc' ? 'desc' : 'asc');
+        } else {
+            setSort(key);
+            setOrder(key === 'email' ? 'asc' : 'desc');
+        }
+    };
+
+    const exportUsers = async (format) => {
+        try {
+            const res = await axios.get(`${API_BASE_URL}/admin/users/export`, {
+                headers: { Authorization: `Bearer ${token}` },
+                params: { format, search: search || undefined },
+                responseType: 'blob'
+            });
+            const url = URL.createObjectURL(res.data);
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = `users.${format}`;
+            link.click();
+            URL.revokeObjectURL(url);
+        } catch (err) {
+            console.error("Export failed", err);
+        }
+    };
+
     if (loading) return <div className="loading">Loading Admin Panel...</div>;
     if (error) return <div className="error">{error}</div>;
 
-    const totalInteractions = users.reduce((acc, user) => acc + user.total_interactions, 0);
-    const totalLikes = users.reduce((acc, user) => acc + user.total_likes, 0);
+    const sortLabel = (key, label) => sort === key ? `${label} ${order === 'asc' ? '▲' : '▼'}` : label;
 
     return (
         <div style={{ padding: '2rem', background: 'white', borderRadius: '16px', boxShadow: '0 4px 20px rgba(0,0,0,0.05)' }}>
@@ -42,29 +76,43 @@ const AdminPanel = ({ token, onClose }) => {
             {/* Stats Cards */}
             <div className="grid" style={{ marginBottom: '2rem', gridTemplateColumns: 'repeat(auto-fit, minmax(200px, 1fr))' }}>
                 <div className="card" style={{ padding: '1.5rem', textAlign: 'center' }}>
-                    <h3 style={{ fontSize: '2rem', margin: '0 0 0.5rem 0', color: 'var(--primary)' }}>{users.length}</h3>
+                    <h3 style={{ fontSize: '2rem', margin: '0 0 0.5rem 0', color: 'var(--primary)' }}>{summary.total_users}</h3>
                     <div style={{ color: 'var(--text-muted)' }}>Total Users</div>
                 </div>
                 <div className="card" style={{ padding: '1.5rem', textAlign: 'center' }}>
-                    <h3 style={{ fontSize: '2rem', margin: '0 0 0.5rem 0', color: 'var(--secondary)' }}>{totalInteractions}</h3>
+                    <h3 style={{ fontSize: '2rem', margin: '0 0 0.5rem 0', color: 'var(--secondary)' }}>{summary.total_interactions}</h3>
                     <div style={{ color: 'var(--text-muted)' }}>Total Interactions</div>
                 </div>
                 <div className="card" style={{ padding: '1.5rem', textAlign: 'center' }}>
-                    <h3 style={{ fontSize: '2rem', margin: '0 0 0.5rem 0', color: '#10b981' }}>{totalLikes}</h3>
+                    <h3 style={{ fontSize: '2rem', margin: '0 0 0.5rem 0', color: '#10b981' }}>{summary.total_likes}</h3>
                     <div style={{ color: 'var(--text-muted)' }}>Total Likes</div>
                 </div>
             </div>
 
+            {/* Search & Export */}
+            <div style={{ display: 'flex', gap: '1rem', marginBottom: '1rem', flexWrap: 'wrap' }}>
+                <input
+                    type="text"
+                    placeholder="Search by email..."
+                    value={search}
+                    onChange={(e) => setSearch(e.target.value)}
+                    style={{ flex: 1, minWidth: '200px', padding: '0.5rem 1rem' }}
+                />
+                <button onClick={() => exportUsers('csv')} className="btn-outline" style={{ padding: '0.5rem 1rem' }}>Export CSV</button>
+                <button onClick={() => exportUsers('ndjson')} className="btn-outline" style={{ padding: '0.5rem 1rem' }}>Export NDJSON</button>
+            </div>
+
             {/* Users Table */}
             <div style={{ overflowX: 'auto' }}>
                 <table style={{ width: '100%', borderCollapse: 'collapse' }}>
                     <thead>
                         <tr style={{ borderBottom: '2px solid var(--border)', textAlign: 'left' }}>
                             <th style={{ padding: '1rem' }}>ID</th>
-                            <th style={{ padding: '1rem' }}>Email</th>
+                            <th style={{ padding: '1rem', cursor: 'pointer' }} onClick={() => toggleSort('email')}>{sortLabel('email', 'Email')}</th>
                             <th style={{ padding: '1rem' }}>Role</th>
-                            <th style={{ padding: '1rem' }}>Interactions</th>
-                            <th style={{ padding: '1rem' }}>Likes</th>
+                            <th style={{ padding: '1rem', cursor: 'pointer' }} onClick={() => toggleSort('joined')}>{sortLabel('joined', 'Joined')}</th>
+                            <th style={{ padding: '1rem', cursor: 'pointer' }} onClick={() => toggleSort('interactions')}>{sortLabel('interactions', 'Interactions')}</th>
+                            <th style={{ padding: '1rem', cursor: 'pointer' }} onClick={() => toggleSort('likes')}>{sortLabel('likes', 'Likes')}</th>
                         </tr>
                     </thead>
                     <tbody>
@@ -79,12 +127,18 @@ const AdminPanel = ({ token, onClose }) => {
                                         <span className="badge" style={{ background: '#e0e7ff', color: '#4f46e5', borderColor: '#c7d2fe' }}>User</span>
                                     )}
                                 </td>
+                                <td style={{ padding: '1rem' }}>{user.joined_at || '-'}</td>
                                 <td style={{ padding: '1rem' }}>{user.total_interactions}</td>
                                 <td style={{ padding: '1rem' }}>{user.total_likes}</td>
                             </tr>
                         ))}
                     </tbody>
                 </table>
+                {nextCursor && (
+                    <div style={{ textAlign: 'center', marginTop: '1rem' }}>
+                        <button onClick={() => fetchUsers(nextCursor)} className="btn-outline" style={{ padding: '0.5rem 1rem' }}>Load more</button>
+                    </div>
+                )}
             </div>
         </div>
     );